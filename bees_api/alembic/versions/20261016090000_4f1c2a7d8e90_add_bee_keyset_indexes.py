@@ -0,0 +1,28 @@
+"""Add bee keyset pagination indexes
+
+Revision ID: 4f1c2a7d8e90
+Revises: 9358abb6c321
+Create Date: 2026-10-16 09:00:00.000000+00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4f1c2a7d8e90'
+down_revision = '9358abb6c321'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_bee_captured_date_id', 'bee', ['captured_date', 'id'], unique=False)
+    op.create_index('ix_bee_species_captured_date_id', 'bee', ['species', 'captured_date', 'id'], unique=False)
+    op.create_index('ix_bee_origin_captured_date_id', 'bee', ['origin', 'captured_date', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_bee_origin_captured_date_id', table_name='bee')
+    op.drop_index('ix_bee_species_captured_date_id', table_name='bee')
+    op.drop_index('ix_bee_captured_date_id', table_name='bee')
@@ -0,0 +1,25 @@
+"""Add bee image_path index
+
+Revision ID: 8b3e5d1f2a64
+Revises: 4f1c2a7d8e90
+Create Date: 2026-10-16 10:00:00.000000+00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b3e5d1f2a64'
+down_revision = '4f1c2a7d8e90'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Images are content addressed and shared, so deletes count references
+    op.create_index(op.f('ix_bee_image_path'), 'bee', ['image_path'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_bee_image_path'), table_name='bee')
@@ -0,0 +1,42 @@
+"""Add bee search indexes
+
+Revision ID: c71d9e4a5b20
+Revises: 8b3e5d1f2a64
+Create Date: 2026-10-16 11:00:00.000000+00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c71d9e4a5b20'
+down_revision = '8b3e5d1f2a64'
+branch_labels = None
+depends_on = None
+
+# Must match crud.SEARCH_DOCUMENT exactly for the planner to use the indexes
+SEARCH_DOCUMENT = "name || ' ' || species || ' ' || origin"
+
+
+def upgrade() -> None:
+    # searchBees: full-text prefix matching and trigram fuzzy matching over
+    # name, species and origin. Other databases fall back to LIKE scans
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.execute(
+        "CREATE INDEX ix_bee_search_vector ON bee "
+        f"USING gin (to_tsvector('simple'::regconfig, {SEARCH_DOCUMENT}))"
+    )
+    op.execute(
+        "CREATE INDEX ix_bee_search_trgm ON bee "
+        f"USING gin (({SEARCH_DOCUMENT}) gin_trgm_ops)"
+    )
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.drop_index('ix_bee_search_trgm', table_name='bee')
+    op.drop_index('ix_bee_search_vector', table_name='bee')
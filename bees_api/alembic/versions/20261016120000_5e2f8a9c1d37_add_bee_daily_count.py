@@ -0,0 +1,37 @@
+"""Add bee_daily_count summary table
+
+Revision ID: 5e2f8a9c1d37
+Revises: c71d9e4a5b20
+Create Date: 2026-10-16 12:00:00.000000+00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e2f8a9c1d37'
+down_revision = 'c71d9e4a5b20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Per species, origin and day counts backing beeStats; kept up to date by
+    # the application from here on
+    op.create_table('bee_daily_count',
+    sa.Column('species', sa.String(), nullable=False),
+    sa.Column('origin', sa.String(), nullable=False),
+    sa.Column('captured_date', sa.Date(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('species', 'origin', 'captured_date')
+    )
+    op.execute(
+        'INSERT INTO bee_daily_count (species, origin, captured_date, count) '
+        'SELECT species, origin, captured_date, count(*) FROM bee '
+        'GROUP BY species, origin, captured_date'
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('bee_daily_count')
@@ -0,0 +1,40 @@
+"""Add bee.image_status and the job table
+
+Revision ID: a3d6f0b8e215
+Revises: 5e2f8a9c1d37
+Create Date: 2026-10-17 09:00:00.000000+00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3d6f0b8e215'
+down_revision = '5e2f8a9c1d37'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('bee', sa.Column('image_status', sa.String(), nullable=True))
+    # Images stored before background processing existed are served as is
+    op.execute("UPDATE bee SET image_status = 'ready' WHERE image_path IS NOT NULL")
+
+    op.create_table('job',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(), nullable=False),
+    sa.Column('payload', sa.Text(), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('run_at', sa.DateTime(), nullable=False),
+    sa.Column('failed', sa.Boolean(), nullable=False),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_job_failed_run_at', 'job', ['failed', 'run_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_job_failed_run_at', table_name='job')
+    op.drop_table('job')
+    op.drop_column('bee', 'image_status')
@@ -0,0 +1,26 @@
+"""Add bee.image_phash
+
+Revision ID: e48b2c7f9a03
+Revises: a3d6f0b8e215
+Create Date: 2026-10-17 10:00:00.000000+00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e48b2c7f9a03'
+down_revision = 'a3d6f0b8e215'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Searched through an in-memory index, so no database index is needed;
+    # fill it for existing images with "python -m app.cli hash-images"
+    op.add_column('bee', sa.Column('image_phash', sa.String(length=16), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('bee', 'image_phash')
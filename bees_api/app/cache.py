@@ -0,0 +1,201 @@
+import hashlib
+import json
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import date
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from app.core.config import settings
+
+# Version counter names: the bee list as a whole, and individual bees
+BEES_LIST = "bees"
+
+
+def bee_entity(bee_id: int) -> str:
+    return f"bee:{bee_id}"
+
+
+def _encode(value: Any) -> bytes:
+    def default(obj: Any) -> Any:
+        if isinstance(obj, date):
+            return {"$date": obj.isoformat()}
+        raise TypeError(f"Cannot cache {type(obj).__name__}")
+    return json.dumps(value, default=default).encode()
+
+
+def _decode(data: bytes) -> Any:
+    def object_hook(obj: Dict[str, Any]) -> Any:
+        if obj.keys() == {"$date"}:
+            return date.fromisoformat(obj["$date"])
+        return obj
+    return json.loads(data, object_hook=object_hook)
+
+
+class CacheBackend(ABC):
+    """Shared cache tier, e.g. Redis, visible to every worker."""
+
+    @abstractmethod
+    async def get_many(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        ...
+
+    @abstractmethod
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        ...
+
+    @abstractmethod
+    async def incr(self, key: str) -> int:
+        ...
+
+
+class InMemoryCacheBackend(CacheBackend):
+    """Process-local stand-in for a shared backend, used in tests."""
+
+    def __init__(self):
+        self._values: Dict[str, Tuple[Optional[float], bytes]] = {}
+
+    async def get_many(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        now = time.monotonic()
+        values = []
+        for key in keys:
+            expires_at, value = self._values.get(key, (None, None))
+            values.append(None if expires_at is not None and expires_at <= now else value)
+        return values
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        self._values[key] = (time.monotonic() + ttl, value)
+
+    async def incr(self, key: str) -> int:
+        _, value = self._values.get(key, (None, b"0"))
+        value = str(int(value) + 1).encode()
+        self._values[key] = (None, value)
+        return int(value)
+
+
+class RedisCacheBackend(CacheBackend):
+    def __init__(self, url: str):
+        # Optional dependency, only needed when a Redis URL is configured
+        from redis import asyncio as redis
+
+        self._redis = redis.from_url(url)
+
+    async def get_many(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        return await self._redis.mget(keys) if keys else []
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        await self._redis.set(key, value, px=int(ttl * 1000))
+
+    async def incr(self, key: str) -> int:
+        return await self._redis.incr(key)
+
+
+class LRUCache:
+    """Bounded in-process LRU cache with a TTL."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+class ResultCache:
+    """Two-tier cache of query results invalidated through version counters.
+
+    Callers fold the current version of every list or entity a result
+    depends on into its key; writers bump those versions, which makes every
+    older entry unreachable without having to find and delete it. With a
+    shared backend the counters live there, so a write in one worker
+    invalidates all of them.
+    """
+
+    def __init__(self, local: LRUCache, shared: Optional[CacheBackend] = None, namespace: str = "results"):
+        self.local = local
+        self.shared = shared
+        self.namespace = namespace
+        self._versions: Dict[str, int] = {}
+
+    def key(self, *parts: Any) -> str:
+        digest = hashlib.sha256(_encode(parts)).hexdigest()
+        return f"{self.namespace}:{digest}"
+
+    def _version_key(self, name: str) -> str:
+        return f"{self.namespace}:version:{name}"
+
+    async def versions(self, names: Sequence[str]) -> List[int]:
+        if self.shared is None:
+            return [self._versions.get(name, 0) for name in names]
+        values = await self.shared.get_many([self._version_key(name) for name in names])
+        return [int(value) if value is not None else 0 for value in values]
+
+    async def bump(self, *names: str) -> None:
+        for name in names:
+            if self.shared is not None:
+                await self.shared.incr(self._version_key(name))
+            else:
+                if len(self._versions) >= settings.RESULT_CACHE_SIZE and name not in self._versions:
+                    # Forgetting a counter would revive entries cached under
+                    # its old value, so start over from an empty cache
+                    self._versions.clear()
+                    self.local.clear()
+                self._versions[name] = self._versions.get(name, 0) + 1
+
+    async def get_many(self, keys: Sequence[str]) -> List[Optional[Any]]:
+        values = [self.local.get(key) for key in keys]
+        missing = [index for index, value in enumerate(values) if value is None]
+        if self.shared is not None and missing:
+            shared_values = await self.shared.get_many([keys[index] for index in missing])
+            for index, data in zip(missing, shared_values):
+                if data is not None:
+                    values[index] = _decode(data)
+                    self.local.set(keys[index], values[index])
+        return values
+
+    async def get(self, key: str) -> Optional[Any]:
+        return (await self.get_many([key]))[0]
+
+    async def set(self, key: str, value: Any) -> None:
+        self.local.set(key, value)
+        if self.shared is not None:
+            await self.shared.set(key, _encode(value), self.local.ttl)
+
+    def clear(self) -> None:
+        self.local.clear()
+        self._versions.clear()
+
+
+def create_cache_backend(url: Optional[str]) -> Optional[CacheBackend]:
+    if not url:
+        return None
+    if url.startswith("memory://"):
+        return InMemoryCacheBackend()
+    if url.startswith(("redis://", "rediss://")):
+        return RedisCacheBackend(url)
+    raise ValueError(f"Unsupported cache URL: {url}")
+
+
+result_cache = ResultCache(
+    LRUCache(settings.RESULT_CACHE_SIZE, settings.RESULT_CACHE_TTL_SECONDS),
+    create_cache_backend(settings.RESULT_CACHE_URL),
+)
@@ -0,0 +1,298 @@
+import asyncio
+import logging
+import time
+from itertools import islice
+from typing import AsyncIterator, Callable, Iterable, Optional, Set
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db import async_session
+from app.models import Bee
+from app.storage import (ImageStorage, ScannedImage, image_key, image_path_for,
+                         image_storage)
+
+logger = logging.getLogger(__name__)
+
+# Image paths checked per query, well below the bound parameter limits
+REFERENCE_CHECK_CHUNK_SIZE = 500
+
+
+async def referenced_image_paths(db: AsyncSession, image_paths: Iterable[str]) -> Set[str]:
+    """The subset of ``image_paths`` still referenced by at least one bee"""
+    image_paths = list(image_paths)
+    referenced: Set[str] = set()
+    for start in range(0, len(image_paths), REFERENCE_CHECK_CHUNK_SIZE):
+        chunk = image_paths[start:start + REFERENCE_CHECK_CHUNK_SIZE]
+        result = await db.execute(
+            select(Bee.image_path).where(Bee.image_path.in_(chunk)).distinct()
+        )
+        referenced.update(result.scalars().all())
+    return referenced
+
+
+class ImageCleanupQueue:
+    """Removes image blobs in the background, off the request path.
+
+    Callers enqueue keys only once the transaction deleting a bee has
+    committed, so a rollback never leaves a bee pointing at a missing file.
+    Blobs are content addressed and an upload of identical bytes may reuse
+    one at any time, so right before removing it the worker checks again
+    that no bee references it and that it was not stored within the last
+    ``grace_seconds``. Failed removals are retried with exponential backoff;
+    keys that still fail after ``max_attempts``, that are too recent, or
+    that do not fit in the queue, are left for the orphan sweeper.
+    """
+
+    def __init__(
+        self,
+        storage: ImageStorage,
+        maxsize: int,
+        max_attempts: int,
+        retry_seconds: float,
+        grace_seconds: float,
+        session_factory: Callable[[], AsyncSession] = async_session,
+    ):
+        self.storage = storage
+        self.maxsize = maxsize
+        self.max_attempts = max_attempts
+        self.retry_seconds = retry_seconds
+        self.grace_seconds = grace_seconds
+        self.session_factory = session_factory
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """Start the worker; enqueuing starts it on demand as well"""
+        loop = asyncio.get_running_loop()
+        if self._task is not None and not self._task.done() and self._task.get_loop() is loop:
+            return
+        self._queue = asyncio.Queue(self.maxsize)
+        self._task = loop.create_task(self._run())
+
+    def enqueue(self, keys: Iterable[str]) -> None:
+        self.start()
+        for key in keys:
+            self._put(key, 1)
+
+    async def put(self, key: str) -> None:
+        """Enqueue a key, waiting for room instead of dropping it"""
+        self.start()
+        await self._queue.put((key, 1))
+
+    def _put(self, key: str, attempt: int) -> None:
+        try:
+            self._queue.put_nowait((key, attempt))
+        except asyncio.QueueFull:
+            logger.warning("Image cleanup queue is full, leaving %s to the sweeper", key)
+
+    async def _run(self) -> None:
+        queue = self._queue
+        while True:
+            key, attempt = await queue.get()
+            try:
+                await self._remove(key)
+            except Exception:
+                if attempt >= self.max_attempts:
+                    logger.exception("Giving up removing image %s after %d attempts", key, attempt)
+                else:
+                    logger.warning("Removing image %s failed, retrying", key, exc_info=True)
+                    # The retry keeps the item unfinished, so join() waits for it
+                    asyncio.create_task(self._retry(queue, key, attempt))
+                    continue
+            queue.task_done()
+
+    async def _remove(self, key: str) -> None:
+        modified = await self.storage.modified(key)
+        if modified is None:
+            return
+        if modified > time.time() - self.grace_seconds:
+            # Possibly reused by an upload whose bee has not committed yet
+            logger.info("Image %s was stored recently, leaving it to the sweeper", key)
+            return
+        async with self.session_factory() as db:
+            if await referenced_image_paths(db, [image_path_for(key)]):
+                return
+        # An identical upload touches the blob before its bee commits, which
+        # may have happened after the checks above
+        if await self.storage.modified(key) != modified:
+            logger.info("Image %s was stored again, leaving it to the sweeper", key)
+            return
+        await self.storage.delete(key)
+
+    async def _retry(self, queue: asyncio.Queue, key: str, attempt: int) -> None:
+        try:
+            await asyncio.sleep(self.retry_seconds * 2 ** (attempt - 1))
+            if queue is self._queue:
+                self._put(key, attempt + 1)
+        finally:
+            queue.task_done()
+
+    async def join(self) -> None:
+        """Wait until every enqueued key is removed or given up on"""
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def stop(self) -> None:
+        # Keys still queued are lost; the sweeper picks them up later
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            self._queue = None
+
+
+image_cleanup = ImageCleanupQueue(
+    image_storage,
+    settings.IMAGE_CLEANUP_QUEUE_SIZE,
+    settings.IMAGE_CLEANUP_MAX_ATTEMPTS,
+    settings.IMAGE_CLEANUP_RETRY_SECONDS,
+    settings.IMAGE_CLEANUP_GRACE_SECONDS,
+)
+
+
+class Throttle:
+    """Paces a scan to at most ``per_second`` items; 0 leaves it unpaced"""
+
+    def __init__(self, per_second: float):
+        self.per_second = per_second
+        self.started = time.monotonic()
+        self.count = 0
+
+    async def __call__(self, items: int) -> None:
+        self.count += items
+        if self.per_second > 0:
+            delay = self.count / self.per_second - (time.monotonic() - self.started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+
+async def find_orphaned_images(
+    db: AsyncSession,
+    storage: ImageStorage = image_storage,
+    grace_seconds: Optional[float] = None,
+    chunk_size: int = REFERENCE_CHECK_CHUNK_SIZE,
+    per_second: float = 0,
+) -> AsyncIterator[ScannedImage]:
+    """Stream stored images that no bee references.
+
+    The store is scanned lazily and each chunk of entries is looked up in
+    the database with one indexed query, so neither side is ever loaded
+    whole. Images modified within the grace period are skipped: they may
+    have been uploaded for a bee whose transaction has not committed yet.
+    """
+    if grace_seconds is None:
+        grace_seconds = settings.IMAGE_SWEEP_GRACE_SECONDS
+    cutoff = time.time() - grace_seconds
+    entries = storage.scan()
+    throttle = Throttle(per_second)
+    while chunk := await run_in_threadpool(lambda: list(islice(entries, chunk_size))):
+        candidates = [image for image in chunk if image.modified < cutoff]
+        referenced = await referenced_image_paths(
+            db, [image_path_for(image.key) for image in candidates]
+        )
+        for image in candidates:
+            if image_path_for(image.key) not in referenced:
+                yield image
+        await throttle(len(chunk))
+
+
+async def _image_exists(storage: ImageStorage, image_path: str) -> bool:
+    try:
+        return await storage.exists(image_key(image_path))
+    except ValueError:
+        # A path that can never resolve inside the store
+        return False
+
+
+async def find_missing_images(
+    db: AsyncSession,
+    storage: ImageStorage = image_storage,
+    chunk_size: int = REFERENCE_CHECK_CHUNK_SIZE,
+    per_second: float = 0,
+) -> AsyncIterator[str]:
+    """Stream image paths that bees reference but the store does not hold.
+
+    Distinct paths are read in index order a chunk per query, resuming
+    after the last path seen.
+    """
+    throttle = Throttle(per_second)
+    last_path: Optional[str] = None
+    while True:
+        statement = (
+            select(Bee.image_path)
+            .where(Bee.image_path.is_not(None))
+            .distinct()
+            .order_by(Bee.image_path)
+            .limit(chunk_size)
+        )
+        if last_path is not None:
+            statement = statement.where(Bee.image_path > last_path)
+        image_paths = (await db.execute(statement)).scalars().all()
+        if not image_paths:
+            return
+        found = await asyncio.gather(*(_image_exists(storage, path) for path in image_paths))
+        for image_path, exists in zip(image_paths, found):
+            if not exists:
+                yield image_path
+        last_path = image_paths[-1]
+        await throttle(len(image_paths))
+
+
+async def sweep_orphaned_images(
+    db: AsyncSession,
+    storage: ImageStorage = image_storage,
+    grace_seconds: Optional[float] = None,
+    chunk_size: int = REFERENCE_CHECK_CHUNK_SIZE,
+) -> int:
+    """Queue the removal of every orphaned image and return how many there were"""
+    count = 0
+    async for image in find_orphaned_images(
+        db, storage, grace_seconds, chunk_size, settings.IMAGE_SWEEP_MAX_FILES_PER_SECOND
+    ):
+        await image_cleanup.put(image.key)
+        count += 1
+    return count
+
+
+class ImageSweeper:
+    """Runs the orphan sweep periodically for the lifetime of the worker"""
+
+    def __init__(self, interval_seconds: float, session_factory: Callable[[], AsyncSession] = async_session):
+        self.interval_seconds = interval_seconds
+        self.session_factory = session_factory
+        self._task: Optional[asyncio.Task] = None
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            try:
+                async with self.session_factory() as db:
+                    orphans = await sweep_orphaned_images(db)
+                if orphans:
+                    logger.info("Sweeper queued %d orphaned images for removal", orphans)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Orphaned image sweep failed")
+
+    def start(self) -> None:
+        if self._task is None and self.interval_seconds > 0:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+image_sweeper = ImageSweeper(settings.IMAGE_SWEEP_INTERVAL_SECONDS)
@@ -0,0 +1,112 @@
+"""Command line entry points: ``python -m app.cli <command> --help``"""
+import argparse
+import asyncio
+import sys
+from typing import List, Optional
+
+from app.cache import result_cache
+from app.cleanup import (REFERENCE_CHECK_CHUNK_SIZE, find_missing_images,
+                         find_orphaned_images)
+from app.core.config import settings
+from app.db import async_session
+from app.image_processing import hash_images, stop_image_processing
+from app.importer import ImportFormat, guess_format, import_bees
+from app.storage import image_path_for, image_storage
+
+
+async def run_import_bees(args: argparse.Namespace) -> int:
+    format = ImportFormat(args.format) if args.format else guess_format(args.path)
+    with open(args.path, "rb") as file:
+        async with async_session() as db:
+            result = await import_bees(db, file, format, args.batch_size)
+
+    for error in result.errors:
+        location = f"line {error.line}" if error.line is not None else "whole batch"
+        print(f"batch {error.batch}, {location}: {error.message}", file=sys.stderr)
+    print(f"Imported {result.inserted} bees, {result.failed} failed")
+    if result.inserted and result_cache.shared is None:
+        # The import bumped the cache versions of this process only
+        print(
+            "RESULT_CACHE_URL is not set: running API processes may serve cached "
+            f"bee pages without the imported bees for up to {settings.RESULT_CACHE_TTL_SECONDS:g}s",
+            file=sys.stderr,
+        )
+    return 1 if result.failed else 0
+
+
+async def run_reconcile_images(args: argparse.Namespace) -> int:
+    orphaned = orphaned_bytes = missing = 0
+    async with async_session() as db:
+        async for image in find_orphaned_images(
+            db, image_storage, args.grace_seconds, args.chunk_size, args.max_files_per_second
+        ):
+            orphaned += 1
+            orphaned_bytes += image.size
+            if args.delete:
+                await image_storage.delete(image.key)
+            print(f"{'removed' if args.delete else 'orphaned'} {image_path_for(image.key)} {image.size}")
+
+        async for image_path in find_missing_images(
+            db, image_storage, args.chunk_size, args.max_files_per_second
+        ):
+            missing += 1
+            print(f"missing {image_path}")
+
+    action = "Removed" if args.delete else "Found"
+    print(
+        f"{action} {orphaned} orphaned images ({orphaned_bytes} bytes); "
+        f"{missing} image paths reference missing files",
+        file=sys.stderr,
+    )
+    return 1 if missing or (orphaned and not args.delete) else 0
+
+
+async def run_hash_images(args: argparse.Namespace) -> int:
+    try:
+        async with async_session() as db:
+            count = await hash_images(db, args.chunk_size)
+    finally:
+        await stop_image_processing()
+    print(f"Hashed {count} images")
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m app.cli")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = commands.add_parser("import-bees", help="Bulk import bees from a CSV or NDJSON file")
+    import_parser.add_argument("path", help="CSV (with a header row) or NDJSON file")
+    import_parser.add_argument("--format", choices=[format.value for format in ImportFormat])
+    import_parser.add_argument("--batch-size", type=int, default=None)
+    import_parser.set_defaults(handler=run_import_bees)
+
+    reconcile_parser = commands.add_parser(
+        "reconcile-images",
+        help="Report (or delete) stored images no bee references, and bees whose image is missing",
+    )
+    reconcile_parser.add_argument("--delete", action="store_true", help="Remove orphaned images instead of only reporting them")
+    reconcile_parser.add_argument("--grace-seconds", type=float, default=settings.IMAGE_SWEEP_GRACE_SECONDS)
+    reconcile_parser.add_argument("--chunk-size", type=int, default=REFERENCE_CHECK_CHUNK_SIZE)
+    reconcile_parser.add_argument(
+        "--max-files-per-second", type=float, default=settings.IMAGE_SWEEP_MAX_FILES_PER_SECOND,
+        help="Pace the scan so it does not starve request I/O; 0 disables pacing",
+    )
+    reconcile_parser.set_defaults(handler=run_reconcile_images)
+
+    hash_parser = commands.add_parser(
+        "hash-images", help="Compute perceptual hashes of processed images that have none"
+    )
+    hash_parser.add_argument("--chunk-size", type=int, default=REFERENCE_CHECK_CHUNK_SIZE)
+    hash_parser.set_defaults(handler=run_hash_images)
+
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    return asyncio.run(args.handler(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
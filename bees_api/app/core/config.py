@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Dict, List, Optional
 
 from pydantic_settings import BaseSettings
 
@@ -9,15 +9,133 @@ class Settings(BaseSettings):
     
     # Database configuration
     DATABASE_URL: str
+    DB_ECHO: bool = False
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    DB_STATEMENT_TIMEOUT_MS: int = 0  # 0 disables the server-side timeout
+    DB_PREPARED_STATEMENT_CACHE_SIZE: int = 100
+
+    # Optional read replica used by queries
+    READ_DATABASE_URL: Optional[str] = None
+    READ_YOUR_WRITES_SECONDS: int = 5
     
     # JWT Configuration
     JWT_SECRET_KEY: str
     JWT_ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+
+    # Password hashing
+    BCRYPT_ROUNDS: int = 12
+    PASSWORD_HASH_WORKERS: int = 4
+
+    # Authenticated user cache
+    USER_CACHE_SIZE: int = 10000
+    USER_CACHE_TTL_SECONDS: float = 60
     
-    # Static files and image uploads
-    STATIC_FILES_DIR: str = "app/images"
+    # Image uploads
     UPLOAD_DIR: str = "app/images"
+    IMAGE_STORAGE_BACKEND: str = "local"
+    IMAGE_CACHE_MAX_AGE: int = 3600  # For images whose name is not a content hash
+
+    # Blobs of deleted bees are removed by a background queue after commit;
+    # failures are retried, and the sweeper catches whatever is left behind
+    IMAGE_CLEANUP_QUEUE_SIZE: int = 10000
+    IMAGE_CLEANUP_MAX_ATTEMPTS: int = 5
+    IMAGE_CLEANUP_RETRY_SECONDS: float = 1.0  # Doubled after each failed attempt
+    IMAGE_CLEANUP_GRACE_SECONDS: int = 300  # Younger blobs are left to the sweeper
+    IMAGE_SWEEP_INTERVAL_SECONDS: int = 3600  # 0 disables the periodic sweep
+    IMAGE_SWEEP_GRACE_SECONDS: int = 3600  # Younger blobs may belong to a bee not yet committed
+    IMAGE_SWEEP_MAX_FILES_PER_SECOND: int = 1000  # Keeps the scan from starving request I/O; 0 is unpaced
+
+    # Background jobs such as image processing: "local" keeps them in memory,
+    # "database" stores them in the job table, shared by all workers
+    JOBS_BACKEND: str = "local"
+    JOBS_CONCURRENCY: int = 2  # Jobs run at once per process
+    JOBS_MAX_ATTEMPTS: int = 5
+    JOBS_RETRY_SECONDS: float = 5.0  # Doubled after each failed attempt
+    JOBS_QUEUE_SIZE: int = 10000  # Local backend only
+    JOBS_POLL_SECONDS: float = 1.0  # Database backend: idle workers check for jobs this often
+    JOBS_LEASE_SECONDS: int = 300  # Database backend: a job is retried if its worker is gone this long
+
+    # Uploaded images are validated, stripped of metadata and re-encoded in
+    # the background; JPEG unless the image has transparency
+    IMAGE_NORMALIZE_JPEG_QUALITY: int = 90
+
+    # Widest Hamming distance similarBees accepts; the index search slows
+    # down quickly beyond it
+    SIMILAR_BEES_MAX_DISTANCE: int = 16
+
+    # Resized image variants (thumbnails)
+    IMAGE_VARIANT_WIDTHS: List[int] = [64, 128, 256, 512, 1024]
+    IMAGE_VARIANT_CACHE_DIR: str = "app/image_variants"
+    IMAGE_VARIANT_CACHE_MAX_BYTES: int = 1024 * 1024 * 1024
+    IMAGE_VARIANT_WORKERS: int = 2
+    MAX_UPLOAD_SIZE: int = 64 * 1024 * 1024
+    UPLOAD_CHUNK_SIZE: int = 1024 * 1024
+
+    # Bulk import
+    IMPORT_BATCH_SIZE: int = 1000
+    IMPORT_MAX_REPORTED_ERRORS: int = 100
+
+    # Bulk export
+    EXPORT_BATCH_SIZE: int = 5000
+
+    # Query result cache; RESULT_CACHE_URL (redis://... or memory://) adds a
+    # shared tier so invalidations reach every worker
+    RESULT_CACHE_SIZE: int = 10000
+    RESULT_CACHE_TTL_SECONDS: float = 300
+    RESULT_CACHE_URL: Optional[str] = None
+
+    # GraphQL documents: parsed and validated documents are cached by query
+    # text, and clients may send a persisted query's sha256 hash instead of
+    # its text. PERSISTED_QUERIES_FILE is a JSON object of hash -> query;
+    # with PERSISTED_QUERIES_ONLY set, only the queries listed there run
+    GRAPHQL_DOCUMENT_CACHE_SIZE: int = 1000
+    PERSISTED_QUERY_CACHE_SIZE: int = 10000
+    PERSISTED_QUERIES_FILE: Optional[str] = None
+    PERSISTED_QUERIES_ONLY: bool = False
+
+    # GraphQL operation limits, checked before execution. Fields returning
+    # objects cost 1 (or their declared cost) and paginated fields multiply
+    # the cost of their selection by "first"
+    MAX_QUERY_DEPTH: int = 10
+    MAX_QUERY_ALIASES: int = 30
+    MAX_QUERY_COST: int = 1000
+
+    # Rate limiting with token buckets: requests per minute (and bursts) per
+    # client IP and per authenticated user, a budget of query cost per
+    # client, and per-minute limits for individual root fields. A
+    # RATE_LIMIT_STORE_URL (redis://... or memory://) shares the buckets
+    # between workers
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_STORE_URL: Optional[str] = None
+    RATE_LIMIT_MAX_KEYS: int = 100000
+    RATE_LIMIT_IP_PER_MINUTE: float = 1200
+    RATE_LIMIT_IP_BURST: int = 300
+    RATE_LIMIT_USER_PER_MINUTE: float = 600
+    RATE_LIMIT_USER_BURST: int = 120
+    RATE_LIMIT_COST_PER_MINUTE: float = 20000
+    RATE_LIMIT_COST_BURST: int = 5000
+    RATE_LIMIT_OPERATIONS: Dict[str, int] = {"login": 10, "register": 5, "importBees": 10}
+
+    # beeStats reads the incrementally maintained bee_daily_count summary;
+    # disable to aggregate the bee table directly
+    BEE_STATS_USE_SUMMARY: bool = True
+
+    # Subscription events: "local" delivers within the process; "postgres"
+    # fans out to every worker through LISTEN/NOTIFY on the primary
+    EVENTS_BACKEND: str = "local"
+    EVENTS_QUEUE_SIZE: int = 100  # Per subscriber; the oldest events are dropped beyond it
+
+    # Pagination
+    DEFAULT_PAGE_SIZE: int = 20
+    MAX_PAGE_SIZE: int = 100
+
+    # Items accepted by one addBees or deleteBees mutation
+    MAX_BATCH_MUTATION_SIZE: int = 500
 
     class Config:
         env_file = ".env"
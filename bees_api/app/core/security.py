@@ -1,18 +1,37 @@
+import asyncio
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Any, Optional
+from typing import Any, Optional, Tuple
 
 from fastapi import Depends, HTTPException, status
+from fastapi.requests import HTTPConnection
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from sqlalchemy.ext.asyncio import AsyncSession
+from strawberry.permission import BasePermission
+from strawberry.types import Info
 
 from app.core.config import settings
 from app.db import get_db
 from app.models import User
 
 # Password functions
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Hashes below the configured cost are reported by needs_update and upgraded on login
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__min_rounds=settings.BCRYPT_ROUNDS,
+)
+
+# bcrypt releases the GIL, so a bounded thread pool keeps hashing off the
+# event loop and caps how many hashes run at once
+password_executor = ThreadPoolExecutor(
+    max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash"
+)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
@@ -20,6 +39,23 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
+async def get_password_hash_async(password: str) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(password_executor, pwd_context.hash, password)
+
+async def verify_and_update_password(
+    plain_password: str, hashed_password: str
+) -> Tuple[bool, Optional[str]]:
+    """Verify a password in the worker pool.
+
+    Returns ``(valid, new_hash)`` where ``new_hash`` is set when the stored
+    hash is valid but outdated and should be replaced.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        password_executor, pwd_context.verify_and_update, plain_password, hashed_password
+    )
+
 # Authentication
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/graphql")
 
@@ -33,6 +69,76 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     encoded_jwt = jwt.encode(to_encode, settings.JWT_SECRET_KEY, algorithm=settings.JWT_ALGORITHM)
     return encoded_jwt
 
+class UserCache:
+    """Bounded in-process LRU cache of active users with a TTL.
+
+    Entries are keyed by ``(username, token)`` so a cached user is only ever
+    returned for a token that has already been validated for that user.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, User]]" = OrderedDict()
+
+    def get(self, username: str, token: str) -> Optional[User]:
+        key = (username, token)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, user = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return user
+
+    def set(self, username: str, token: str, user: User) -> None:
+        if self.maxsize <= 0:
+            return
+        key = (username, token)
+        self._entries[key] = (time.monotonic() + self.ttl, user)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, username: str) -> None:
+        for key in [key for key in self._entries if key[0] == username]:
+            del self._entries[key]
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+user_cache = UserCache(settings.USER_CACHE_SIZE, settings.USER_CACHE_TTL_SECONDS)
+
+
+def get_bearer_token(request: HTTPConnection) -> str:
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    return token if scheme.lower() == "bearer" else ""
+
+def get_connection_params_token(connection_params: Any) -> str:
+    """Bearer token sent in a WebSocket ``connection_init`` payload.
+
+    Browsers cannot set headers on WebSocket connections, so subscription
+    clients send ``{"Authorization": "Bearer <token>"}`` there instead.
+    """
+    if not isinstance(connection_params, dict):
+        return ""
+    value = connection_params.get("Authorization") or connection_params.get("authorization") or ""
+    scheme, _, token = str(value).partition(" ")
+    return token if scheme.lower() == "bearer" else ""
+
+def get_token_subject(token: str) -> Optional[str]:
+    """Username a valid token was issued to, without touching the database"""
+    if not token:
+        return None
+    try:
+        payload = jwt.decode(token, settings.JWT_SECRET_KEY, algorithms=[settings.JWT_ALGORITHM])
+    except JWTError:
+        return None
+    return payload.get("sub")
+
 async def get_current_user(
     token: str, # Removed Depends()
     db: AsyncSession, # Removed Depends()
@@ -53,10 +159,62 @@ async def get_current_user(
     except JWTError:
         raise credentials_exception
 
+    # The token is valid, so a recently seen user can skip the database
+    user = user_cache.get(username, token)
+    if user is not None:
+        return user
+
     # Use the function passed as parameter
     user = await get_user_func(db, username=username)
     if user is None:
         raise credentials_exception
     if not user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
-    return user
\ No newline at end of file
+    user_cache.set(username, token, user)
+    return user
+
+
+def auth_scope(user: User) -> str:
+    """Partition of cached results a user may see.
+
+    Every active user currently sees the same bees; per-user or per-role
+    visibility would have to be reflected here.
+    """
+    return "authenticated"
+
+
+class RequestAuth:
+    """Authenticates a request lazily, at most once.
+
+    Created per request by the GraphQL context; all resolvers of the
+    operation share the same lookup, and requests that never ask for the
+    user never decode the token. WebSocket connections may supply the token
+    through ``token`` instead of a header.
+    """
+
+    def __init__(self, request: HTTPConnection, db: AsyncSession, get_user_func: callable):
+        self.request = request
+        self.db = db
+        self.get_user_func = get_user_func
+        self.token: Optional[str] = None
+        self._user: Optional[asyncio.Future] = None
+
+    async def get_user(self) -> User:
+        if self._user is None:
+            token = self.token or get_bearer_token(self.request)
+            self._user = asyncio.ensure_future(
+                get_current_user(token, self.db, self.get_user_func)
+            )
+        return await self._user
+
+
+class IsAuthenticated(BasePermission):
+    message = "Could not validate credentials"
+
+    async def has_permission(self, source: Any, info: Info, **kwargs: Any) -> bool:
+        auth = info.context["auth"]
+        if auth.token is None and "connection_params" in info.context:
+            auth.token = get_connection_params_token(info.context["connection_params"])
+        # Raises with the precise reason (bad token, inactive user) on failure
+        await auth.get_user()
+        return True
@@ -0,0 +1,99 @@
+from typing import Any, Dict, Optional
+
+from graphql import (DocumentNode, FieldNode, FragmentDefinitionNode,
+                     FragmentSpreadNode, GraphQLInt, GraphQLSchema,
+                     SelectionSetNode, Undefined, get_named_type,
+                     is_composite_type, is_leaf_type)
+from graphql.utilities import get_operation_ast, value_from_ast
+
+from app.core.config import settings
+
+# Fields returning objects cost this much unless their definition says
+# otherwise through ``metadata={"cost": n}``; scalar fields are free
+DEFAULT_OBJECT_COST = 1
+
+
+def _field_cost(field_def) -> int:
+    definition = field_def.extensions.get("strawberry-definition")
+    metadata = getattr(definition, "metadata", None) or {}
+    if "cost" in metadata:
+        return metadata["cost"]
+    return 0 if is_leaf_type(get_named_type(field_def.type)) else DEFAULT_OBJECT_COST
+
+
+def _page_size(field_def, field_node: FieldNode, variables: Dict[str, Any]) -> Optional[int]:
+    # List fields are paginated with "first"; every item repeats the cost of
+    # the selection below it, and leaving it out returns a default page
+    if "first" not in field_def.args:
+        return None
+    for argument in field_node.arguments:
+        if argument.name.value == "first":
+            value = value_from_ast(argument.value, GraphQLInt, variables)
+            if value is None or value is Undefined:
+                break
+            return max(value, 0)
+    return settings.DEFAULT_PAGE_SIZE
+
+
+class _Analyzer:
+    def __init__(self, schema: GraphQLSchema, document: DocumentNode, variables: Dict[str, Any]):
+        self.schema = schema
+        self.variables = variables
+        self.fragments = {
+            definition.name.value: definition
+            for definition in document.definitions
+            if isinstance(definition, FragmentDefinitionNode)
+        }
+
+    def selection_cost(self, parent_type, selection_set: Optional[SelectionSetNode]) -> int:
+        if selection_set is None:
+            return 0
+        total = 0
+        for selection in selection_set.selections:
+            if isinstance(selection, FieldNode):
+                total += self.field_cost(parent_type, selection)
+            else:
+                if isinstance(selection, FragmentSpreadNode):
+                    fragment = self.fragments[selection.name.value]
+                else:
+                    fragment = selection
+                fragment_type = parent_type
+                if fragment.type_condition is not None:
+                    fragment_type = self.schema.get_type(fragment.type_condition.name.value)
+                total += self.selection_cost(fragment_type, fragment.selection_set)
+        return total
+
+    def field_cost(self, parent_type, field_node: FieldNode) -> int:
+        name = field_node.name.value
+        if name.startswith("__"):
+            # Introspection is bounded by the schema itself
+            return 0
+
+        field_def = parent_type.fields.get(name) if hasattr(parent_type, "fields") else None
+        if field_def is None:
+            return 0
+        field_type = get_named_type(field_def.type)
+        children = 0
+        if is_composite_type(field_type):
+            children = self.selection_cost(field_type, field_node.selection_set)
+        page_size = _page_size(field_def, field_node, self.variables)
+        if page_size is not None:
+            children *= page_size
+        return _field_cost(field_def) + children
+
+
+def estimate_cost(
+    schema: GraphQLSchema,
+    document: DocumentNode,
+    operation_name: Optional[str] = None,
+    variables: Optional[Dict[str, Any]] = None,
+) -> int:
+    """Estimate the cost of an operation before it runs.
+
+    The document must already be validated.
+    """
+    operation = get_operation_ast(document, operation_name)
+    if operation is None:
+        return 0
+    root_type = schema.get_root_type(operation.operation)
+    return _Analyzer(schema, document, variables or {}).selection_cost(root_type, operation.selection_set)
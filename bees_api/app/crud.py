@@ -1,13 +1,22 @@
-import os
+import re
 from datetime import date
-from typing import List, Optional
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 
-from sqlalchemy import select
+from sqlalchemy import (Row, case, delete, func, insert, literal,
+                        literal_column, or_, select, tuple_)
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.cache import BEES_LIST, bee_entity, result_cache
+from app.cleanup import image_cleanup
 from app.core.config import settings
-from app.core.security import get_password_hash, verify_password
+from app.core.security import (get_password_hash_async, user_cache,
+                               verify_and_update_password)
+from app.events import BEE_ADDED, BEE_DELETED, event_bus
+from app.image_processing import (ImageStatus, add_image_processing,
+                                  enqueue_image_processing)
 from app.models import Bee, User
+from app.stats import record_bee_counts
+from app.storage import image_key
 
 
 # User operations
@@ -20,30 +29,145 @@ async def get_user_by_email(db: AsyncSession, email: str) -> Optional[User]:
     return result.scalars().first()
 
 async def create_user(db: AsyncSession, username: str, email: str, password: str) -> User:
-    hashed_password = get_password_hash(password)
+    hashed_password = await get_password_hash_async(password)
     db_user = User(username=username, email=email, hashed_password=hashed_password)
     db.add(db_user)
     await db.commit()
     await db.refresh(db_user)
+    user_cache.invalidate(username)
     return db_user
 
 async def authenticate_user(db: AsyncSession, username: str, password: str) -> Optional[User]:
     user = await get_user_by_username(db, username)
     if not user:
         return None
-    if not verify_password(password, user.hashed_password):
+    valid, new_hash = await verify_and_update_password(password, user.hashed_password)
+    if not valid:
         return None
+    # Transparently upgrade hashes made with an outdated scheme or cost
+    if new_hash:
+        user.hashed_password = new_hash
+        await db.commit()
+        user_cache.invalidate(username)
     return user
 
 
 # Bee operations
-async def get_bees(db: AsyncSession, skip: int = 0, limit: int = 100) -> List[Bee]:
-    result = await db.execute(select(Bee).offset(skip).limit(limit))
-    return result.scalars().all()
+def filter_bees(
+    query,
+    species: Optional[str] = None,
+    origin: Optional[str] = None,
+    captured_from: Optional[date] = None,
+    captured_to: Optional[date] = None,
+):
+    """Narrow a bee query by the optional catalogue filters."""
+    if species is not None:
+        query = query.where(Bee.species == species)
+    if origin is not None:
+        query = query.where(Bee.origin == origin)
+    if captured_from is not None:
+        query = query.where(Bee.captured_date >= captured_from)
+    if captured_to is not None:
+        query = query.where(Bee.captured_date <= captured_to)
+    return query
 
-async def get_bee(db: AsyncSession, bee_id: int) -> Optional[Bee]:
-    result = await db.execute(select(Bee).where(Bee.id == bee_id))
-    return result.scalars().first()
+async def get_bee_rows(
+    db: AsyncSession,
+    columns: Sequence[str],
+    limit: int = 100,
+    after: Optional[Tuple[date, int]] = None,
+    species: Optional[str] = None,
+    origin: Optional[str] = None,
+    captured_from: Optional[date] = None,
+    captured_to: Optional[date] = None,
+) -> List[Row]:
+    """Return a page of bees, newest capture first, as plain rows of ``columns``.
+
+    Pagination is keyset based: ``after`` is the ``(captured_date, id)`` of the
+    last bee of the previous page, so every page is a bounded index range scan
+    instead of an OFFSET that grows with the page number. Rows skip ORM
+    hydration and identity-map bookkeeping, and only transfer the columns the
+    caller needs.
+    """
+    query = filter_bees(
+        select(*(getattr(Bee, column) for column in columns)),
+        species, origin, captured_from, captured_to,
+    )
+    if after is not None:
+        query = query.where(tuple_(Bee.captured_date, Bee.id) < tuple_(*after))
+    query = query.order_by(Bee.captured_date.desc(), Bee.id.desc()).limit(limit)
+    result = await db.execute(query)
+    return result.all()
+
+# Text searched by search_bees. The Postgres search indexes are built on
+# this exact expression (see the add_bee_search_indexes migration), so it
+# must stay in sync with them and keep its constants inline
+SEARCH_CONFIG = literal_column("'simple'::regconfig")
+SEARCH_DOCUMENT = Bee.name.concat(literal_column("' '")).concat(Bee.species).concat(
+    literal_column("' '")
+).concat(Bee.origin)
+MAX_SEARCH_TERMS = 8
+
+def search_terms(text: str) -> List[str]:
+    return re.findall(r"\w+", text.lower())[:MAX_SEARCH_TERMS]
+
+def _search_query(query, dialect: str, text: str, terms: List[str]):
+    if dialect == "postgresql":
+        # Full-text matches on word prefixes, for typeahead, plus trigram
+        # matches that tolerate typos; both are served by GIN indexes
+        vector = func.to_tsvector(SEARCH_CONFIG, SEARCH_DOCUMENT)
+        tsquery = func.to_tsquery(SEARCH_CONFIG, " & ".join(f"{term}:*" for term in terms))
+        rank = func.ts_rank_cd(vector, tsquery) + func.word_similarity(text, SEARCH_DOCUMENT)
+        return query.where(
+            or_(vector.op("@@")(tsquery), literal(text).op("<%")(SEARCH_DOCUMENT.self_group()))
+        ).order_by(rank.desc(), Bee.id.desc())
+
+    # Fallback for other databases, SQLite in the tests: every term must occur
+    # somewhere, and names starting with the text rank first
+    document = func.lower(SEARCH_DOCUMENT)
+    for term in terms:
+        query = query.where(document.contains(term, autoescape=True))
+    name = func.lower(Bee.name)
+    rank = case(
+        (name.startswith(text.lower(), autoescape=True), 0),
+        (name.contains(terms[0], autoescape=True), 1),
+        else_=2,
+    )
+    return query.order_by(rank, Bee.name, Bee.id.desc())
+
+async def search_bee_rows(
+    db: AsyncSession,
+    text: str,
+    columns: Sequence[str],
+    limit: int = 20,
+    offset: int = 0,
+) -> List[Row]:
+    """Bees matching ``text`` in their name, species or origin, best first.
+
+    Returns plain rows holding only ``columns``. Results are ranked rather
+    than ordered by a key, so pages are addressed by offset.
+    """
+    terms = search_terms(text)
+    if not terms:
+        return []
+    query = _search_query(
+        select(*(getattr(Bee, column) for column in columns)),
+        db.bind.dialect.name,
+        text.strip(),
+        terms,
+    )
+    result = await db.execute(query.limit(limit).offset(offset))
+    return result.all()
+
+BEE_COLUMNS = ("id", "name", "origin", "image_path", "image_status", "species", "captured_date")
+
+def bee_values(bee: Bee) -> Dict[str, Any]:
+    """Plain column values of a bee, suitable for caching"""
+    return {column: getattr(bee, column) for column in BEE_COLUMNS}
+
+async def get_bees_by_ids(db: AsyncSession, bee_ids: List[int]) -> List[Bee]:
+    result = await db.execute(select(Bee).where(Bee.id.in_(bee_ids)))
+    return result.scalars().all()
 
 async def create_bee(
     db: AsyncSession, 
@@ -58,24 +182,77 @@ async def create_bee(
         origin=origin,
         species=species,
         captured_date=captured_date,
-        image_path=image_path
+        image_path=image_path,
+        # Uploads are validated and normalized in the background
+        image_status=ImageStatus.PENDING.value if image_path else None,
     )
     db.add(db_bee)
+    await record_bee_counts(db, [((species, origin, captured_date), 1)])
+    unqueued: List[int] = []
+    if image_path:
+        # Commit the processing job along with the bee, so a crash in between
+        # never leaves the image pending without a job
+        await db.flush()
+        unqueued = add_image_processing(db, [db_bee.id])
     await db.commit()
     await db.refresh(db_bee)
+    await result_cache.bump(BEES_LIST)
+    await event_bus.publish(BEE_ADDED, [bee_values(db_bee)])
+    await enqueue_image_processing(unqueued)
     return db_bee
 
+async def create_bees(db: AsyncSession, rows: List[Dict[str, Any]]) -> List[int]:
+    """Insert many bees in one transaction and return their ids.
+
+    Executed as multi-row ``INSERT ... RETURNING`` statements rather than one
+    round trip per bee. The ids are returned in the order of ``rows``.
+    """
+    result = await db.execute(insert(Bee).returning(Bee.id, sort_by_parameter_order=True), rows)
+    bee_ids = result.scalars().all()
+    await record_bee_counts(
+        db, [((row["species"], row["origin"], row["captured_date"]), 1) for row in rows]
+    )
+    await db.commit()
+    await result_cache.bump(BEES_LIST)
+    await event_bus.publish(
+        BEE_ADDED,
+        [
+            {**{column: row.get(column) for column in BEE_COLUMNS}, "id": bee_id}
+            for bee_id, row in zip(bee_ids, rows)
+        ],
+    )
+    return bee_ids
+
 async def delete_bee(db: AsyncSession, bee_id: int) -> bool:
-    db_bee = await get_bee(db, bee_id)
-    if not db_bee:
-        return False
-        
-    # Delete image file if it exists
-    if db_bee.image_path:
-        image_full_path = os.path.join(os.getcwd(), db_bee.image_path)
-        if os.path.exists(image_full_path):
-            os.remove(image_full_path)
-            
-    await db.delete(db_bee)
+    return bool(await delete_bees(db, [bee_id]))
+
+async def delete_bees(db: AsyncSession, bee_ids: Sequence[int]) -> List[int]:
+    """Delete many bees in one transaction and return the ids that existed.
+
+    Runs as a single ``DELETE ... RETURNING`` statement. The images of the
+    deleted bees are handed to the background cleanup queue once the
+    deletion is committed, so a rollback never loses a file.
+    """
+    if not bee_ids:
+        return []
+    result = await db.execute(
+        delete(Bee)
+        .where(Bee.id.in_(set(bee_ids)))
+        .returning(Bee.id, Bee.species, Bee.origin, Bee.captured_date, Bee.image_path)
+    )
+    rows = result.all()
+    if not rows:
+        return []
+    await record_bee_counts(
+        db, [((row.species, row.origin, row.captured_date), -1) for row in rows]
+    )
     await db.commit()
-    return True
\ No newline at end of file
+    deleted_ids = [row.id for row in rows]
+    await result_cache.bump(BEES_LIST, *(bee_entity(bee_id) for bee_id in deleted_ids))
+    await event_bus.publish(BEE_DELETED, deleted_ids)
+
+    # Images are shared between bees with identical photos, and a new bee
+    # may pick one up at any time: the queue only removes a blob once it
+    # finds no bee referencing it right before the removal
+    image_cleanup.enqueue({image_key(row.image_path) for row in rows if row.image_path})
+    return deleted_ids
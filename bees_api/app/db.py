@@ -1,11 +1,140 @@
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+import time
+from typing import Any, Dict, Optional
+
+from fastapi import Depends
+from fastapi.requests import HTTPConnection
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
 from app.core.config import settings
 
-engine = create_async_engine(settings.DATABASE_URL, echo=True)
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """Queue pool that also records how often checkouts had to wait.
+
+    A checkout waits when the pool and its overflow are exhausted; frequent
+    waits or timeouts mean the pool is too small for the worker's load.
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.timeouts = 0
+
+    def _do_get(self):
+        exhausted = (
+            self._max_overflow > -1
+            and self._overflow >= self._max_overflow
+            and self.checkedin() == 0
+        )
+        if not exhausted:
+            return super()._do_get()
+
+        started = time.monotonic()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            self.waits += 1
+            self.wait_seconds += time.monotonic() - started
+
+
+def engine_options(database_url: str) -> Dict[str, Any]:
+    url = make_url(database_url)
+    options: Dict[str, Any] = {"echo": settings.DB_ECHO}
+    if url.get_backend_name() != "postgresql":
+        # SQLite (tests) keeps SQLAlchemy's default pooling
+        return options
+
+    options.update(
+        poolclass=InstrumentedPool,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+    )
+    if url.get_driver_name() == "asyncpg":
+        connect_args: Dict[str, Any] = {
+            # SQLAlchemy's and asyncpg's own prepared statement caches; set
+            # to 0 behind a transaction-pooling pgbouncer
+            "prepared_statement_cache_size": settings.DB_PREPARED_STATEMENT_CACHE_SIZE,
+            "statement_cache_size": settings.DB_PREPARED_STATEMENT_CACHE_SIZE,
+        }
+        if settings.DB_STATEMENT_TIMEOUT_MS:
+            connect_args["server_settings"] = {
+                "statement_timeout": str(settings.DB_STATEMENT_TIMEOUT_MS)
+            }
+        options["connect_args"] = connect_args
+    return options
+
+
+def pool_stats(engine: AsyncEngine) -> Dict[str, Any]:
+    pool = engine.sync_engine.pool
+    if not isinstance(pool, InstrumentedPool):
+        return {"pool": type(pool).__name__}
+    return {
+        "pool": type(pool).__name__,
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+        "max_overflow": pool._max_overflow,
+        "waits": pool.waits,
+        "wait_seconds": round(pool.wait_seconds, 3),
+        "timeouts": pool.timeouts,
+    }
+
+
+engine = create_async_engine(settings.DATABASE_URL, **engine_options(settings.DATABASE_URL))
 async_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
+# Optional read replica for read-only queries
+read_engine: Optional[AsyncEngine] = None
+read_async_session = None
+if settings.READ_DATABASE_URL:
+    read_engine = create_async_engine(
+        settings.READ_DATABASE_URL, **engine_options(settings.READ_DATABASE_URL)
+    )
+    read_async_session = sessionmaker(read_engine, class_=AsyncSession, expire_on_commit=False)
+
+# Set after a mutation so the client's next reads see its own writes
+READ_YOUR_WRITES_COOKIE = "bees_read_primary_until"
+READ_PRIMARY_HEADER = "X-Read-Primary"
+
+def get_pool_stats() -> Dict[str, Dict[str, Any]]:
+    stats = {"primary": pool_stats(engine)}
+    if read_engine is not None:
+        stats["replica"] = pool_stats(read_engine)
+    return stats
+
+def new_read_session() -> AsyncSession:
+    """A standalone session for long reads that outlive the request scope."""
+    return (read_async_session or async_session)()
+
+def reads_replica(session: AsyncSession) -> bool:
+    """Whether a session reads from the replica, which may lag the primary."""
+    return read_engine is not None and session.bind is read_engine
+
+def prefers_primary(request: HTTPConnection) -> bool:
+    """Whether a request must read from the primary instead of the replica.
+
+    Clients opt in explicitly with the X-Read-Primary header, and are routed
+    to the primary for a short window after their own mutations.
+    """
+    if request.headers.get(READ_PRIMARY_HEADER, "").lower() in ("1", "true"):
+        return True
+    try:
+        return float(request.cookies.get(READ_YOUR_WRITES_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
 async def get_db() -> AsyncSession:
     async with async_session() as session:
         try:
@@ -15,4 +144,15 @@ async def get_db() -> AsyncSession:
             await session.rollback()
             raise
         finally:
-            await session.close()
\ No newline at end of file
+            await session.close()
+
+async def get_read_db(request: HTTPConnection, db: AsyncSession = Depends(get_db)) -> AsyncSession:
+    """Session for read-only work: the replica when configured, else the primary."""
+    if read_async_session is None or prefers_primary(request):
+        yield db
+        return
+    async with read_async_session() as session:
+        try:
+            yield session
+        finally:
+            await session.close()
@@ -0,0 +1,168 @@
+import asyncio
+import json
+import logging
+from datetime import date
+from typing import (Any, AsyncIterator, Callable, Dict, List, Optional, Set,
+                    Tuple)
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.core.config import settings
+from app.db import engine
+
+logger = logging.getLogger(__name__)
+
+# Topics
+BEE_ADDED = "bee_added"
+BEE_DELETED = "bee_deleted"
+# Internal: a processed image got its perceptual hash
+BEE_IMAGE_HASHED = "bee_image_hashed"
+
+NOTIFY_CHANNEL = "bee_events"
+
+
+def _encode(topic: str, payload: Any) -> str:
+    def default(obj: Any) -> Any:
+        if isinstance(obj, date):
+            return {"$date": obj.isoformat()}
+        raise TypeError(f"Cannot encode {type(obj).__name__}")
+
+    return json.dumps({"topic": topic, "payload": payload}, default=default)
+
+
+def _decode(message: str) -> Tuple[str, Any]:
+    def object_hook(obj: Dict[str, Any]) -> Any:
+        if obj.keys() == {"$date"}:
+            return date.fromisoformat(obj["$date"])
+        return obj
+
+    event = json.loads(message, object_hook=object_hook)
+    return event["topic"], event["payload"]
+
+
+class EventBus:
+    """Publish/subscribe for bee events.
+
+    Subscribers of a process get a bounded queue each; when one falls
+    behind, its oldest events are dropped rather than blocking publishers.
+    With ``EVENTS_BACKEND=postgres`` events are sent through Postgres
+    ``NOTIFY`` instead and delivered by each worker's listener, so
+    subscribers see events published by any worker.
+    """
+
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._listeners: Dict[str, List[Callable[[Any], None]]] = {}
+
+    async def subscribe(self, topic: str) -> AsyncIterator[Any]:
+        queue: asyncio.Queue = asyncio.Queue(self.queue_size)
+        self._subscribers.setdefault(topic, set()).add(queue)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self._subscribers[topic].discard(queue)
+
+    def add_listener(self, topic: str, callback: Callable[[Any], None]) -> None:
+        """Call ``callback`` synchronously with every event of ``topic``
+        delivered to this process, for in-process state such as indexes"""
+        self._listeners.setdefault(topic, []).append(callback)
+
+    def subscriber_count(self, topic: str) -> int:
+        return len(self._subscribers.get(topic, ()))
+
+    def deliver(self, topic: str, payload: Any) -> None:
+        """Hand an event to the listeners and subscribers of this process"""
+        for callback in self._listeners.get(topic, ()):
+            try:
+                callback(payload)
+            except Exception:
+                logger.exception("Listener of %s events failed", topic)
+        for queue in list(self._subscribers.get(topic, ())):
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(payload)
+
+    async def publish(self, topic: str, payloads: List[Any]) -> None:
+        """Publish events; call only after the change they describe is committed"""
+        if not payloads:
+            return
+        if settings.EVENTS_BACKEND == "postgres":
+            await notify(engine, [_encode(topic, payload) for payload in payloads])
+            return
+        for payload in payloads:
+            self.deliver(topic, payload)
+
+
+async def notify(bind: AsyncEngine, messages: List[str]) -> None:
+    # One round trip for all messages; notifications are sent on commit
+    async with bind.begin() as connection:
+        await connection.execute(
+            text("SELECT pg_notify(:channel, message) FROM unnest(CAST(:messages AS text[])) AS message"),
+            {"channel": NOTIFY_CHANNEL, "messages": messages},
+        )
+
+
+class PostgresEventListener:
+    """Feeds NOTIFY messages into the local event bus.
+
+    Holds one connection with ``LISTEN`` for the lifetime of the worker and
+    reconnects when it is lost; events sent while disconnected are missed.
+    """
+
+    def __init__(self, bus: EventBus, bind: AsyncEngine, retry_seconds: float = 1.0):
+        self.bus = bus
+        self.bind = bind
+        self.retry_seconds = retry_seconds
+        self._task: Optional[asyncio.Task] = None
+
+    def _on_notify(self, connection, pid, channel, message) -> None:
+        try:
+            topic, payload = _decode(message)
+        except (ValueError, KeyError):
+            logger.warning("Ignoring malformed event on %s", channel)
+            return
+        self.bus.deliver(topic, payload)
+
+    async def _listen(self) -> None:
+        async with self.bind.connect() as connection:
+            raw = await connection.get_raw_connection()
+            # The asyncpg connection underneath SQLAlchemy's adapter
+            driver = raw.driver_connection
+            closed = asyncio.Event()
+            driver.add_termination_listener(lambda _: closed.set())
+            await driver.add_listener(NOTIFY_CHANNEL, self._on_notify)
+            try:
+                await closed.wait()
+            finally:
+                if not driver.is_closed():
+                    await driver.remove_listener(NOTIFY_CHANNEL, self._on_notify)
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await self._listen()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Event listener failed, reconnecting")
+            await asyncio.sleep(self.retry_seconds)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+event_bus = EventBus(settings.EVENTS_QUEUE_SIZE)
+event_listener = PostgresEventListener(event_bus, engine)
@@ -0,0 +1,204 @@
+import csv
+import io
+import json
+import zlib
+from datetime import date
+from enum import Enum
+from typing import Any, AsyncIterator, Optional, Sequence
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.security import get_bearer_token, get_current_user
+from app.crud import filter_bees, get_user_by_username
+from app.db import get_read_db, new_read_session
+from app.models import Bee, User
+
+router = APIRouter()
+
+EXPORT_COLUMNS = ("id", "name", "origin", "species", "captured_date", "image_path")
+
+
+class ExportFormat(str, Enum):
+    NDJSON = "ndjson"
+    CSV = "csv"
+    PARQUET = "parquet"
+
+
+MEDIA_TYPES = {
+    ExportFormat.NDJSON: "application/x-ndjson",
+    ExportFormat.CSV: "text/csv",
+    ExportFormat.PARQUET: "application/vnd.apache.parquet",
+}
+
+
+def accepts_gzip(accept_encoding: str) -> bool:
+    """Whether an Accept-Encoding header admits gzip.
+
+    Codings listed with ``q=0`` are refused; ``*`` stands for any coding not
+    listed explicitly.
+    """
+    qualities = {}
+    for item in accept_encoding.split(","):
+        coding, *params = [part.strip() for part in item.split(";")]
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding.lower()] = quality
+    for coding in ("gzip", "x-gzip", "*"):
+        if coding in qualities:
+            return qualities[coding] > 0
+    return False
+
+
+async def require_user(request: Request, db: AsyncSession = Depends(get_read_db)) -> User:
+    return await get_current_user(get_bearer_token(request), db, get_user_by_username)
+
+
+def _ndjson_chunk(rows: Sequence[Sequence[Any]]) -> bytes:
+    lines = (
+        json.dumps(dict(zip(EXPORT_COLUMNS, row)), default=date.isoformat)
+        for row in rows
+    )
+    return ("\n".join(lines) + "\n").encode()
+
+
+def _csv_chunk(rows: Sequence[Sequence[Any]], header: bool) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(EXPORT_COLUMNS)
+    writer.writerows(rows)
+    return buffer.getvalue().encode()
+
+
+class _ParquetEncoder:
+    """Writes each batch as a Parquet row group and hands back the new bytes."""
+
+    def __init__(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self._pa = pa
+        self._schema = pa.schema([
+            ("id", pa.int64()),
+            ("name", pa.string()),
+            ("origin", pa.string()),
+            ("species", pa.string()),
+            ("captured_date", pa.date32()),
+            ("image_path", pa.string()),
+        ])
+        self._buffer = io.BytesIO()
+        self._writer = pq.ParquetWriter(self._buffer, self._schema, compression="zstd")
+
+    def _drain(self) -> bytes:
+        data = self._buffer.getvalue()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return data
+
+    def encode(self, rows: Sequence[Sequence[Any]]) -> bytes:
+        columns = list(zip(*rows))
+        self._writer.write_table(self._pa.Table.from_arrays(
+            [self._pa.array(column, type=field.type) for column, field in zip(columns, self._schema)],
+            schema=self._schema,
+        ))
+        return self._drain()
+
+    def close(self) -> bytes:
+        self._writer.close()
+        return self._drain()
+
+
+async def stream_bees(
+    format: ExportFormat,
+    gzip: bool,
+    species: Optional[str] = None,
+    origin: Optional[str] = None,
+    captured_from: Optional[date] = None,
+    captured_to: Optional[date] = None,
+) -> AsyncIterator[bytes]:
+    """Yield the encoded export, one database batch at a time.
+
+    Rows come from a server-side cursor, so memory use depends on
+    EXPORT_BATCH_SIZE rather than on the size of the table. Encoding and
+    compression run in the threadpool.
+    """
+    compressor = zlib.compressobj(wbits=31) if gzip else None  # 31: gzip container
+    parquet = await run_in_threadpool(_ParquetEncoder) if format is ExportFormat.PARQUET else None
+
+    async def output(data: bytes) -> bytes:
+        if compressor is not None and data:
+            data = await run_in_threadpool(compressor.compress, data)
+        return data
+
+    query = filter_bees(
+        select(*(getattr(Bee, column) for column in EXPORT_COLUMNS)),
+        species, origin, captured_from, captured_to,
+    ).order_by(Bee.id)
+
+    # The request's session is gone once streaming starts: use our own
+    async with new_read_session() as session:
+        result = await session.stream(query.execution_options(yield_per=settings.EXPORT_BATCH_SIZE))
+        first = True
+        async for partition in result.partitions():
+            if parquet is not None:
+                data = await run_in_threadpool(parquet.encode, partition)
+            elif format is ExportFormat.CSV:
+                data = await run_in_threadpool(_csv_chunk, partition, first)
+            else:
+                data = await run_in_threadpool(_ndjson_chunk, partition)
+            first = False
+            if data := await output(data):
+                yield data
+
+    if format is ExportFormat.CSV and first:
+        yield await output(_csv_chunk([], header=True))
+    if parquet is not None:
+        if data := await output(await run_in_threadpool(parquet.close)):
+            yield data
+    if compressor is not None:
+        yield compressor.flush()
+
+
+@router.get("/export/bees")
+async def export_bees(
+    request: Request,
+    format: ExportFormat = ExportFormat.NDJSON,
+    species: Optional[str] = None,
+    origin: Optional[str] = None,
+    captured_from: Optional[date] = None,
+    captured_to: Optional[date] = None,
+    user: User = Depends(require_user),
+):
+    """Stream the (optionally filtered) bee catalogue as NDJSON, CSV or Parquet"""
+    if format is ExportFormat.PARQUET:
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise HTTPException(status_code=400, detail="Parquet export requires pyarrow to be installed")
+
+    # Parquet is compressed internally; other formats honour Accept-Encoding
+    headers = {"Content-Disposition": f'attachment; filename="bees.{format.value}"'}
+    gzip = False
+    if format is not ExportFormat.PARQUET:
+        gzip = accepts_gzip(request.headers.get("accept-encoding", ""))
+        headers["Vary"] = "Accept-Encoding"
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(
+        stream_bees(format, gzip, species, origin, captured_from, captured_to),
+        media_type=MEDIA_TYPES[format],
+        headers=headers,
+    )
@@ -0,0 +1,241 @@
+import json
+import time
+from collections import Counter
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+from fastapi import Request
+from graphql import FieldNode, GraphQLError, parse
+from graphql.utilities import get_operation_ast
+from strawberry.extensions import (MaxAliasesLimiter, QueryDepthLimiter,
+                                   SchemaExtension)
+from strawberry.schema.schema import validate_document
+from strawberry.types.graphql import OperationType
+
+from app.core.config import settings
+from app.cost import estimate_cost
+from app.db import READ_YOUR_WRITES_COOKIE
+from app.persisted_queries import persisted_queries, query_hash
+from app.rate_limit import Limit, client_key, retry_after_header, take_all
+
+
+class ReadYourWrites(SchemaExtension):
+    """Pin the client to the primary database for a moment after a mutation.
+
+    Replicas lag behind the primary, so without this a client could write a
+    bee and not find it in its very next query.
+    """
+
+    def on_execute(self):
+        execution_context = self.execution_context
+        yield
+        if not settings.READ_DATABASE_URL or execution_context.operation_type != OperationType.MUTATION:
+            return
+        response = execution_context.context.get("response")
+        if response is not None:
+            window = settings.READ_YOUR_WRITES_SECONDS
+            response.set_cookie(
+                READ_YOUR_WRITES_COOKIE,
+                str(time.time() + window),
+                max_age=window,
+                httponly=True,
+                samesite="lax",
+            )
+
+
+async def _request_extensions(request: Optional[Request]) -> Dict[str, Any]:
+    # Strawberry drops the "extensions" member of the request, so read it
+    # again; the body is cached on the request and only decoded twice for
+    # the rare requests that carry a persisted query
+    if not isinstance(request, Request):
+        # WebSocket operations carry no HTTP body or query string
+        return {}
+    if request.method == "GET":
+        raw = request.query_params.get("extensions")
+        try:
+            extensions = json.loads(raw) if raw else {}
+        except ValueError:
+            return {}
+    elif request.headers.get("content-type", "").startswith("application/json"):
+        body = await request.body()
+        if b"persistedQuery" not in body:
+            return {}
+        data = json.loads(body)
+        extensions = data.get("extensions") if isinstance(data, dict) else None
+    else:
+        return {}
+    return extensions if isinstance(extensions, dict) else {}
+
+
+def _persisted_query_error(message: str, code: str) -> GraphQLError:
+    return GraphQLError(message, extensions={"code": code})
+
+
+class PersistedQueries(SchemaExtension):
+    """Automatic persisted queries, following Apollo's protocol.
+
+    A client sends ``extensions.persistedQuery.sha256Hash`` without the
+    query text; when the hash is unknown it retries with both, which
+    registers the query. With ``PERSISTED_QUERIES_ONLY`` set, only queries
+    from the manifest file are executed and nothing can be registered.
+    """
+
+    async def on_operation(self):
+        execution_context = self.execution_context
+        extensions = await _request_extensions(execution_context.context.get("request"))
+        persisted = extensions.get("persistedQuery")
+        query = execution_context.query
+        sha256 = None
+
+        if persisted is not None:
+            if (
+                not isinstance(persisted, dict)
+                or persisted.get("version") != 1
+                or not isinstance(persisted.get("sha256Hash"), str)
+            ):
+                raise _persisted_query_error(
+                    "Unsupported persisted query", "PERSISTED_QUERY_NOT_SUPPORTED"
+                )
+            sha256 = persisted["sha256Hash"]
+            if query is None:
+                query = persisted_queries.get(sha256)
+            elif query_hash(query) != sha256:
+                raise _persisted_query_error(
+                    "Provided sha256Hash does not match the query", "PERSISTED_QUERY_HASH_MISMATCH"
+                )
+            elif not settings.PERSISTED_QUERIES_ONLY:
+                persisted_queries.register(sha256, query)
+        elif query is not None and settings.PERSISTED_QUERIES_ONLY:
+            sha256 = query_hash(query)
+
+        if settings.PERSISTED_QUERIES_ONLY:
+            if sha256 is not None and not persisted_queries.is_allowed(sha256):
+                raise _persisted_query_error(
+                    "PersistedQueryNotInList", "PERSISTED_QUERY_NOT_IN_LIST"
+                )
+        elif query is None and sha256 is not None:
+            raise _persisted_query_error("PersistedQueryNotFound", "PERSISTED_QUERY_NOT_FOUND")
+
+        execution_context.query = query
+        yield
+
+
+@lru_cache(maxsize=settings.GRAPHQL_DOCUMENT_CACHE_SIZE)
+def _parse_document(query: str, **options: Any):
+    return parse(query, **options)
+
+
+@lru_cache(maxsize=settings.GRAPHQL_DOCUMENT_CACHE_SIZE)
+def _validate_document(schema, document, rules) -> List[GraphQLError]:
+    return validate_document(schema, document, rules)
+
+
+class DocumentCache(SchemaExtension):
+    """Reuse parsed and validated documents across requests.
+
+    Parsed documents are cached by query text and validation results by
+    document, so a repeated query is parsed and validated once per process.
+    The caches are module level because extensions are created per request.
+    """
+
+    def on_parse(self):
+        execution_context = self.execution_context
+        execution_context.graphql_document = _parse_document(
+            execution_context.query, **execution_context.parse_options
+        )
+        yield
+
+    def on_validate(self):
+        execution_context = self.execution_context
+        execution_context.errors = list(
+            _validate_document(
+                execution_context.schema._schema,
+                execution_context.graphql_document,
+                execution_context.validation_rules,
+            )
+        )
+        yield
+
+
+def query_limits() -> List[SchemaExtension]:
+    """Depth and alias limits from the settings, as Strawberry's validation rules"""
+    return [
+        QueryDepthLimiter(max_depth=settings.MAX_QUERY_DEPTH),
+        MaxAliasesLimiter(max_alias_count=settings.MAX_QUERY_ALIASES),
+    ]
+
+
+class QueryCostLimit(SchemaExtension):
+    """Reject operations whose estimated cost exceeds ``MAX_QUERY_COST``.
+
+    The estimate runs on the validated document before any resolver, and
+    is left in the context as ``query_cost`` for rate limiting.
+    """
+
+    def on_execute(self):
+        execution_context = self.execution_context
+        cost = estimate_cost(
+            execution_context.schema._schema,
+            execution_context.graphql_document,
+            execution_context.operation_name,
+            execution_context.variables,
+        )
+        if cost > settings.MAX_QUERY_COST:
+            raise GraphQLError(
+                f"Query cost {cost} exceeds the limit of {settings.MAX_QUERY_COST}",
+                extensions={"code": "QUERY_TOO_COSTLY"},
+            )
+        execution_context.context["query_cost"] = cost
+        yield
+
+
+def _root_fields(execution_context) -> List[str]:
+    operation = get_operation_ast(
+        execution_context.graphql_document, execution_context.operation_name
+    )
+    if operation is None:
+        return []
+    return [
+        selection.name.value
+        for selection in operation.selection_set.selections
+        if isinstance(selection, FieldNode)
+    ]
+
+
+class RateLimits(SchemaExtension):
+    """Charge each operation's cost and root fields to the caller's buckets.
+
+    Runs after ``QueryCostLimit``, which computes the cost. Request counts per
+    IP and user are limited earlier, by ``RateLimitMiddleware``.
+    """
+
+    async def on_execute(self):
+        execution_context = self.execution_context
+        request = execution_context.context.get("request")
+        if settings.RATE_LIMIT_ENABLED and request is not None:
+            client = client_key(request)
+            hits = [
+                (
+                    f"cost:{client}",
+                    Limit(settings.RATE_LIMIT_COST_PER_MINUTE, settings.RATE_LIMIT_COST_BURST),
+                    # MAX_QUERY_COST may exceed the burst, which would never fit
+                    min(execution_context.context.get("query_cost", 1), settings.RATE_LIMIT_COST_BURST),
+                )
+            ]
+            # Aliased copies of a field each count against its limit
+            for name, count in Counter(_root_fields(execution_context)).items():
+                per_minute = settings.RATE_LIMIT_OPERATIONS.get(name)
+                if per_minute:
+                    hits.append((f"field:{name}:{client}", Limit(per_minute, per_minute), count))
+
+            retry_after = await take_all(hits)
+            if retry_after:
+                response = execution_context.context.get("response")
+                if response is not None:
+                    response.status_code = 429
+                    response.headers["Retry-After"] = retry_after_header(retry_after)
+                raise GraphQLError(
+                    "Too many requests",
+                    extensions={"code": "RATE_LIMITED", "retryAfter": retry_after_header(retry_after)},
+                )
+        yield
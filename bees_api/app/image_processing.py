@@ -0,0 +1,269 @@
+import asyncio
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from enum import Enum
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+from PIL import Image, ImageOps
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.cache import BEES_LIST, bee_entity, result_cache
+from app.cleanup import image_cleanup, referenced_image_paths
+from app.core.config import settings
+from app.events import BEE_IMAGE_HASHED, event_bus
+from app.jobs import PermanentJobError, job_queue, job_type
+from app.models import Bee
+from app.similarity import perceptual_hash
+from app.storage import image_key, image_path_for, image_storage
+
+logger = logging.getLogger(__name__)
+
+PROCESS_IMAGE = "process_image"
+
+# Bees read per query when queueing or hashing images in bulk
+REQUEUE_CHUNK_SIZE = 500
+
+
+class ImageStatus(Enum):
+    PENDING = "pending"  # Stored as uploaded, waiting to be processed
+    READY = "ready"
+    FAILED = "failed"  # Not a decodable image; the upload is kept as is
+
+
+class InvalidImageError(ValueError):
+    pass
+
+
+def normalize_image(source: str, destination: str, jpeg_quality: int) -> Tuple[str, str]:
+    """Validate an image and rewrite it in a normalized format without metadata.
+
+    Runs in a worker process. The EXIF orientation is applied to the pixels
+    before EXIF, comments and other metadata are dropped; only the colour
+    profile is kept. Images with transparency become PNG, everything else
+    JPEG. Returns the extension of the written file and the perceptual hash
+    of the image.
+    """
+    try:
+        with Image.open(source) as image:
+            image.verify()
+        with Image.open(source) as image:
+            image.load()
+            image = ImageOps.exif_transpose(image)
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError) as error:
+        raise InvalidImageError(f"Not a valid image: {error}") from error
+
+    icc_profile = image.info.get("icc_profile")
+    if image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info:
+        image, format, extension = image.convert("RGBA"), "PNG", ".png"
+    else:
+        image, format, extension = image.convert("RGB"), "JPEG", ".jpg"
+    image.info = {}
+    with open(destination, "wb") as buffer:
+        image.save(buffer, format=format, quality=jpeg_quality, optimize=True, icc_profile=icc_profile)
+    return extension, perceptual_hash(image)
+
+
+def hash_image(source: str) -> Optional[str]:
+    """Perceptual hash of a stored image, or None when it cannot be decoded.
+
+    Runs in a worker process.
+    """
+    try:
+        with Image.open(source) as image:
+            return perceptual_hash(ImageOps.exif_transpose(image))
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError):
+        return None
+
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=settings.JOBS_CONCURRENCY)
+    return _executor
+
+
+def _remove_quietly(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def add_image_processing(db: AsyncSession, bee_ids: Iterable[int]) -> List[int]:
+    """Queue processing of the images of bees in the caller's transaction.
+
+    Returns the bees the job backend could not queue transactionally; pass
+    them to ``enqueue_image_processing`` once the transaction has committed.
+    """
+    return [bee_id for bee_id in bee_ids if not job_queue.add(db, PROCESS_IMAGE, {"bee_id": bee_id})]
+
+
+async def enqueue_image_processing(bee_ids: Iterable[int]) -> None:
+    """Queue processing of the images of bees; call after they are committed"""
+    for bee_id in bee_ids:
+        await job_queue.enqueue(PROCESS_IMAGE, {"bee_id": bee_id})
+
+
+async def mark_image_failed(db: AsyncSession, payload: Dict[str, Any]) -> None:
+    bee_id = payload["bee_id"]
+    await db.execute(
+        update(Bee)
+        .where(Bee.id == bee_id, Bee.image_status == ImageStatus.PENDING.value)
+        .values(image_status=ImageStatus.FAILED.value)
+    )
+    await db.commit()
+    await result_cache.bump(BEES_LIST, bee_entity(bee_id))
+
+
+@job_type(PROCESS_IMAGE, fail=mark_image_failed)
+async def process_bee_image(db: AsyncSession, payload: Dict[str, Any]) -> None:
+    """Replace a bee's uploaded image with its normalized copy"""
+    bee_id = payload["bee_id"]
+    result = await db.execute(select(Bee.image_path, Bee.image_status).where(Bee.id == bee_id))
+    row = result.first()
+    if row is None or row.image_status != ImageStatus.PENDING.value or not row.image_path:
+        # Deleted meanwhile, or already handled by a duplicate job
+        return
+    source = row.image_path
+
+    temp_path = await run_in_threadpool(image_storage.create_temp_file)
+    try:
+        extension, phash = await asyncio.get_running_loop().run_in_executor(
+            _get_executor(),
+            normalize_image,
+            image_storage.path(image_key(source)),
+            temp_path,
+            settings.IMAGE_NORMALIZE_JPEG_QUALITY,
+        )
+    except BaseException as error:
+        await run_in_threadpool(_remove_quietly, temp_path)
+        if isinstance(error, InvalidImageError):
+            raise PermanentJobError(str(error)) from error
+        raise
+    stored = await image_storage.save_file(temp_path, f"image{extension}")
+    processed = image_path_for(stored.key)
+
+    # Only switch a bee that still points at the image we processed
+    result = await db.execute(
+        update(Bee)
+        .where(
+            Bee.id == bee_id,
+            Bee.image_path == source,
+            Bee.image_status == ImageStatus.PENDING.value,
+        )
+        .values(image_path=processed, image_status=ImageStatus.READY.value, image_phash=phash)
+    )
+    await db.commit()
+    await result_cache.bump(BEES_LIST, bee_entity(bee_id))
+    if result.rowcount:
+        await event_bus.publish(BEE_IMAGE_HASHED, [{"id": bee_id, "phash": phash}])
+
+    # The upload, or the processed copy when the bee went away meanwhile,
+    # may no longer be referenced by any bee
+    candidates = {source, processed}
+    orphaned = candidates - await referenced_image_paths(db, candidates)
+    image_cleanup.enqueue(image_key(image_path) for image_path in orphaned)
+
+
+async def hash_images(db: AsyncSession, chunk_size: int = REQUEUE_CHUNK_SIZE) -> int:
+    """Compute the perceptual hash of processed images that have none.
+
+    For images stored before hashing existed; returns how many were hashed.
+    """
+    count = 0
+    last_id = 0
+    loop = asyncio.get_running_loop()
+    while True:
+        result = await db.execute(
+            select(Bee.id, Bee.image_path)
+            .where(
+                Bee.image_status == ImageStatus.READY.value,
+                Bee.image_phash.is_(None),
+                Bee.id > last_id,
+            )
+            .order_by(Bee.id)
+            .limit(chunk_size)
+        )
+        rows = result.all()
+        if not rows:
+            return count
+        hashes = await asyncio.gather(*(
+            loop.run_in_executor(_get_executor(), hash_image, image_storage.path(image_key(row.image_path)))
+            for row in rows
+        ))
+        hashed = [
+            {"id": row.id, "phash": phash} for row, phash in zip(rows, hashes) if phash is not None
+        ]
+        if hashed:
+            # Bulk UPDATE by primary key, one executemany per chunk
+            await db.execute(
+                update(Bee), [{"id": values["id"], "image_phash": values["phash"]} for values in hashed]
+            )
+            await db.commit()
+            await event_bus.publish(BEE_IMAGE_HASHED, hashed)
+        count += len(hashed)
+        last_id = rows[-1].id
+
+
+async def requeue_pending_images(db: AsyncSession) -> int:
+    """Queue processing for every bee still waiting for it.
+
+    Jobs of the local backend do not survive a restart, and are dropped
+    when its queue is full; processing is idempotent, so queueing a bee
+    twice only costs a skipped job. Waits for room in the queue.
+    """
+    count = 0
+    last_id = 0
+    while True:
+        result = await db.execute(
+            select(Bee.id)
+            .where(Bee.image_status == ImageStatus.PENDING.value, Bee.id > last_id)
+            .order_by(Bee.id)
+            .limit(REQUEUE_CHUNK_SIZE)
+        )
+        bee_ids = result.scalars().all()
+        if not bee_ids:
+            return count
+        for bee_id in bee_ids:
+            await job_queue.put(PROCESS_IMAGE, {"bee_id": bee_id})
+        count += len(bee_ids)
+        last_id = bee_ids[-1]
+
+
+_requeue_task: Optional[asyncio.Task] = None
+
+
+async def _requeue() -> None:
+    try:
+        async with job_queue.session_factory() as db:
+            count = await requeue_pending_images(db)
+        if count:
+            logger.info("Queued %d pending images for processing", count)
+    except Exception:
+        logger.exception("Queueing pending images failed")
+
+
+def start_image_processing() -> None:
+    global _requeue_task
+    job_queue.start()
+    if settings.JOBS_BACKEND == "local":
+        # In the background: with a full queue this waits for the workers
+        _requeue_task = asyncio.create_task(_requeue())
+
+
+async def stop_image_processing() -> None:
+    global _executor, _requeue_task
+    if _requeue_task is not None:
+        _requeue_task.cancel()
+        await asyncio.gather(_requeue_task, return_exceptions=True)
+        _requeue_task = None
+    await job_queue.stop()
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -0,0 +1,144 @@
+import os
+import re
+import stat
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse
+from starlette.datastructures import Headers
+from starlette.types import Receive, Scope, Send
+
+from app.core.config import settings
+from app.storage import image_storage
+from app.variants import (VARIANT_MEDIA_TYPE, UndecodableImageError,
+                          variant_cache)
+
+router = APIRouter()
+
+# Keys written by the content-addressed store: ab/cd/<sha256>[.ext]
+_CONTENT_KEY_RE = re.compile(r"^[0-9a-f]{2}/[0-9a-f]{2}/([0-9a-f]{64})(\.[a-z0-9]+)?$")
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+class ImageResponse(FileResponse):
+    """FileResponse that hands whole-file bodies to the server when it can.
+
+    Servers advertising the ``http.response.pathsend`` ASGI extension send
+    the file themselves (with ``sendfile`` where available) instead of the
+    file being read into Python in chunks. Range requests and servers
+    without the extension use the regular streaming path.
+    """
+
+    chunk_size = 256 * 1024
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        extensions = scope.get("extensions") or {}
+        if (
+            "http.response.pathsend" not in extensions
+            or self.stat_result is None
+            or "range" in Headers(scope=scope)
+            or scope["method"].upper() == "HEAD"
+        ):
+            await super().__call__(scope, receive, send)
+            return
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        await send({"type": "http.response.pathsend", "path": os.fspath(self.path)})
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    # Weak comparison, as RFC 9110 requires for If-None-Match
+    if if_none_match.strip() == "*":
+        return True
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return etag in tags
+
+
+def _not_modified(request: Request, etag: str, stat_result: os.stat_result) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, etag)
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(stat_result.st_mtime) <= since
+    return False
+
+
+async def serve_file(
+    request: Request,
+    path: str,
+    etag: Optional[str] = None,
+    immutable: bool = False,
+    media_type: Optional[str] = None,
+) -> Response:
+    """Serve a file with validators, conditional requests and byte ranges.
+
+    ``etag`` should be derived from the content when it is known (content
+    addressed images); otherwise it falls back to the file's mtime and size.
+    Immutable files are cacheable forever, everything else is revalidated
+    after IMAGE_CACHE_MAX_AGE seconds.
+    """
+    try:
+        stat_result = await run_in_threadpool(os.stat, path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Image not found")
+    if not stat.S_ISREG(stat_result.st_mode):
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    if etag is None:
+        etag = f"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"
+    headers = {
+        "ETag": f'"{etag}"',
+        "Cache-Control": IMMUTABLE_CACHE_CONTROL if immutable else f"public, max-age={settings.IMAGE_CACHE_MAX_AGE}",
+    }
+
+    if _not_modified(request, headers["ETag"], stat_result):
+        return Response(status_code=304, headers=headers)
+    # FileResponse adds Last-Modified and handles Range / If-Range itself
+    return ImageResponse(path, headers=headers, media_type=media_type, stat_result=stat_result)
+
+
+@router.api_route("/images/{key:path}", methods=["GET", "HEAD"])
+async def get_image(key: str, request: Request):
+    """Serve an uploaded bee image"""
+    try:
+        path = image_storage.path(key)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Image not found")
+    # Content-addressed images never change, so their hash is a strong ETag
+    match = _CONTENT_KEY_RE.match(key)
+    return await serve_file(
+        request,
+        path,
+        etag=match.group(1) if match else None,
+        immutable=match is not None,
+    )
+
+
+@router.api_route("/image-variants/{width}/{key:path}", methods=["GET", "HEAD"])
+async def get_image_variant(width: int, key: str, request: Request):
+    """Serve a resized copy of an uploaded image, rendering it on first use"""
+    if width not in settings.IMAGE_VARIANT_WIDTHS:
+        raise HTTPException(status_code=404, detail="Unknown image width")
+    try:
+        if not await image_storage.exists(key):
+            raise HTTPException(status_code=404, detail="Image not found")
+        path = await variant_cache.get(key, width)
+    except UndecodableImageError:
+        raise HTTPException(status_code=422, detail="Image cannot be decoded")
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Image not found")
+    match = _CONTENT_KEY_RE.match(key)
+    return await serve_file(
+        request,
+        path,
+        etag=f"{match.group(1)}-w{width}" if match else None,
+        immutable=match is not None,
+        media_type=VARIANT_MEDIA_TYPE,
+    )
@@ -0,0 +1,149 @@
+import csv
+import io
+import json
+from dataclasses import dataclass, field
+from datetime import date
+from enum import Enum
+from itertools import islice
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple, Union
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.crud import create_bees
+
+REQUIRED_FIELDS = ("name", "origin", "species", "captured_date")
+
+
+class ImportFormat(Enum):
+    CSV = "csv"
+    NDJSON = "ndjson"
+
+
+@dataclass
+class ImportRowError:
+    batch: int
+    line: Optional[int]  # None when the whole batch failed
+    message: str
+
+
+@dataclass
+class ImportResult:
+    inserted: int = 0
+    failed: int = 0
+    errors: List[ImportRowError] = field(default_factory=list)
+
+    def add_error(self, error: ImportRowError) -> None:
+        # Keep the response bounded for very dirty files; counts stay exact
+        if len(self.errors) < settings.IMPORT_MAX_REPORTED_ERRORS:
+            self.errors.append(error)
+
+
+def guess_format(filename: Optional[str]) -> ImportFormat:
+    extension = (filename or "").rsplit(".", 1)[-1].lower()
+    if extension == "csv":
+        return ImportFormat.CSV
+    if extension in ("ndjson", "jsonl"):
+        return ImportFormat.NDJSON
+    raise ValueError("Cannot tell the import format from the file name, pass it explicitly")
+
+
+def read_records(
+    file: BinaryIO, format: ImportFormat
+) -> Iterator[Tuple[int, Union[Dict[str, Any], ValueError]]]:
+    """Lazily yield ``(line number, record)`` pairs from a binary file.
+
+    Records that cannot be decoded are yielded as a ``ValueError`` so they
+    are reported with the rest of the row errors.
+    """
+    text = io.TextIOWrapper(file, encoding="utf-8", newline="")
+    try:
+        if format is ImportFormat.CSV:
+            reader = csv.DictReader(text)
+            for record in reader:
+                yield reader.line_num, record
+            return
+
+        for line_number, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as exc:
+                yield line_number, ValueError(f"Invalid JSON: {exc.msg}")
+                continue
+            if not isinstance(record, dict):
+                yield line_number, ValueError("Expected a JSON object")
+                continue
+            yield line_number, record
+    finally:
+        # Leave closing the underlying file to its owner
+        text.detach()
+
+
+def validate_record(record: Dict[str, Any]) -> Dict[str, Any]:
+    """Turn a raw record into bee column values, or raise ``ValueError``."""
+    row = {}
+    for name in REQUIRED_FIELDS:
+        value = record.get(name)
+        value = value.strip() if isinstance(value, str) else value
+        if value in (None, ""):
+            raise ValueError(f"Missing {name}")
+        row[name] = value
+    for name in ("name", "origin", "species"):
+        if not isinstance(row[name], str):
+            raise ValueError(f"{name} must be a string")
+    try:
+        row["captured_date"] = date.fromisoformat(str(row["captured_date"]))
+    except ValueError:
+        raise ValueError(f"Invalid captured_date: {row['captured_date']}")
+    return row
+
+
+async def import_bees(
+    db: AsyncSession,
+    file: BinaryIO,
+    format: ImportFormat,
+    batch_size: Optional[int] = None,
+) -> ImportResult:
+    """Stream bees from a CSV or NDJSON file into the database in batches.
+
+    Parsing runs in the threadpool one batch at a time, so memory use is
+    bounded by the batch size. Invalid rows are skipped and reported; each
+    batch is committed on its own, so a failing batch does not undo the
+    batches before it.
+    """
+    batch_size = batch_size or settings.IMPORT_BATCH_SIZE
+    if batch_size < 1:
+        raise ValueError("batch_size must be positive")
+
+    result = ImportResult()
+    records = read_records(file, format)
+    batch_number = 0
+    while True:
+        batch = await run_in_threadpool(lambda: list(islice(records, batch_size)))
+        if not batch:
+            break
+        batch_number += 1
+
+        rows = []
+        for line, record in batch:
+            try:
+                if isinstance(record, ValueError):
+                    raise record
+                rows.append(validate_record(record))
+            except ValueError as exc:
+                result.failed += 1
+                result.add_error(ImportRowError(batch=batch_number, line=line, message=str(exc)))
+        if not rows:
+            continue
+
+        try:
+            result.inserted += len(await create_bees(db, rows))
+        except SQLAlchemyError as exc:
+            await db.rollback()
+            result.failed += len(rows)
+            result.add_error(ImportRowError(batch=batch_number, line=None, message=f"Batch failed: {exc.__class__.__name__}"))
+    return result
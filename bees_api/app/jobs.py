@@ -0,0 +1,307 @@
+import asyncio
+import json
+import logging
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db import async_session
+from app.models import Job
+
+logger = logging.getLogger(__name__)
+
+SessionFactory = Callable[[], AsyncSession]
+
+
+class PermanentJobError(Exception):
+    """Raised by a job for failures that retrying cannot fix"""
+
+
+@dataclass
+class JobType:
+    # Runs the job with a fresh session; raising retries it later
+    run: Callable[[AsyncSession, Dict[str, Any]], Awaitable[None]]
+    # Called once the job has failed for good
+    fail: Optional[Callable[[AsyncSession, Dict[str, Any]], Awaitable[None]]] = None
+
+
+JOB_TYPES: Dict[str, JobType] = {}
+
+
+def job_type(kind: str, fail=None):
+    """Register the decorated coroutine as the handler of ``kind`` jobs"""
+    def register(run):
+        JOB_TYPES[kind] = JobType(run, fail)
+        return run
+    return register
+
+
+class JobQueue(ABC):
+    """Runs registered jobs in the background with at most ``concurrency`` at once.
+
+    Failed jobs are retried with exponential backoff up to ``max_attempts``
+    times. Workers run only once ``start`` was called, normally by the
+    application's lifespan.
+    """
+
+    def __init__(
+        self,
+        concurrency: int,
+        max_attempts: int,
+        retry_seconds: float,
+        session_factory: SessionFactory = async_session,
+    ):
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.retry_seconds = retry_seconds
+        self.session_factory = session_factory
+        self._workers: List[asyncio.Task] = []
+
+    @abstractmethod
+    async def enqueue(self, kind: str, payload: Dict[str, Any]) -> None:
+        ...
+
+    def add(self, db: AsyncSession, kind: str, payload: Dict[str, Any]) -> bool:
+        """Queue a job as part of the caller's transaction.
+
+        The job then exists exactly when the transaction commits. Returns
+        False when the backend cannot do that; the caller must ``enqueue``
+        the job once the transaction has committed instead.
+        """
+        return False
+
+    async def put(self, kind: str, payload: Dict[str, Any]) -> None:
+        """Like ``enqueue``, but waits for room instead of dropping the job"""
+        await self.enqueue(kind, payload)
+
+    @abstractmethod
+    async def _work(self) -> None:
+        ...
+
+    def backoff(self, attempts: int) -> float:
+        return self.retry_seconds * 2 ** (attempts - 1)
+
+    async def execute(self, kind: str, payload: Dict[str, Any], attempts: int) -> Tuple[bool, Optional[str]]:
+        """Run one attempt of a job.
+
+        Returns whether to retry it, and the error when it failed.
+        """
+        job = JOB_TYPES.get(kind)
+        if job is None:
+            logger.error("No handler for %s jobs", kind)
+            return False, f"No handler for {kind} jobs"
+        try:
+            async with self.session_factory() as db:
+                await job.run(db, payload)
+            return False, None
+        except Exception as error:
+            if not isinstance(error, PermanentJobError) and attempts < self.max_attempts:
+                logger.warning("%s job failed (attempt %d), retrying", kind, attempts, exc_info=True)
+                return True, repr(error)
+            logger.exception("%s job failed for good after %d attempts", kind, attempts)
+            if job.fail is not None:
+                try:
+                    async with self.session_factory() as db:
+                        await job.fail(db, payload)
+                except Exception:
+                    logger.exception("Failure handler of a %s job failed", kind)
+            return False, repr(error)
+
+    def start(self) -> None:
+        if self._workers:
+            return
+        self._workers = [asyncio.create_task(self._work()) for _ in range(self.concurrency)]
+
+    async def stop(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+
+class LocalJobQueue(JobQueue):
+    """Jobs kept in the memory of this process.
+
+    Jobs still queued when the process stops, or that do not fit in a full
+    queue, are lost; their owners must be able to find and enqueue them
+    again on startup.
+    """
+
+    def __init__(self, *args: Any, maxsize: int = 0, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.maxsize = maxsize
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize)
+
+    async def enqueue(self, kind: str, payload: Dict[str, Any]) -> None:
+        # Never hold up the caller, typically a request, on a full queue
+        try:
+            self._queue.put_nowait((kind, payload, 1))
+        except asyncio.QueueFull:
+            logger.warning("Job queue is full, dropping %s job %r", kind, payload)
+
+    async def put(self, kind: str, payload: Dict[str, Any]) -> None:
+        await self._queue.put((kind, payload, 1))
+
+    async def _work(self) -> None:
+        while True:
+            kind, payload, attempts = await self._queue.get()
+            retry, _ = await self.execute(kind, payload, attempts)
+            if retry:
+                # The retry keeps the job unfinished, so join() waits for it
+                asyncio.create_task(self._retry(kind, payload, attempts))
+                continue
+            self._queue.task_done()
+
+    async def _retry(self, kind: str, payload: Dict[str, Any], attempts: int) -> None:
+        queue = self._queue
+        try:
+            await asyncio.sleep(self.backoff(attempts))
+            if queue is self._queue:
+                await queue.put((kind, payload, attempts + 1))
+        finally:
+            queue.task_done()
+
+    async def join(self) -> None:
+        """Wait until every queued job has succeeded or failed for good"""
+        await self._queue.join()
+
+    async def stop(self) -> None:
+        await super().stop()
+        # A queue is bound to the event loop it was used on
+        self._queue = asyncio.Queue(self.maxsize)
+
+
+class DatabaseJobQueue(JobQueue):
+    """Jobs stored in the ``job`` table, shared by every worker process.
+
+    Jobs survive restarts. Workers claim due jobs with
+    ``FOR UPDATE SKIP LOCKED``, so concurrent workers never wait on or run
+    the same job, and poll the table every ``poll_seconds`` when idle. A
+    claimed job is leased for ``lease_seconds`` and the lease is renewed
+    while it runs; a job whose worker died runs again once it expires.
+    """
+
+    def __init__(self, *args: Any, poll_seconds: float, lease_seconds: float, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.poll_seconds = poll_seconds
+        self.lease_seconds = lease_seconds
+        self._wakeup = asyncio.Event()
+
+    async def enqueue(self, kind: str, payload: Dict[str, Any]) -> None:
+        async with self.session_factory() as db:
+            self.add(db, kind, payload)
+            await db.commit()
+        self._wakeup.set()
+
+    def add(self, db: AsyncSession, kind: str, payload: Dict[str, Any]) -> bool:
+        db.add(Job(kind=kind, payload=json.dumps(payload), attempts=0, run_at=datetime.utcnow(), failed=False))
+        return True
+
+    async def claim(self) -> Optional[Tuple[int, str, Dict[str, Any], int]]:
+        """Take the next due job, leasing it to this worker"""
+        now = datetime.utcnow()
+        due = (
+            select(Job.id)
+            .where(Job.failed.is_(False), Job.run_at <= now)
+            .order_by(Job.run_at, Job.id)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+        async with self.session_factory() as db:
+            result = await db.execute(
+                update(Job)
+                .where(Job.id == due)
+                .values(attempts=Job.attempts + 1, run_at=now + timedelta(seconds=self.lease_seconds))
+                .returning(Job.id, Job.kind, Job.payload, Job.attempts)
+                .execution_options(synchronize_session=False)
+            )
+            row = result.first()
+            await db.commit()
+        if row is None:
+            return None
+        return row.id, row.kind, json.loads(row.payload), row.attempts
+
+    async def run_next(self) -> bool:
+        """Run one due job; returns False when there was none"""
+        claimed = await self.claim()
+        if claimed is None:
+            return False
+        job_id, kind, payload, attempts = claimed
+        heartbeat = asyncio.create_task(self._renew_lease(job_id, attempts))
+        try:
+            retry, error = await self.execute(kind, payload, attempts)
+        finally:
+            heartbeat.cancel()
+            await asyncio.gather(heartbeat, return_exceptions=True)
+        async with self.session_factory() as db:
+            if retry:
+                run_at = datetime.utcnow() + timedelta(seconds=self.backoff(attempts))
+                statement = update(Job).values(run_at=run_at, last_error=error)
+            elif error is not None:
+                statement = update(Job).values(failed=True, last_error=error)
+            else:
+                statement = delete(Job)
+            await db.execute(statement.where(Job.id == job_id))
+            await db.commit()
+        return True
+
+    async def _renew_lease(self, job_id: int, attempts: int) -> None:
+        """Keep extending the lease of a running job, so it is not claimed again"""
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                async with self.session_factory() as db:
+                    # Only while this attempt still holds the job
+                    await db.execute(
+                        update(Job)
+                        .where(Job.id == job_id, Job.attempts == attempts)
+                        .values(run_at=datetime.utcnow() + timedelta(seconds=self.lease_seconds))
+                    )
+                    await db.commit()
+            except Exception:
+                logger.warning("Renewing the lease of job %d failed", job_id, exc_info=True)
+
+    async def _work(self) -> None:
+        while True:
+            try:
+                if await self.run_next():
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Job worker failed")
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    async def stop(self) -> None:
+        await super().stop()
+        self._wakeup = asyncio.Event()
+
+
+def create_job_queue(backend: str) -> JobQueue:
+    options = dict(
+        concurrency=settings.JOBS_CONCURRENCY,
+        max_attempts=settings.JOBS_MAX_ATTEMPTS,
+        retry_seconds=settings.JOBS_RETRY_SECONDS,
+    )
+    if backend == "local":
+        return LocalJobQueue(**options, maxsize=settings.JOBS_QUEUE_SIZE)
+    if backend == "database":
+        return DatabaseJobQueue(
+            **options,
+            poll_seconds=settings.JOBS_POLL_SECONDS,
+            lease_seconds=settings.JOBS_LEASE_SECONDS,
+        )
+    raise ValueError(f"Unknown jobs backend: {backend}")
+
+
+job_queue = create_job_queue(settings.JOBS_BACKEND)
@@ -0,0 +1,47 @@
+from functools import partial
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from strawberry.dataloader import DataLoader
+
+from app.cache import bee_entity, result_cache
+from app.core.security import RequestAuth, auth_scope
+from app.crud import bee_values, get_bees_by_ids
+from app.db import reads_replica
+
+
+# Batch function: one query per batch, results returned in key order
+async def load_bees(
+    db: AsyncSession, auth: RequestAuth, bee_ids: List[int]
+) -> List[Optional[Dict[str, Any]]]:
+    # Serve what we can from the result cache, keyed on each bee's version
+    scope = auth_scope(await auth.get_user())
+    versions = await result_cache.versions([bee_entity(bee_id) for bee_id in bee_ids])
+    keys = [
+        result_cache.key("bee", bee_id, scope, version)
+        for bee_id, version in zip(bee_ids, versions)
+    ]
+    values = await result_cache.get_many(keys)
+
+    missing = [bee_id for bee_id, value in zip(bee_ids, values) if value is None]
+    if missing:
+        loaded = {bee.id: bee_values(bee) for bee in await get_bees_by_ids(db, missing)}
+        # A lagging replica may return rows older than the current versions
+        cacheable = not reads_replica(db)
+        for index, (bee_id, key) in enumerate(zip(bee_ids, keys)):
+            if values[index] is None and bee_id in loaded:
+                values[index] = loaded[bee_id]
+                if cacheable:
+                    await result_cache.set(key, values[index])
+    return values
+
+
+def create_loaders(db: AsyncSession, auth: RequestAuth) -> Dict[str, DataLoader]:
+    """Create the DataLoaders for a single request.
+
+    Loaders cache by key for their whole lifetime, so they must never be
+    shared between requests.
+    """
+    return {
+        "bee_loader": DataLoader(load_fn=partial(load_bees, db, auth)),
+    }
@@ -1,28 +1,67 @@
-import os
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
 from strawberry.fastapi import GraphQLRouter
 
+from app.cleanup import image_cleanup, image_sweeper
 from app.core.config import settings
+from app.db import get_pool_stats
+from app.events import event_listener
+from app.export import router as export_router
+from app.image_processing import (start_image_processing,
+                                  stop_image_processing)
+from app.image_routes import router as image_router
+from app.rate_limit import RateLimitMiddleware
 from app.schema import schema, get_context
+from app.variants import variant_cache
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if settings.EVENTS_BACKEND == "postgres":
+        event_listener.start()
+    image_cleanup.start()
+    image_sweeper.start()
+    start_image_processing()
+    yield
+    await stop_image_processing()
+    await image_sweeper.stop()
+    await image_cleanup.stop()
+    await event_listener.stop()
+    variant_cache.shutdown()
+
+
+class BeeGraphQLRouter(GraphQLRouter):
+    def should_render_graphql_ide(self, request) -> bool:
+        # GET requests for persisted queries carry a hash instead of a query
+        return (
+            super().should_render_graphql_ide(request)
+            and "extensions" not in request.query_params
+        )
+
 
 # Create the FastAPI application
-app = FastAPI(title=settings.PROJECT_NAME)
+app = FastAPI(title=settings.PROJECT_NAME, lifespan=lifespan)
+
+# Token-bucket limits per client IP and per user
+app.add_middleware(RateLimitMiddleware)
 
 # Create GraphQL router with our schema
-graphql_app = GraphQLRouter(
+graphql_app = BeeGraphQLRouter(
     schema,
     context_getter=get_context,
-    graphiql=True  # Enable GraphiQL web interface
+    graphiql=True,  # Enable GraphiQL web interface
+    multipart_uploads_enabled=True  # Needed for add_bee image uploads
 )
 
 # Add GraphQL endpoint
 app.include_router(graphql_app, prefix="/graphql")
 
-# Configure static file serving for bee images
-# Ensure the directory exists
-os.makedirs(settings.STATIC_FILES_DIR, exist_ok=True)
-app.mount("/images", StaticFiles(directory=settings.STATIC_FILES_DIR), name="images")
+# Bee images and their resized variants, with HTTP caching support
+app.include_router(image_router)
+
+# Streaming bulk export of the catalogue
+app.include_router(export_router)
 
 @app.get("/")
 async def root():
@@ -31,4 +70,9 @@ async def root():
         "message": "Bee API",
         "version": "1.0.0",
         "graphql_endpoint": "/graphql",
-    }
\ No newline at end of file
+    }
+
+@app.get("/health/db-pool")
+async def db_pool_health():
+    """Connection pool usage: checked-out connections, overflow and waits"""
+    return get_pool_stats()
@@ -1,5 +1,6 @@
 from datetime import date, datetime
-from sqlalchemy import Column, Integer, String, Date, Boolean
+from sqlalchemy import (Boolean, Column, Date, DateTime, Index, Integer, String,
+                        Text)
 from sqlalchemy.ext.declarative import declarative_base
 
 Base = declarative_base()
@@ -10,10 +11,55 @@ class Bee(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False)
     origin = Column(String, nullable=False)
-    image_path = Column(String, nullable=True)  # Store relative path like 'images/bee1.jpg'
+    image_path = Column(String, nullable=True, index=True)  # Store relative path like 'images/ab/cd/<sha256>.jpg'
+    image_status = Column(String, nullable=True)  # An ImageStatus value; NULL for bees without an image
+    image_phash = Column(String(16), nullable=True)  # Perceptual hash of the processed image, in hex
     species = Column(String, nullable=False)
     captured_date = Column(Date, nullable=False)
 
+    # Composite indexes backing keyset pagination ordered by (captured_date, id),
+    # optionally narrowed by an equality filter on species or origin
+    __table_args__ = (
+        Index("ix_bee_captured_date_id", "captured_date", "id"),
+        Index("ix_bee_species_captured_date_id", "species", "captured_date", "id"),
+        Index("ix_bee_origin_captured_date_id", "origin", "captured_date", "id"),
+    )
+
+class BeeDailyCount(Base):
+    """Number of bees per species, origin and capture day.
+
+    Maintained alongside every insert and delete of a bee, so aggregate
+    queries read this small table instead of scanning ``bee``.
+    """
+    __tablename__ = "bee_daily_count"
+
+    species = Column(String, primary_key=True)
+    origin = Column(String, primary_key=True)
+    captured_date = Column(Date, primary_key=True)
+    count = Column(Integer, nullable=False)
+
+class Job(Base):
+    """A background job, for the database-backed job queue.
+
+    Workers claim due jobs with ``FOR UPDATE SKIP LOCKED`` and keep pushing
+    ``run_at`` forward by a lease while running, so a job whose worker died
+    is picked up again once the lease expires. Finished jobs are deleted;
+    jobs that exhausted their attempts stay behind with ``failed`` set.
+    """
+    __tablename__ = "job"
+
+    id = Column(Integer, primary_key=True)
+    kind = Column(String, nullable=False)
+    payload = Column(Text, nullable=False)  # JSON
+    attempts = Column(Integer, nullable=False, default=0)
+    run_at = Column(DateTime, nullable=False)
+    failed = Column(Boolean, nullable=False, default=False)
+    last_error = Column(Text, nullable=True)
+
+    __table_args__ = (
+        Index("ix_job_failed_run_at", "failed", "run_at"),
+    )
+
 class User(Base):
     __tablename__ = "user"
 
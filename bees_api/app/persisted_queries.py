@@ -0,0 +1,55 @@
+import hashlib
+import json
+from typing import Dict, Optional
+
+from app.cache import LRUCache
+from app.core.config import settings
+
+
+def query_hash(query: str) -> str:
+    return hashlib.sha256(query.encode()).hexdigest()
+
+
+class PersistedQueryStore:
+    """Queries known by their sha256 hash.
+
+    Queries from the manifest file are pinned and form the allowlist;
+    queries registered by clients at runtime are kept in a bounded LRU, so a
+    client whose hash was evicted simply registers it again.
+    """
+
+    def __init__(self, maxsize: int, manifest: Optional[Dict[str, str]] = None):
+        self.pinned: Dict[str, str] = dict(manifest or {})
+        self.registered = LRUCache(maxsize, ttl=float("inf"))
+
+    def get(self, sha256: str) -> Optional[str]:
+        query = self.pinned.get(sha256)
+        if query is None:
+            query = self.registered.get(sha256)
+        return query
+
+    def is_allowed(self, sha256: str) -> bool:
+        return sha256 in self.pinned
+
+    def register(self, sha256: str, query: str) -> None:
+        if sha256 not in self.pinned:
+            self.registered.set(sha256, query)
+
+    def clear(self) -> None:
+        self.registered.clear()
+
+
+def load_manifest(path: str) -> Dict[str, str]:
+    """Read a ``{sha256: query}`` JSON file, checking every hash."""
+    with open(path, encoding="utf-8") as manifest_file:
+        manifest = json.load(manifest_file)
+    for sha256, query in manifest.items():
+        if query_hash(query) != sha256:
+            raise ValueError(f"Persisted query {sha256} does not match its hash")
+    return manifest
+
+
+persisted_queries = PersistedQueryStore(
+    settings.PERSISTED_QUERY_CACHE_SIZE,
+    load_manifest(settings.PERSISTED_QUERIES_FILE) if settings.PERSISTED_QUERIES_FILE else None,
+)
@@ -0,0 +1,228 @@
+import math
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from fastapi import Request, status
+from fastapi.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.core.config import settings
+from app.core.security import get_bearer_token, get_token_subject
+
+
+@dataclass(frozen=True)
+class Limit:
+    per_minute: float
+    burst: int
+
+    @property
+    def rate(self) -> float:
+        return self.per_minute / 60
+
+
+# (bucket key, limit, cost) charged for a request
+Hit = Tuple[str, Limit, float]
+
+
+def _merge_hits(hits: Iterable[Hit]) -> List[Hit]:
+    """Add up the costs of the hits on each key, keeping their first order"""
+    merged: Dict[str, Hit] = {}
+    for key, limit, cost in hits:
+        if key in merged:
+            cost += merged[key][2]
+        merged[key] = (key, limit, cost)
+    return list(merged.values())
+
+
+class RateLimitStore(ABC):
+    """Token buckets, refilled continuously at a limit's rate up to its burst."""
+
+    @abstractmethod
+    async def take_all(self, hits: Iterable[Hit]) -> float:
+        """Take each hit's cost from its bucket, all or nothing.
+
+        Hits on the same key are added up and charged to it once. Returns 0
+        when every bucket had the tokens, otherwise the number of seconds
+        until they all will; nothing is taken in that case, so a request
+        rejected by one bucket is not charged to the others. A cost above a
+        bucket's burst never fits.
+        """
+
+    async def take(self, key: str, limit: Limit, cost: float = 1) -> float:
+        return await self.take_all([(key, limit, cost)])
+
+    def clear(self) -> None:
+        pass
+
+
+class InMemoryRateLimitStore(RateLimitStore):
+    """Buckets of a single process.
+
+    The least recently used buckets are dropped beyond ``max_keys``, which
+    hands those clients a full bucket again.
+    """
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    async def take_all(self, hits: Iterable[Hit]) -> float:
+        now = time.monotonic()
+        # Refill and check every bucket before taking from any of them
+        refilled = []
+        retry_after = 0.0
+        for key, limit, cost in _merge_hits(hits):
+            tokens, updated = self._buckets.get(key, (limit.burst, now))
+            tokens = min(limit.burst, tokens + (now - updated) * limit.rate)
+            if tokens < cost:
+                retry_after = max(retry_after, (cost - tokens) / limit.rate)
+            refilled.append((key, tokens, cost))
+        for key, tokens, cost in refilled:
+            if not retry_after:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return retry_after
+
+    def clear(self) -> None:
+        self._buckets.clear()
+
+
+# Refill, check and take atomically on the Redis server, using its clock so
+# that workers with skewed clocks agree. ARGV holds rate, burst and cost for
+# each key in turn; the costs of a key passed more than once are added up
+_TAKE_ALL_SCRIPT = """
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local buckets = {}
+local order = {}
+for i, key in ipairs(KEYS) do
+    local cost = tonumber(ARGV[3 * i])
+    if buckets[key] then
+        buckets[key].cost = buckets[key].cost + cost
+    else
+        buckets[key] = {rate = tonumber(ARGV[3 * i - 2]), burst = tonumber(ARGV[3 * i - 1]), cost = cost}
+        table.insert(order, key)
+    end
+end
+local retry_after = 0
+for _, key in ipairs(order) do
+    local bucket = buckets[key]
+    local state = redis.call('HMGET', key, 'tokens', 'updated')
+    local tokens = tonumber(state[1]) or bucket.burst
+    local updated = tonumber(state[2]) or now
+    bucket.tokens = math.min(bucket.burst, tokens + math.max(0, now - updated) * bucket.rate)
+    if bucket.tokens < bucket.cost then
+        retry_after = math.max(retry_after, (bucket.cost - bucket.tokens) / bucket.rate)
+    end
+end
+for _, key in ipairs(order) do
+    local bucket = buckets[key]
+    if retry_after == 0 then
+        bucket.tokens = bucket.tokens - bucket.cost
+    end
+    redis.call('HSET', key, 'tokens', tostring(bucket.tokens), 'updated', tostring(now))
+    redis.call('EXPIRE', key, math.ceil(bucket.burst / bucket.rate) + 1)
+end
+return tostring(retry_after)
+"""
+
+
+class RedisRateLimitStore(RateLimitStore):
+    def __init__(self, url: str, namespace: str = "ratelimit"):
+        # Optional dependency, only needed when a Redis URL is configured
+        from redis import asyncio as redis
+
+        self._redis = redis.from_url(url)
+        self._take_all = self._redis.register_script(_TAKE_ALL_SCRIPT)
+        self.namespace = namespace
+
+    async def take_all(self, hits: Iterable[Hit]) -> float:
+        hits = list(hits)
+        if not hits:
+            return 0
+        retry_after = await self._take_all(
+            keys=[f"{self.namespace}:{key}" for key, _, _ in hits],
+            args=[value for _, limit, cost in hits for value in (limit.rate, limit.burst, cost)],
+        )
+        return float(retry_after)
+
+
+def create_rate_limit_store(url: Optional[str]) -> RateLimitStore:
+    if not url or url.startswith("memory://"):
+        return InMemoryRateLimitStore(settings.RATE_LIMIT_MAX_KEYS)
+    if url.startswith(("redis://", "rediss://")):
+        return RedisRateLimitStore(url)
+    raise ValueError(f"Unsupported rate limit store URL: {url}")
+
+
+rate_limit_store = create_rate_limit_store(settings.RATE_LIMIT_STORE_URL)
+
+
+def client_ip(request: Request) -> str:
+    # Behind a proxy, run uvicorn with --proxy-headers so this is the real client
+    return request.client.host if request.client else "unknown"
+
+
+def client_key(request: Request) -> str:
+    """Bucket key of the caller: its user when authenticated, else its IP"""
+    subject = get_token_subject(get_bearer_token(request))
+    return f"user:{subject}" if subject else f"ip:{client_ip(request)}"
+
+
+async def take_all(hits: Iterable[Hit]) -> float:
+    """Charge a request to all of its buckets, or to none when one is empty"""
+    return await rate_limit_store.take_all(hits)
+
+
+def retry_after_header(retry_after: float) -> str:
+    return str(max(1, math.ceil(retry_after)))
+
+
+class RateLimitMiddleware:
+    """Limit requests per client IP and, when a valid token is sent, per user.
+
+    A plain ASGI middleware so that streamed responses pass through untouched.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not settings.RATE_LIMIT_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        request = Request(scope)
+        hits = [
+            (
+                f"ip:{client_ip(request)}",
+                Limit(settings.RATE_LIMIT_IP_PER_MINUTE, settings.RATE_LIMIT_IP_BURST),
+                1,
+            )
+        ]
+        subject = get_token_subject(get_bearer_token(request))
+        if subject:
+            hits.append(
+                (
+                    f"user:{subject}",
+                    Limit(settings.RATE_LIMIT_USER_PER_MINUTE, settings.RATE_LIMIT_USER_BURST),
+                    1,
+                )
+            )
+
+        retry_after = await take_all(hits)
+        if retry_after:
+            response = JSONResponse(
+                {"detail": "Too many requests"},
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                headers={"Retry-After": retry_after_header(retry_after)},
+            )
+            await response(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
@@ -1,41 +1,154 @@
-import os
-from datetime import date, datetime
-from typing import List, Optional
+import base64
+import binascii
+from datetime import date
+from typing import Any, AsyncGenerator, Iterator, List, Mapping, Optional, Tuple
 
 import strawberry
 from fastapi import Depends, UploadFile
+from fastapi.requests import HTTPConnection
 from sqlalchemy.ext.asyncio import AsyncSession
 from strawberry.file_uploads import Upload
 from strawberry.types import Info
+from strawberry.types.nodes import SelectedField
 
+from app.cache import BEES_LIST, result_cache
 from app.core.config import settings
-from app.core.security import create_access_token, get_current_user
-from app.crud import (authenticate_user, create_bee, create_user, delete_bee,
-                    get_bee, get_bees, get_user_by_email,
-                    get_user_by_username)
-from app.db import get_db
-from app.models import Bee, User
+from app.core.security import (IsAuthenticated, RequestAuth, auth_scope,
+                               create_access_token)
+from app.crud import (BEE_COLUMNS, authenticate_user, bee_values, create_bee,
+                      create_bees, create_user, delete_bee, delete_bees,
+                      get_bee_rows, get_user_by_email, get_user_by_username,
+                      search_bee_rows)
+from app.db import get_db, get_read_db, reads_replica
+from app.events import BEE_ADDED, BEE_DELETED, event_bus
+from app.extensions import (DocumentCache, PersistedQueries, QueryCostLimit,
+                            RateLimits, ReadYourWrites, query_limits)
+from app.importer import (REQUIRED_FIELDS, ImportFormat, guess_format,
+                          import_bees, validate_record)
+from app.image_processing import ImageStatus
+from app.loaders import create_loaders
+from app.models import User
+from app.similarity import similarity_index
+from app.stats import DateBucket, StatsGroupBy, get_bee_stats
+from app.storage import image_key, image_path_for, image_storage
+from app.variants import variant_url
 
 
 # Context dependency
 async def get_context(
+    request: HTTPConnection,
     db: AsyncSession = Depends(get_db),
+    read_db: AsyncSession = Depends(get_read_db),
 ):
+    # Mutations write through "db"; queries read through "read_db", which is
+    # the replica when one is configured
+    auth = RequestAuth(request, read_db, get_user_by_username)
     return {
         "db": db,
+        "read_db": read_db,
+        "auth": auth,
+        **create_loaders(read_db, auth),
     }
 
 
 # GraphQL Types
+ImageStatusType = strawberry.enum(ImageStatus, name="ImageStatus")
+
+
 @strawberry.type
 class BeeType:
     id: int
     name: str
     origin: str
     image_path: Optional[str]
+    # Bees without an image have none
+    image_status: Optional[ImageStatusType]
     species: str
     captured_date: date
 
+    @strawberry.field
+    def thumbnail(self, width: int = 128) -> Optional[str]:
+        """URL of a resized copy of the image, at least ``width`` pixels wide when available"""
+        if not self.image_path:
+            return None
+        return variant_url(image_key(self.image_path), width)
+
+
+@strawberry.type
+class PageInfo:
+    has_next_page: bool
+    end_cursor: Optional[str]
+
+
+@strawberry.type
+class BeeEdge:
+    cursor: str
+    node: BeeType
+
+
+@strawberry.type
+class BeeConnection:
+    edges: List[BeeEdge]
+    page_info: PageInfo
+
+
+ImportFormatType = strawberry.enum(ImportFormat, name="ImportFormat")
+
+
+@strawberry.type
+class ImportErrorType:
+    batch: int
+    line: Optional[int]
+    message: str
+
+
+@strawberry.type
+class ImportResultType:
+    inserted: int
+    failed: int
+    errors: List[ImportErrorType]
+
+
+@strawberry.type
+class SimilarBeeType:
+    bee: BeeType
+    # Bits that differ between the perceptual hashes of the two images
+    distance: int
+
+
+@strawberry.input
+class BeeInput:
+    name: str
+    origin: str
+    species: str
+    captured_date: date
+
+
+@strawberry.type
+class AddBeeResultType:
+    # Exactly one of these is set, in the order of the input list
+    bee: Optional[BeeType]
+    error: Optional[str]
+
+
+@strawberry.type
+class DeleteBeeResultType:
+    id: int
+    deleted: bool
+
+
+StatsGroupByType = strawberry.enum(StatsGroupBy, name="StatsGroupBy")
+DateBucketType = strawberry.enum(DateBucket, name="DateBucket")
+
+
+@strawberry.type
+class BeeStatsType:
+    count: int
+    # Set only when grouped by the matching dimension or bucketed by date
+    species: Optional[str]
+    origin: Optional[str]
+    period: Optional[date]
+
 
 @strawberry.type
 class UserType:
@@ -51,63 +164,268 @@ class TokenType:
     token_type: str
 
 
+# Columns each BeeType field reads; fields missing here get every column
+BEE_FIELD_COLUMNS = {
+    "__typename": (),
+    "id": ("id",),
+    "name": ("name",),
+    "origin": ("origin",),
+    "imagePath": ("image_path",),
+    "imageStatus": ("image_status",),
+    "species": ("species",),
+    "capturedDate": ("captured_date",),
+    "thumbnail": ("image_path",),
+}
+
+
+def _fields(selections) -> Iterator[SelectedField]:
+    # Flatten fragments into the fields they select
+    for selection in selections:
+        if isinstance(selection, SelectedField):
+            yield selection
+        else:
+            yield from _fields(selection.selections)
+
+
+def _subfields(selections, name: str) -> Iterator[SelectedField]:
+    for field in _fields(selections):
+        if field.name == name:
+            yield from _fields(field.selections)
+
+
+def selected_bee_columns(info: Info) -> List[str]:
+    """Columns needed to resolve the nodes selected under a bee connection.
+
+    The keyset columns are always included since cursors are built from them.
+    """
+    columns = {"id", "captured_date"}
+    root_selections = [selection for field in info.selected_fields for selection in field.selections]
+    for field in _subfields(_subfields(root_selections, "edges"), "node"):
+        columns.update(BEE_FIELD_COLUMNS.get(field.name, BEE_COLUMNS))
+    return [column for column in BEE_COLUMNS if column in columns]
+
+
+def check_batch_size(items: List[Any]) -> None:
+    if len(items) > settings.MAX_BATCH_MUTATION_SIZE:
+        raise ValueError(f"At most {settings.MAX_BATCH_MUTATION_SIZE} items per batch")
+
+
+def bee_type_from_values(values: Mapping[str, Any]) -> BeeType:
+    # Columns that were not selected are never resolved, so None is safe
+    fields = dict.fromkeys(BEE_COLUMNS)
+    fields.update(values)
+    return BeeType(**fields)
+
+
+# Cursors are opaque to clients but encode the (captured_date, id) keyset position
+def encode_cursor(captured_date: date, bee_id: int) -> str:
+    raw = f"{captured_date.isoformat()}:{bee_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[date, int]:
+    try:
+        captured_date, bee_id = base64.urlsafe_b64decode(cursor.encode()).decode().split(":")
+        return date.fromisoformat(captured_date), int(bee_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError("Invalid cursor")
+
+
+# Ranked results have no stable key to continue from, so their cursors
+# encode an offset instead
+def encode_offset_cursor(offset: int) -> str:
+    return base64.urlsafe_b64encode(f"offset:{offset}".encode()).decode()
+
+
+def decode_offset_cursor(cursor: str) -> int:
+    try:
+        prefix, offset = base64.urlsafe_b64decode(cursor.encode()).decode().split(":")
+        if prefix != "offset" or int(offset) < 0:
+            raise ValueError
+        return int(offset)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError("Invalid cursor")
+
+
+def page_size(first: Optional[int]) -> int:
+    if first is None:
+        return settings.DEFAULT_PAGE_SIZE
+    if not 1 <= first <= settings.MAX_PAGE_SIZE:
+        raise ValueError(f"first must be between 1 and {settings.MAX_PAGE_SIZE}")
+    return first
+
+
+async def cache_read(info: Info, key: str, value: Any) -> None:
+    """Cache a result read through ``read_db``.
+
+    Results are keyed on versions that writes bump on commit; a lagging
+    replica may still return the data from before such a write, and would
+    pin it under the new version for every client. Only primary reads are
+    cached.
+    """
+    if not reads_replica(info.context["read_db"]):
+        await result_cache.set(key, value)
+
+
 # Queries
 @strawberry.type
 class Query:
-    @strawberry.field
-    async def bees(self, info: Info) -> List[BeeType]:
-        # Verify authentication
-        user = await get_current_user(
-            info.context["request"].headers.get("Authorization", "").replace("Bearer ", ""), 
-            info.context["db"],
-            get_user_by_username
+    @strawberry.field(permission_classes=[IsAuthenticated])
+    async def bees(
+        self,
+        info: Info,
+        first: Optional[int] = None,
+        after: Optional[str] = None,
+        species: Optional[str] = None,
+        origin: Optional[str] = None,
+        captured_from: Optional[date] = None,
+        captured_to: Optional[date] = None,
+    ) -> BeeConnection:
+        first = page_size(first)
+        columns = selected_bee_columns(info)
+        after_key = decode_cursor(after) if after else None
+        filters = dict(
+            species=species, origin=origin, captured_from=captured_from, captured_to=captured_to
         )
-        
-        # Get bees
-        db_bees = await get_bees(info.context["db"])
-        return [
-            BeeType(
-                id=bee.id,
-                name=bee.name,
-                origin=bee.origin,
-                image_path=bee.image_path,
-                species=bee.species,
-                captured_date=bee.captured_date,
+
+        # Pages are cached per argument set and auth scope; adding or deleting
+        # a bee bumps the list version, which retires every cached page
+        user = await info.context["auth"].get_user()
+        (version,) = await result_cache.versions([BEES_LIST])
+        cache_key = result_cache.key(
+            "bees", first, after_key, filters, columns, auth_scope(user), version
+        )
+        rows = await result_cache.get(cache_key)
+        if rows is None:
+            # Fetch one extra row to know whether another page follows, reading
+            # only the columns the selection needs
+            result = await get_bee_rows(
+                info.context["read_db"], columns, limit=first + 1, after=after_key, **filters
             )
-            for bee in db_bees
+            rows = [dict(row._mapping) for row in result]
+            await cache_read(info, cache_key, rows)
+
+        edges = [
+            BeeEdge(
+                cursor=encode_cursor(row["captured_date"], row["id"]),
+                node=bee_type_from_values(row),
+            )
+            for row in rows[:first]
         ]
+        return BeeConnection(
+            edges=edges,
+            page_info=PageInfo(
+                has_next_page=len(rows) > first,
+                end_cursor=edges[-1].cursor if edges else None,
+            ),
+        )
 
-    @strawberry.field
-    async def bee(self, info: Info, id: int) -> Optional[BeeType]:
-        # Verify authentication
-        user = await get_current_user(
-            info.context["request"].headers.get("Authorization", "").replace("Bearer ", ""), 
-            info.context["db"],
-            get_user_by_username
+    @strawberry.field(permission_classes=[IsAuthenticated])
+    async def search_bees(
+        self,
+        info: Info,
+        text: str,
+        first: Optional[int] = None,
+        after: Optional[str] = None,
+    ) -> BeeConnection:
+        """Bees whose name, species or origin match ``text``, best match first"""
+        first = page_size(first)
+        columns = selected_bee_columns(info)
+        offset = decode_offset_cursor(after) + 1 if after else 0
+
+        # Typeahead repeats the same prefixes, so results are cached like pages
+        user = await info.context["auth"].get_user()
+        (version,) = await result_cache.versions([BEES_LIST])
+        cache_key = result_cache.key(
+            "search_bees", text, first, offset, columns, auth_scope(user), version
         )
-        
-        # Get bee
-        db_bee = await get_bee(info.context["db"], id)
-        if not db_bee:
+        rows = await result_cache.get(cache_key)
+        if rows is None:
+            result = await search_bee_rows(
+                info.context["read_db"], text, columns, limit=first + 1, offset=offset
+            )
+            rows = [dict(row._mapping) for row in result]
+            await cache_read(info, cache_key, rows)
+
+        edges = [
+            BeeEdge(cursor=encode_offset_cursor(offset + index), node=bee_type_from_values(row))
+            for index, row in enumerate(rows[:first])
+        ]
+        return BeeConnection(
+            edges=edges,
+            page_info=PageInfo(
+                has_next_page=len(rows) > first,
+                end_cursor=edges[-1].cursor if edges else None,
+            ),
+        )
+
+    @strawberry.field(permission_classes=[IsAuthenticated])
+    async def bee_stats(
+        self,
+        info: Info,
+        group_by: Optional[List[StatsGroupByType]] = None,
+        bucket: Optional[DateBucketType] = None,
+        species: Optional[str] = None,
+        origin: Optional[str] = None,
+        captured_from: Optional[date] = None,
+        captured_to: Optional[date] = None,
+    ) -> List[BeeStatsType]:
+        """Bee counts, grouped by species and/or origin and bucketed by capture date"""
+        group_by = list(dict.fromkeys(group_by or []))
+        filters = dict(
+            species=species, origin=origin, captured_from=captured_from, captured_to=captured_to
+        )
+
+        user = await info.context["auth"].get_user()
+        (version,) = await result_cache.versions([BEES_LIST])
+        cache_key = result_cache.key(
+            "bee_stats",
+            [dimension.value for dimension in group_by],
+            bucket.value if bucket else None,
+            filters,
+            auth_scope(user),
+            version,
+        )
+        stats = await result_cache.get(cache_key)
+        if stats is None:
+            stats = await get_bee_stats(info.context["read_db"], group_by, bucket, **filters)
+            await cache_read(info, cache_key, stats)
+        return [BeeStatsType(**group) for group in stats]
+
+    @strawberry.field(permission_classes=[IsAuthenticated])
+    async def bee(self, info: Info, id: int) -> Optional[BeeType]:
+        # Get bee, batched with any other bee lookups of this request
+        values = await info.context["bee_loader"].load(id)
+        if not values:
             return None
         
-        return BeeType(
-            id=db_bee.id,
-            name=db_bee.name,
-            origin=db_bee.origin,
-            image_path=db_bee.image_path,
-            species=db_bee.species,
-            captured_date=db_bee.captured_date,
-        )
+        return bee_type_from_values(values)
+
+    @strawberry.field(permission_classes=[IsAuthenticated])
+    async def similar_bees(
+        self,
+        info: Info,
+        id: int,
+        max_distance: int = 8,
+        first: Optional[int] = None,
+    ) -> List[SimilarBeeType]:
+        # Near-duplicate images, found in the in-memory perceptual hash index
+        if not 0 <= max_distance <= settings.SIMILAR_BEES_MAX_DISTANCE:
+            raise ValueError(f"maxDistance must be between 0 and {settings.SIMILAR_BEES_MAX_DISTANCE}")
+        matches = (await similarity_index.similar(id, max_distance))[:page_size(first)]
+        
+        values = await info.context["bee_loader"].load_many([bee_id for bee_id, _ in matches])
+        return [
+            SimilarBeeType(bee=bee_type_from_values(bee), distance=distance)
+            for bee, (_, distance) in zip(values, matches)
+            # The index can briefly lag behind deletions
+            if bee
+        ]
 
     @strawberry.field
     async def me(self, info: Info) -> UserType:
         # Verify authentication
-        user = await get_current_user(
-            info.context["request"].headers.get("Authorization", "").replace("Bearer ", ""), 
-            info.context["db"],
-            get_user_by_username
-        )
+        user = await info.context["auth"].get_user()
         
         return UserType(
             id=user.id,
@@ -120,7 +438,9 @@ class Query:
 # Mutations
 @strawberry.type
 class Mutation:
-    @strawberry.mutation
+    # Mutations hash passwords or write rows and files, so they declare costs
+    # above the default for the query limits
+    @strawberry.mutation(metadata={"cost": 10})
     async def register(
         self, info: Info, username: str, email: str, password: str
     ) -> UserType:
@@ -145,7 +465,7 @@ class Mutation:
             is_active=db_user.is_active,
         )
 
-    @strawberry.mutation
+    @strawberry.mutation(metadata={"cost": 10})
     async def login(self, info: Info, username: str, password: str) -> TokenType:
         db = info.context["db"]
         
@@ -162,7 +482,7 @@ class Mutation:
             token_type="bearer",
         )
 
-    @strawberry.mutation
+    @strawberry.mutation(permission_classes=[IsAuthenticated], metadata={"cost": 10})
     async def add_bee(
         self,
         info: Info,
@@ -172,34 +492,15 @@ class Mutation:
         captured_date: date,
         image: Optional[Upload] = None,
     ) -> BeeType:
-        # Verify authentication
-        user = await get_current_user(
-            info.context["request"].headers.get("Authorization", "").replace("Bearer ", ""), 
-            info.context["db"],
-            get_user_by_username
-        )
-        
         # Handle image upload if provided
         image_path = None
         if image:
-            # Create upload directory if it doesn't exist
-            os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
-            
-            # Save the uploaded file
-            upload_file: UploadFile = await image.get_upload_file()
-            
-            # Create a unique filename using timestamp
-            timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-            filename = f"{timestamp}_{upload_file.filename}"
-            file_path = os.path.join(settings.UPLOAD_DIR, filename)
+            upload_file: UploadFile = image
             
-            # Write the file
-            with open(file_path, "wb") as buffer:
-                content = await upload_file.read()
-                buffer.write(content)
-            
-            # Store the relative path
-            image_path = f"images/{filename}"
+            # Stream the file into the content-addressed store; identical
+            # images share a single blob
+            stored = await image_storage.save(upload_file)
+            image_path = image_path_for(stored.key)
         
         # Create bee
         db_bee = await create_bee(
@@ -210,29 +511,119 @@ class Mutation:
             captured_date=captured_date,
             image_path=image_path,
         )
+        info.context["bee_loader"].prime(db_bee.id, bee_values(db_bee))
+        
+        return bee_type_from_values(bee_values(db_bee))
+
+    @strawberry.mutation(permission_classes=[IsAuthenticated], metadata={"cost": 100})
+    async def import_bees(
+        self,
+        info: Info,
+        file: Upload,
+        format: Optional[ImportFormatType] = None,
+        batch_size: Optional[int] = None,
+    ) -> ImportResultType:
+        upload_file: UploadFile = file
+        if format is None:
+            format = guess_format(upload_file.filename)
+        
+        # Stream the file into the database batch by batch
+        result = await import_bees(info.context["db"], upload_file.file, format, batch_size)
         
-        return BeeType(
-            id=db_bee.id,
-            name=db_bee.name,
-            origin=db_bee.origin,
-            image_path=db_bee.image_path,
-            species=db_bee.species,
-            captured_date=db_bee.captured_date,
+        return ImportResultType(
+            inserted=result.inserted,
+            failed=result.failed,
+            errors=[
+                ImportErrorType(batch=error.batch, line=error.line, message=error.message)
+                for error in result.errors
+            ],
         )
 
-    @strawberry.mutation
+    @strawberry.mutation(permission_classes=[IsAuthenticated], metadata={"cost": 10})
     async def delete_bee(self, info: Info, id: int) -> bool:
-        # Verify authentication
-        user = await get_current_user(
-            info.context["request"].headers.get("Authorization", "").replace("Bearer ", ""), 
-            info.context["db"],
-            get_user_by_username
-        )
-        
         # Delete bee
         success = await delete_bee(info.context["db"], id)
+        if success:
+            info.context["bee_loader"].prime(id, None, force=True)
         return success
 
+    @strawberry.mutation(permission_classes=[IsAuthenticated], metadata={"cost": 100})
+    async def add_bees(self, info: Info, bees: List[BeeInput]) -> List[AddBeeResultType]:
+        check_batch_size(bees)
+        
+        # Invalid items are reported in place; the rest go in one insert
+        results: List[AddBeeResultType] = []
+        rows = []
+        for bee in bees:
+            try:
+                row = validate_record(
+                    {column: getattr(bee, column) for column in REQUIRED_FIELDS}
+                )
+            except ValueError as error:
+                results.append(AddBeeResultType(bee=None, error=str(error)))
+                continue
+            results.append(AddBeeResultType(bee=None, error=None))
+            rows.append(row)
+        
+        bee_ids = await create_bees(info.context["db"], rows) if rows else []
+        created = iter(zip(bee_ids, rows))
+        for result in results:
+            if result.error is None:
+                bee_id, row = next(created)
+                values = {**row, "id": bee_id, "image_path": None, "image_status": None}
+                info.context["bee_loader"].prime(bee_id, values)
+                result.bee = bee_type_from_values(values)
+        return results
+
+    @strawberry.mutation(permission_classes=[IsAuthenticated], metadata={"cost": 100})
+    async def delete_bees(self, info: Info, ids: List[int]) -> List[DeleteBeeResultType]:
+        check_batch_size(ids)
+        
+        deleted = set(await delete_bees(info.context["db"], ids))
+        for bee_id in deleted:
+            info.context["bee_loader"].prime(bee_id, None, force=True)
+        return [DeleteBeeResultType(id=bee_id, deleted=bee_id in deleted) for bee_id in ids]
+
+
+# Subscriptions
+@strawberry.type
+class Subscription:
+    @strawberry.subscription(permission_classes=[IsAuthenticated])
+    async def bee_added(
+        self,
+        info: Info,
+        species: Optional[str] = None,
+        origin: Optional[str] = None,
+    ) -> AsyncGenerator[BeeType, None]:
+        # Subscriptions stay open for long; give the session's connection back
+        # to the pool now that the caller is authenticated
+        await info.context["read_db"].close()
+        async for values in event_bus.subscribe(BEE_ADDED):
+            if species is not None and values["species"] != species:
+                continue
+            if origin is not None and values["origin"] != origin:
+                continue
+            yield bee_type_from_values(values)
+
+    @strawberry.subscription(permission_classes=[IsAuthenticated])
+    async def bee_deleted(self, info: Info) -> AsyncGenerator[int, None]:
+        """Ids of deleted bees"""
+        await info.context["read_db"].close()
+        async for bee_id in event_bus.subscribe(BEE_DELETED):
+            yield bee_id
+
 
 # Create the schema
-schema = strawberry.Schema(query=Query, mutation=Mutation)
\ No newline at end of file
+schema = strawberry.Schema(
+    query=Query,
+    mutation=Mutation,
+    subscription=Subscription,
+    extensions=[
+        PersistedQueries,
+        DocumentCache,
+        *query_limits(),
+        QueryCostLimit,
+        RateLimits,
+        ReadYourWrites,
+    ],
+)
\ No newline at end of file
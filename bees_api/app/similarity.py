@@ -0,0 +1,227 @@
+import asyncio
+import math
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from PIL import Image
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db import new_read_session
+from app.events import BEE_DELETED, BEE_IMAGE_HASHED, event_bus
+from app.models import Bee
+
+# Hashes read per query when the index is loaded
+LOAD_CHUNK_SIZE = 5000
+
+_HASH_SIZE = 8
+_SAMPLE_SIZE = 32
+# DCT-II basis for the lowest frequencies of a 32 pixel row or column
+_COSINES = [
+    [math.cos(math.pi * (2 * x + 1) * u / (2 * _SAMPLE_SIZE)) for x in range(_SAMPLE_SIZE)]
+    for u in range(_HASH_SIZE)
+]
+
+
+def perceptual_hash(image: Image.Image) -> str:
+    """64-bit pHash of an image, as 16 hex digits.
+
+    The lowest 8x8 frequencies of the DCT of a 32x32 greyscale thumbnail,
+    each compared with their median. Recompressing, resizing or lightly
+    cropping an image changes only a few bits.
+    """
+    sample = image.convert("L").resize((_SAMPLE_SIZE, _SAMPLE_SIZE), Image.Resampling.LANCZOS)
+    pixels = sample.tobytes()
+    # Separable 2D DCT: transform the rows, then the columns of the result
+    rows = [
+        [
+            sum(pixels[y * _SAMPLE_SIZE + x] * cosine[x] for x in range(_SAMPLE_SIZE))
+            for cosine in _COSINES
+        ]
+        for y in range(_SAMPLE_SIZE)
+    ]
+    coefficients = [
+        sum(rows[y][u] * cosine[y] for y in range(_SAMPLE_SIZE))
+        for cosine in _COSINES
+        for u in range(_HASH_SIZE)
+    ]
+    median = sorted(coefficients)[len(coefficients) // 2]
+    value = 0
+    for coefficient in coefficients:
+        value = (value << 1) | (coefficient > median)
+    return f"{value:016x}"
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class _Node:
+    __slots__ = ("value", "items", "children")
+
+    def __init__(self, value: int):
+        self.value = value
+        self.items: Set[int] = set()
+        self.children: Dict[int, "_Node"] = {}
+
+
+class BKTree:
+    """Burkhard-Keller tree of 64-bit hashes under Hamming distance.
+
+    A search only descends into children whose distance to their parent is
+    within ``max_distance`` of the query's, so small radii visit a small
+    fraction of the tree. Removed items leave their node behind to route
+    searches; callers rebuild the tree once too many nodes are empty.
+    """
+
+    def __init__(self):
+        self._root: Optional[_Node] = None
+        self.empty_nodes = 0
+        self.nodes = 0
+
+    def add(self, value: int, item: int) -> None:
+        if self._root is None:
+            self._root = _Node(value)
+            self._root.items.add(item)
+            self.nodes += 1
+            return
+        node = self._root
+        while True:
+            distance = hamming_distance(value, node.value)
+            if distance == 0:
+                if not node.items:
+                    self.empty_nodes -= 1
+                node.items.add(item)
+                return
+            child = node.children.get(distance)
+            if child is None:
+                child = node.children[distance] = _Node(value)
+                child.items.add(item)
+                self.nodes += 1
+                return
+            node = child
+
+    def discard(self, value: int, item: int) -> None:
+        node = self._root
+        while node is not None:
+            distance = hamming_distance(value, node.value)
+            if distance == 0:
+                if item in node.items:
+                    node.items.discard(item)
+                    if not node.items:
+                        self.empty_nodes += 1
+                return
+            node = node.children.get(distance)
+
+    def search(self, value: int, max_distance: int) -> Iterator[Tuple[int, int]]:
+        """Yield ``(item, distance)`` for every item within ``max_distance``"""
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = hamming_distance(value, node.value)
+            if distance <= max_distance:
+                for item in node.items:
+                    yield item, distance
+            # Triangle inequality: matches below a child lie within this band
+            for child_distance, child in node.children.items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+
+
+class SimilarityIndex:
+    """In-memory BK-tree over the perceptual hashes of all bee images.
+
+    Loaded from the database on first use, then kept in sync by bee events:
+    hashes are added when an image is processed and removed when its bee is
+    deleted. With ``EVENTS_BACKEND=postgres`` every worker sees the events
+    of the others, so each keeps its own index current.
+    """
+
+    def __init__(self, session_factory: Callable[[], AsyncSession] = new_read_session):
+        self.session_factory = session_factory
+        self.clear()
+
+    def clear(self) -> None:
+        self._hashes: Dict[int, int] = {}
+        self._tree = BKTree()
+        self._loading: Optional[asyncio.Future] = None
+
+    def add(self, bee_id: int, phash: str) -> None:
+        value = int(phash, 16)
+        previous = self._hashes.get(bee_id)
+        if previous == value:
+            return
+        if previous is not None:
+            self._tree.discard(previous, bee_id)
+        self._hashes[bee_id] = value
+        self._tree.add(value, bee_id)
+
+    def discard(self, bee_id: int) -> None:
+        value = self._hashes.pop(bee_id, None)
+        if value is None:
+            return
+        self._tree.discard(value, bee_id)
+        # Empty nodes still cost search time; rebuild once they dominate
+        if self._tree.empty_nodes > max(self._tree.nodes // 2, 1000):
+            self._rebuild()
+
+    def _rebuild(self) -> None:
+        tree = BKTree()
+        for bee_id, value in self._hashes.items():
+            tree.add(value, bee_id)
+        self._tree = tree
+
+    async def _load(self) -> None:
+        last_id = 0
+        async with self.session_factory() as db:
+            while True:
+                result = await db.execute(
+                    select(Bee.id, Bee.image_phash)
+                    .where(Bee.image_phash.is_not(None), Bee.id > last_id)
+                    .order_by(Bee.id)
+                    .limit(LOAD_CHUNK_SIZE)
+                )
+                rows = result.all()
+                if not rows:
+                    return
+                for bee_id, phash in rows:
+                    # Events that arrived meanwhile are newer than the rows
+                    if bee_id not in self._hashes:
+                        self.add(bee_id, phash)
+                last_id = rows[-1].id
+
+    async def ensure_loaded(self) -> None:
+        # Concurrent first requests share a single load
+        if self._loading is None:
+            self._loading = asyncio.ensure_future(self._load())
+        loading = self._loading
+        try:
+            await asyncio.shield(loading)
+        except Exception:
+            if self._loading is loading:
+                self._loading = None
+            raise
+
+    async def similar(self, bee_id: int, max_distance: int) -> List[Tuple[int, int]]:
+        """``(bee id, distance)`` of other bees with a hash within ``max_distance``,
+        nearest first; empty when the bee has no hash"""
+        await self.ensure_loaded()
+        value = self._hashes.get(bee_id)
+        if value is None:
+            return []
+        matches = [
+            (other_id, distance)
+            for other_id, distance in self._tree.search(value, max_distance)
+            if other_id != bee_id
+        ]
+        return sorted(matches, key=lambda match: (match[1], match[0]))
+
+    def _on_image_hashed(self, payload) -> None:
+        self.add(payload["id"], payload["phash"])
+
+    def _on_bee_deleted(self, bee_id) -> None:
+        self.discard(bee_id)
+
+
+similarity_index = SimilarityIndex()
+event_bus.add_listener(BEE_IMAGE_HASHED, similarity_index._on_image_hashed)
+event_bus.add_listener(BEE_DELETED, similarity_index._on_bee_deleted)
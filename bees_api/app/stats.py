@@ -0,0 +1,126 @@
+from collections import Counter
+from datetime import date
+from enum import Enum
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import (Date, cast, delete, func, literal_column, select,
+                        tuple_, type_coerce)
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models import Bee, BeeDailyCount
+
+# (species, origin, captured_date) -> change in the number of bees
+CountKey = Tuple[str, str, date]
+
+
+class StatsGroupBy(Enum):
+    SPECIES = "species"
+    ORIGIN = "origin"
+
+
+class DateBucket(Enum):
+    DAY = "day"
+    MONTH = "month"
+    YEAR = "year"
+
+
+def _upsert(dialect: str):
+    if dialect == "postgresql":
+        return postgresql.insert(BeeDailyCount)
+    if dialect == "sqlite":
+        return sqlite.insert(BeeDailyCount)
+    raise ValueError(f"Unsupported database for bee stats: {dialect}")
+
+
+async def record_bee_counts(db: AsyncSession, changes: Iterable[Tuple[CountKey, int]]) -> None:
+    """Apply count changes to the summary table, inside the caller's transaction.
+
+    Call before committing the inserts or deletes the changes describe.
+    """
+    deltas = Counter()
+    for key, delta in changes:
+        deltas[key] += delta
+    # Rows are locked in key order, so concurrent batches touching the same
+    # days cannot deadlock on each other
+    rows = [
+        {"species": species, "origin": origin, "captured_date": captured_date, "count": delta}
+        for (species, origin, captured_date), delta in sorted(deltas.items())
+        if delta
+    ]
+    if not rows:
+        return
+
+    statement = _upsert(db.bind.dialect.name).values(rows)
+    await db.execute(
+        statement.on_conflict_do_update(
+            index_elements=["species", "origin", "captured_date"],
+            set_={"count": BeeDailyCount.count + statement.excluded.count},
+        )
+    )
+    # Drop the days that just lost their last bee, looked up by key
+    decremented = [
+        (row["species"], row["origin"], row["captured_date"]) for row in rows if row["count"] < 0
+    ]
+    if decremented:
+        await db.execute(
+            delete(BeeDailyCount).where(
+                tuple_(BeeDailyCount.species, BeeDailyCount.origin, BeeDailyCount.captured_date).in_(decremented),
+                BeeDailyCount.count <= 0,
+            )
+        )
+
+
+def _date_bucket(column, bucket: DateBucket, dialect: str):
+    if bucket is DateBucket.DAY:
+        return column
+    if dialect == "postgresql":
+        return cast(func.date_trunc(bucket.value, column), Date)
+    # SQLite returns the bucket as text; typing it as a date converts it back
+    return type_coerce(func.date(column, literal_column(f"'start of {bucket.value}'")), Date)
+
+
+async def get_bee_stats(
+    db: AsyncSession,
+    group_by: List[StatsGroupBy],
+    bucket: Optional[DateBucket] = None,
+    species: Optional[str] = None,
+    origin: Optional[str] = None,
+    captured_from: Optional[date] = None,
+    captured_to: Optional[date] = None,
+) -> List[Dict[str, Any]]:
+    """Count bees with SQL ``GROUP BY``, per species and/or origin and date bucket.
+
+    Reads the ``bee_daily_count`` summary when ``BEE_STATS_USE_SUMMARY`` is
+    set, otherwise the ``bee`` table itself. Returns one dict per group with
+    the grouped values under ``species``, ``origin`` and ``period``.
+    """
+    table = BeeDailyCount if settings.BEE_STATS_USE_SUMMARY else Bee
+    count = func.sum(BeeDailyCount.count) if table is BeeDailyCount else func.count()
+    dialect = db.bind.dialect.name
+
+    groups = [getattr(table, dimension.value).label(dimension.value) for dimension in group_by]
+    if bucket is not None:
+        groups.append(_date_bucket(table.captured_date, bucket, dialect).label("period"))
+
+    query = select(*groups, count.label("count")).select_from(table)
+    if species is not None:
+        query = query.where(table.species == species)
+    if origin is not None:
+        query = query.where(table.origin == origin)
+    if captured_from is not None:
+        query = query.where(table.captured_date >= captured_from)
+    if captured_to is not None:
+        query = query.where(table.captured_date <= captured_to)
+    if groups:
+        query = query.group_by(*groups).order_by(*groups)
+
+    result = await db.execute(query)
+    stats = []
+    for row in result.mappings():
+        group = dict.fromkeys(("species", "origin", "period"))
+        group.update(row)
+        group["count"] = group["count"] or 0
+        stats.append(group)
+    return stats
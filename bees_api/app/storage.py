@@ -0,0 +1,252 @@
+import hashlib
+import os
+import re
+import tempfile
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Iterator, Optional, Tuple
+
+from fastapi import UploadFile
+from fastapi.concurrency import run_in_threadpool
+
+from app.core.config import settings
+
+# Image paths stored on bees are the storage key under this URL prefix
+IMAGE_PATH_PREFIX = "images/"
+
+_EXTENSION_RE = re.compile(r"^\.[a-z0-9]{1,10}$")
+
+
+@dataclass
+class StoredImage:
+    key: str
+    size: int
+    sha256: str
+    created: bool  # False when identical content was already stored
+
+
+@dataclass
+class ScannedImage:
+    key: str
+    modified: float  # Timestamp of the last modification
+    size: int
+
+
+def image_key(image_path: str) -> str:
+    """Map a bee's ``image_path`` to its storage key."""
+    return image_path[len(IMAGE_PATH_PREFIX):] if image_path.startswith(IMAGE_PATH_PREFIX) else image_path
+
+
+def image_path_for(key: str) -> str:
+    return f"{IMAGE_PATH_PREFIX}{key}"
+
+
+def content_key(sha256: str, filename: Optional[str]) -> str:
+    """Content-addressed key, sharded so no directory grows unbounded.
+
+    The extension of the original filename is kept so the file is served
+    with the right media type.
+    """
+    extension = os.path.splitext(filename or "")[1].lower()
+    if not _EXTENSION_RE.match(extension):
+        extension = ""
+    return f"{sha256[:2]}/{sha256[2:4]}/{sha256}{extension}"
+
+
+class ImageStorage(ABC):
+    """Storage backend for bee images, addressed by SHA-256 of their content.
+
+    Saving identical content twice yields the same key, so callers must only
+    delete a key once no bee references it any more.
+    """
+
+    @abstractmethod
+    def path(self, key: str) -> str:
+        """Local filesystem path holding the image for ``key``."""
+
+    @abstractmethod
+    async def save(self, upload_file: UploadFile) -> StoredImage:
+        ...
+
+    @abstractmethod
+    def create_temp_file(self) -> str:
+        """Create an empty hidden file next to the store, to be filled and
+        moved in with ``save_file``. Blocking."""
+
+    @abstractmethod
+    async def save_file(self, temp_path: str, filename: Optional[str]) -> StoredImage:
+        """Move a finished file from ``create_temp_file`` into the store."""
+
+    @abstractmethod
+    async def delete(self, key: str) -> None:
+        ...
+
+    @abstractmethod
+    async def exists(self, key: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def modified(self, key: str) -> Optional[float]:
+        """Timestamp of the last modification of ``key``, None when absent."""
+
+    @abstractmethod
+    def scan(self) -> Iterator[ScannedImage]:
+        """Yield every stored image.
+
+        Blocking and lazy: consume it in a worker thread, a slice at a time.
+        """
+
+
+def _write_chunk(buffer, digest, chunk: bytes) -> None:
+    # hashlib releases the GIL for large buffers, so hashing rides along
+    # with the write in the worker thread
+    digest.update(chunk)
+    buffer.write(chunk)
+
+
+def _hash_file(path: str) -> Tuple[str, int]:
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as file:
+        while chunk := file.read(settings.UPLOAD_CHUNK_SIZE):
+            digest.update(chunk)
+            size += len(chunk)
+    return digest.hexdigest(), size
+
+
+def _remove_quietly(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _place(temp_path: str, destination: str) -> bool:
+    # Identical content is already stored: keep the existing blob, but mark
+    # it as fresh so neither the cleanup queue nor the orphan sweeper removes
+    # it while the new bee referencing it commits
+    if os.path.exists(destination):
+        try:
+            os.utime(destination)
+        except FileNotFoundError:
+            # Removed since the check: store this copy after all
+            pass
+        else:
+            os.remove(temp_path)
+            return False
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    os.replace(temp_path, destination)
+    return True
+
+
+class LocalImageStorage(ImageStorage):
+    """Stores images under a local directory, sharded by content hash."""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def path(self, key: str) -> str:
+        # Keys come from URLs too: never resolve outside the storage root
+        normalized = os.path.normpath(key)
+        if os.path.isabs(normalized) or normalized.split(os.sep)[0] in ("..", "."):
+            raise ValueError(f"Invalid image key: {key}")
+        return os.path.join(self.root, normalized)
+
+    async def save(
+        self,
+        upload_file: UploadFile,
+        max_size: Optional[int] = None,
+        chunk_size: Optional[int] = None,
+    ) -> StoredImage:
+        """Stream an upload into the store without blocking the event loop.
+
+        The file is copied chunk by chunk into a temporary file, hashed on
+        the fly and atomically renamed to its content-addressed location, so
+        readers never see a partial image and memory use does not depend on
+        the upload size. Raises ``ValueError`` once more than ``max_size``
+        bytes have been received.
+        """
+        max_size = max_size or settings.MAX_UPLOAD_SIZE
+        chunk_size = chunk_size or settings.UPLOAD_CHUNK_SIZE
+
+        await run_in_threadpool(os.makedirs, self.root, exist_ok=True)
+        fd, temp_path = await run_in_threadpool(
+            tempfile.mkstemp, dir=self.root, prefix=".upload-", suffix=".tmp"
+        )
+
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with os.fdopen(fd, "wb") as buffer:
+                while chunk := await upload_file.read(chunk_size):
+                    size += len(chunk)
+                    if size > max_size:
+                        raise ValueError(f"Image exceeds the maximum size of {max_size} bytes")
+                    await run_in_threadpool(_write_chunk, buffer, digest, chunk)
+            sha256 = digest.hexdigest()
+            key = content_key(sha256, upload_file.filename)
+            created = await run_in_threadpool(_place, temp_path, self.path(key))
+        except BaseException:
+            await run_in_threadpool(_remove_quietly, temp_path)
+            raise
+
+        return StoredImage(key=key, size=size, sha256=sha256, created=created)
+
+    def create_temp_file(self) -> str:
+        os.makedirs(self.root, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=self.root, prefix=".upload-", suffix=".tmp")
+        os.close(fd)
+        return temp_path
+
+    async def save_file(self, temp_path: str, filename: Optional[str]) -> StoredImage:
+        try:
+            sha256, size = await run_in_threadpool(_hash_file, temp_path)
+            key = content_key(sha256, filename)
+            created = await run_in_threadpool(_place, temp_path, self.path(key))
+        except BaseException:
+            await run_in_threadpool(_remove_quietly, temp_path)
+            raise
+        return StoredImage(key=key, size=size, sha256=sha256, created=created)
+
+    async def delete(self, key: str) -> None:
+        await run_in_threadpool(_remove_quietly, self.path(key))
+
+    async def exists(self, key: str) -> bool:
+        return await run_in_threadpool(os.path.exists, self.path(key))
+
+    async def modified(self, key: str) -> Optional[float]:
+        try:
+            return await run_in_threadpool(os.path.getmtime, self.path(key))
+        except FileNotFoundError:
+            return None
+
+    def scan(self) -> Iterator[ScannedImage]:
+        yield from _scan_directory(self.root, "")
+
+
+def _scan_directory(directory: str, prefix: str) -> Iterator[ScannedImage]:
+    # os.scandir streams entries, so huge directories are never held in
+    # memory, and tells files from directories without an extra stat
+    try:
+        entries = os.scandir(directory)
+    except FileNotFoundError:
+        return
+    with entries:
+        for entry in entries:
+            # In-progress uploads are hidden temporary files
+            if entry.name.startswith("."):
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                yield from _scan_directory(entry.path, f"{prefix}{entry.name}/")
+            elif entry.is_file(follow_symlinks=False):
+                stat = entry.stat(follow_symlinks=False)
+                yield ScannedImage(f"{prefix}{entry.name}", stat.st_mtime, stat.st_size)
+
+
+def create_image_storage() -> ImageStorage:
+    if settings.IMAGE_STORAGE_BACKEND == "local":
+        return LocalImageStorage(settings.UPLOAD_DIR)
+    raise ValueError(f"Unknown image storage backend: {settings.IMAGE_STORAGE_BACKEND}")
+
+
+image_storage = create_image_storage()
@@ -0,0 +1,170 @@
+import asyncio
+import os
+import tempfile
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from PIL import Image, ImageOps
+
+from app.core.config import settings
+from app.storage import image_storage
+
+VARIANT_MEDIA_TYPE = "image/jpeg"
+
+
+def snap_width(width: int) -> int:
+    """Round a requested width up to the nearest width we generate.
+
+    Only a fixed set of widths is rendered, so clients cannot fill the cache
+    with arbitrary sizes.
+    """
+    widths = sorted(settings.IMAGE_VARIANT_WIDTHS)
+    return next((allowed for allowed in widths if allowed >= width), widths[-1])
+
+
+def variant_url(key: str, width: int) -> str:
+    return f"/image-variants/{snap_width(width)}/{key}"
+
+
+class UndecodableImageError(ValueError):
+    pass
+
+
+def render_variant(source: str, destination: str, width: int) -> int:
+    """Resize ``source`` to ``width`` pixels wide and write it as a JPEG.
+
+    Runs in a worker process. Returns the size of the written file; raises
+    ``UndecodableImageError`` when the source is missing, truncated or not
+    an image.
+    """
+    try:
+        with Image.open(source) as image:
+            # Returns a loaded copy, so the source can be closed
+            image = ImageOps.exif_transpose(image)
+        if image.width > width:
+            height = max(1, round(image.height * width / image.width))
+            image = image.resize((width, height), Image.Resampling.LANCZOS)
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError) as error:
+        raise UndecodableImageError(f"Cannot decode {source}: {error}") from error
+
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(destination), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as buffer:
+            image.save(buffer, format="JPEG", quality=85, optimize=True)
+        os.replace(temp_path, destination)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    return os.path.getsize(destination)
+
+
+def _scan(root: str) -> "OrderedDict[str, int]":
+    # Least recently used first, using access time as the recency signal
+    entries = []
+    for directory, _, filenames in os.walk(root):
+        for filename in filenames:
+            if filename.endswith(".tmp"):
+                continue
+            path = os.path.join(directory, filename)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((max(stat.st_atime, stat.st_mtime), path, stat.st_size))
+    entries.sort()
+    return OrderedDict((path, size) for _, path, size in entries)
+
+
+def _remove_files(paths) -> None:
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+class VariantCache:
+    """On-disk cache of resized images, bounded in total size with LRU eviction.
+
+    Variants are rendered lazily in a process pool, and concurrent requests
+    for the same variant share a single render.
+    """
+
+    def __init__(self, root: str, max_bytes: int, workers: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.workers = workers
+        self._entries: Optional["OrderedDict[str, int]"] = None
+        self._size = 0
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def path(self, key: str, width: int) -> str:
+        return os.path.join(self.root, str(width), f"{os.path.splitext(key)[0]}.jpg")
+
+    async def get(self, key: str, width: int) -> str:
+        """Return the path of the ``width`` variant of ``key``, rendering it if needed."""
+        await self._load()
+        path = self.path(key, width)
+        if path in self._entries and await run_in_threadpool(os.path.exists, path):
+            self._entries.move_to_end(path)
+            return path
+
+        pending = self._pending.get(path)
+        if pending is None:
+            pending = asyncio.ensure_future(self._render(key, width, path))
+            self._pending[path] = pending
+            pending.add_done_callback(lambda _: self._pending.pop(path, None))
+        # Shield the shared render from a single cancelled request
+        await asyncio.shield(pending)
+        return path
+
+    async def _render(self, key: str, width: int, path: str) -> None:
+        loop = asyncio.get_running_loop()
+        size = await loop.run_in_executor(
+            self._get_executor(), render_variant, image_storage.path(key), path, width
+        )
+        self._size -= self._entries.pop(path, 0)
+        self._entries[path] = size
+        self._size += size
+        await self._evict()
+
+    async def _evict(self) -> None:
+        evicted = []
+        while self._size > self.max_bytes and len(self._entries) > 1:
+            path, size = self._entries.popitem(last=False)
+            self._size -= size
+            evicted.append(path)
+        if evicted:
+            await run_in_threadpool(_remove_files, evicted)
+
+    async def _load(self) -> None:
+        # Index whatever an earlier process left on disk, once
+        if self._entries is None:
+            entries = await run_in_threadpool(_scan, self.root)
+            if self._entries is None:
+                self._entries = entries
+                self._size = sum(entries.values())
+                await self._evict()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+variant_cache = VariantCache(
+    settings.IMAGE_VARIANT_CACHE_DIR,
+    settings.IMAGE_VARIANT_CACHE_MAX_BYTES,
+    settings.IMAGE_VARIANT_WORKERS,
+)
@@ -1,19 +1,27 @@
 import asyncio
 import os
-from typing import AsyncGenerator, Generator
+from typing import Any, AsyncGenerator, Generator, List, Tuple
 
 import pytest
 import pytest_asyncio
 from fastapi import FastAPI
 from httpx import AsyncClient
-from sqlalchemy import text
+from sqlalchemy import event, text
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 
+from app.cache import result_cache
+from app.cleanup import image_cleanup
+from app.image_processing import stop_image_processing
+from app.jobs import job_queue
 from app.core.config import settings
-from app.core.security import get_password_hash
+from app.core.security import get_password_hash, user_cache
 from app.db import get_db
 from app.models import Base, User
+from app.persisted_queries import persisted_queries
+from app.rate_limit import rate_limit_store
+from app.similarity import similarity_index
+from app.storage import image_storage
 
 # Use an in-memory SQLite database for testing
 TEST_DATABASE_URL = "sqlite+aiosqlite:///:memory:"
@@ -41,6 +49,39 @@ async def async_client(app: FastAPI) -> AsyncGenerator[AsyncClient, None]:
         yield client
 
 
+# Cached users, results, registered queries, rate limit buckets and indexed
+# hashes must not leak between tests that reuse usernames, bee ids and the
+# client address
+@pytest.fixture(autouse=True)
+def clear_caches() -> Generator:
+    user_cache.clear()
+    result_cache.clear()
+    persisted_queries.clear()
+    rate_limit_store.clear()
+    similarity_index.clear()
+    yield
+    user_cache.clear()
+    result_cache.clear()
+    persisted_queries.clear()
+    rate_limit_store.clear()
+    similarity_index.clear()
+
+
+# Background workers are bound to the event loop of the test that started them
+@pytest_asyncio.fixture(autouse=True)
+async def stop_background_workers() -> AsyncGenerator[None, None]:
+    yield
+    await stop_image_processing()
+    await image_cleanup.stop()
+
+
+@pytest.fixture
+def job_worker(monkeypatch):
+    # Queued jobs only run once a test starts the workers, against the test database
+    monkeypatch.setattr(job_queue, "session_factory", TestingSessionLocal)
+    return job_queue
+
+
 @pytest_asyncio.fixture
 async def db_session() -> AsyncGenerator[AsyncSession, None]:
     # Create all tables in the test database
@@ -56,6 +97,19 @@ async def db_session() -> AsyncGenerator[AsyncSession, None]:
         await conn.run_sync(Base.metadata.drop_all)
 
 
+@pytest.fixture
+def statements() -> Generator[List[Tuple[str, Any]], None, None]:
+    # SQL statements, with their parameters, run against the test database
+    executed = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        executed.append((statement, parameters))
+
+    event.listen(test_engine.sync_engine, "before_cursor_execute", record)
+    yield executed
+    event.remove(test_engine.sync_engine, "before_cursor_execute", record)
+
+
 # Override the get_db dependency for tests
 @pytest.fixture
 def override_get_db(db_session: AsyncSession) -> Generator:
@@ -74,6 +128,19 @@ def app_with_test_db(app: FastAPI, override_get_db) -> FastAPI:
     return app
 
 
+@pytest.fixture
+def upload_dir(tmp_path, monkeypatch) -> str:
+    # Keep uploaded test images out of the application tree
+    directory = str(tmp_path / "images")
+    monkeypatch.setattr(settings, "UPLOAD_DIR", directory)
+    monkeypatch.setattr(image_storage, "root", directory)
+    # Blobs of test bees are fresh; let the cleanup queue remove them, and
+    # check their references against the test database
+    monkeypatch.setattr(image_cleanup, "grace_seconds", 0)
+    monkeypatch.setattr(image_cleanup, "session_factory", TestingSessionLocal)
+    return directory
+
+
 @pytest_asyncio.fixture
 async def test_user(db_session: AsyncSession) -> User:
     # Create a test user
@@ -1,5 +1,10 @@
 import pytest
 from httpx import AsyncClient
+from passlib.hash import bcrypt
+from sqlalchemy import select
+
+from app.core.security import pwd_context
+from app.models import User
 
 pytestmark = pytest.mark.asyncio
 
@@ -92,4 +97,59 @@ async def test_login_failure(app_with_test_db: dict, async_client: AsyncClient):
     # Check if the response contains errors
     assert response.status_code == 200  # GraphQL always returns 200, but with errors
     json_response = response.json()
-    assert "errors" in json_response
\ No newline at end of file
+    assert "errors" in json_response
+
+async def test_me_requires_valid_token(test_user, app_with_test_db: dict, async_client: AsyncClient, auth_headers: dict):
+    # Authenticated requests resolve the current user
+    response = await async_client.post(
+        "/graphql",
+        headers=auth_headers,
+        json={"query": "query { me { username } }"},
+    )
+    json_response = response.json()
+    assert "errors" not in json_response
+    assert json_response["data"]["me"]["username"] == "testuser"
+
+    # An invalid token is rejected even though a user is cached
+    response = await async_client.post(
+        "/graphql",
+        headers={"Authorization": "Bearer not-a-token"},
+        json={"query": "query { me { username } bees { edges { cursor } } }"},
+    )
+    json_response = response.json()
+    assert "errors" in json_response
+    assert json_response["data"] is None
+
+
+async def test_login_upgrades_legacy_hash(db_session, app_with_test_db: dict, async_client: AsyncClient):
+    # A user whose password was hashed with a lower bcrypt cost
+    legacy_user = User(
+        username="legacy",
+        email="legacy@example.com",
+        hashed_password=bcrypt.using(rounds=4).hash("password"),
+        is_active=True,
+    )
+    db_session.add(legacy_user)
+    await db_session.commit()
+    assert pwd_context.needs_update(legacy_user.hashed_password)
+
+    response = await async_client.post(
+        "/graphql",
+        json={
+            "query": """
+            mutation {
+                login(username: "legacy", password: "password") {
+                    accessToken
+                }
+            }
+            """
+        },
+    )
+    json_response = response.json()
+    assert "errors" not in json_response
+
+    # The stored hash was transparently replaced and still verifies
+    result = await db_session.execute(select(User.hashed_password).where(User.username == "legacy"))
+    hashed_password = result.scalar_one()
+    assert not pwd_context.needs_update(hashed_password)
+    assert pwd_context.verify("password", hashed_password)
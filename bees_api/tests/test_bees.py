@@ -2,6 +2,7 @@ import pytest
 from datetime import date
 from httpx import AsyncClient
 import json
+import re
 
 pytestmark = pytest.mark.asyncio
 
@@ -83,12 +84,16 @@ async def test_get_bees(app_with_test_db: dict, async_client: AsyncClient, auth_
             "query": """
             query {
                 bees {
-                    id
-                    name
-                    origin
-                    species
-                    capturedDate
-                    imagePath
+                    edges {
+                        node {
+                            id
+                            name
+                            origin
+                            species
+                            capturedDate
+                            imagePath
+                        }
+                    }
                 }
             }
             """
@@ -105,7 +110,7 @@ async def test_get_bees(app_with_test_db: dict, async_client: AsyncClient, auth_
     assert "bees" in json_response["data"]
     
     # Check that we have one bee in the list
-    bees_data = json_response["data"]["bees"]
+    bees_data = [edge["node"] for edge in json_response["data"]["bees"]["edges"]]
     assert len(bees_data) >= 1
     
     # Check that our bee is in the list
@@ -115,6 +120,227 @@ async def test_get_bees(app_with_test_db: dict, async_client: AsyncClient, auth_
     assert bee["species"] == "Honey Bee"
 
 
+async def test_paginate_and_filter_bees(app_with_test_db: dict, async_client: AsyncClient, auth_headers: dict):
+    # Add bees captured on different days, two of them honey bees
+    for name, species, captured_date in [
+        ("Alpha", "Honey Bee", "2024-05-01"),
+        ("Beta", "Bumble Bee", "2024-05-02"),
+        ("Gamma", "Honey Bee", "2024-05-03"),
+    ]:
+        await async_client.post(
+            "/graphql",
+            headers=auth_headers,
+            json={
+                "query": f"""
+                mutation {{
+                    addBee(
+                        name: "{name}",
+                        origin: "Meadow",
+                        species: "{species}",
+                        capturedDate: "{captured_date}"
+                    ) {{
+                        id
+                    }}
+                }}
+                """
+            },
+        )
+
+    query = """
+    query Bees($after: String, $species: String) {
+        bees(first: 1, after: $after, species: $species) {
+            edges {
+                node {
+                    name
+                }
+            }
+            pageInfo {
+                hasNextPage
+                endCursor
+            }
+        }
+    }
+    """
+
+    # Walk the honey bees one page at a time, newest capture first
+    names = []
+    after = None
+    while True:
+        response = await async_client.post(
+            "/graphql",
+            headers=auth_headers,
+            json={"query": query, "variables": {"after": after, "species": "Honey Bee"}},
+        )
+        json_response = response.json()
+        assert "errors" not in json_response
+        connection = json_response["data"]["bees"]
+        names.extend(edge["node"]["name"] for edge in connection["edges"])
+        if not connection["pageInfo"]["hasNextPage"]:
+            break
+        after = connection["pageInfo"]["endCursor"]
+
+    assert names == ["Gamma", "Alpha"]
+
+    # Captured date ranges are applied as well
+    response = await async_client.post(
+        "/graphql",
+        headers=auth_headers,
+        json={
+            "query": """
+            query {
+                bees(capturedFrom: "2024-05-02", capturedTo: "2024-05-02") {
+                    edges {
+                        node {
+                            name
+                        }
+                    }
+                }
+            }
+            """
+        },
+    )
+    edges = response.json()["data"]["bees"]["edges"]
+    assert [edge["node"]["name"] for edge in edges] == ["Beta"]
+
+
+async def test_bees_reads_only_selected_columns(app_with_test_db: dict, async_client: AsyncClient, auth_headers: dict, monkeypatch):
+    from app import schema
+
+    await async_client.post(
+        "/graphql",
+        headers=auth_headers,
+        json={
+            "query": """
+            mutation {
+                addBee(name: "Buzzy", origin: "Meadow", species: "Honey Bee", capturedDate: "2024-05-01") {
+                    id
+                }
+            }
+            """
+        },
+    )
+
+    # Record the columns the resolver asks for
+    selected = []
+    get_bee_rows = schema.get_bee_rows
+
+    async def spy(db, columns, **kwargs):
+        selected.append(columns)
+        return await get_bee_rows(db, columns, **kwargs)
+
+    monkeypatch.setattr(schema, "get_bee_rows", spy)
+
+    response = await async_client.post(
+        "/graphql",
+        headers=auth_headers,
+        json={
+            "query": """
+            query {
+                bees {
+                    edges {
+                        node {
+                            ...BeeName
+                        }
+                    }
+                }
+            }
+
+            fragment BeeName on BeeType {
+                name
+            }
+            """
+        },
+    )
+
+    json_response = response.json()
+    assert "errors" not in json_response
+    assert json_response["data"]["bees"]["edges"] == [{"node": {"name": "Buzzy"}}]
+    assert selected == [["id", "name", "captured_date"]]
+
+
+async def test_bees_served_from_cache_until_invalidated(app_with_test_db: dict, async_client: AsyncClient, auth_headers: dict, monkeypatch):
+    from app import schema
+    from app.cache import InMemoryCacheBackend, result_cache
+
+    # Exercise the shared tier too, the way multiple workers would use it
+    monkeypatch.setattr(result_cache, "shared", InMemoryCacheBackend())
+
+    calls = []
+    get_bee_rows = schema.get_bee_rows
+
+    async def spy(db, columns, **kwargs):
+        calls.append(columns)
+        return await get_bee_rows(db, columns, **kwargs)
+
+    monkeypatch.setattr(schema, "get_bee_rows", spy)
+
+    async def add_bee(name: str):
+        await async_client.post(
+            "/graphql",
+            headers=auth_headers,
+            json={
+                "query": f"""
+                mutation {{
+                    addBee(name: "{name}", origin: "Meadow", species: "Honey Bee", capturedDate: "2024-05-01") {{
+                        id
+                    }}
+                }}
+                """
+            },
+        )
+
+    async def list_names():
+        response = await async_client.post(
+            "/graphql",
+            headers=auth_headers,
+            json={"query": "query { bees { edges { node { name capturedDate } } } }"},
+        )
+        json_response = response.json()
+        assert "errors" not in json_response
+        return [edge["node"]["name"] for edge in json_response["data"]["bees"]["edges"]]
+
+    await add_bee("Alpha")
+    assert await list_names() == ["Alpha"]
+    assert await list_names() == ["Alpha"]
+    assert len(calls) == 1
+
+    # Entries written to the shared tier survive losing the local one
+    result_cache.local.clear()
+    assert await list_names() == ["Alpha"]
+    assert len(calls) == 1
+
+    # Adding a bee retires every cached page
+    await add_bee("Beta")
+    assert sorted(await list_names()) == ["Alpha", "Beta"]
+    assert len(calls) == 2
+
+
+async def test_replica_reads_are_not_cached(app_with_test_db: dict, async_client: AsyncClient, auth_headers: dict, monkeypatch):
+    from app import db, schema
+    from tests.conftest import test_engine
+
+    # Route the test database through the replica path
+    monkeypatch.setattr(db, "read_engine", test_engine)
+    calls = []
+    get_bee_rows = schema.get_bee_rows
+
+    async def spy(db, columns, **kwargs):
+        calls.append(columns)
+        return await get_bee_rows(db, columns, **kwargs)
+
+    monkeypatch.setattr(schema, "get_bee_rows", spy)
+
+    # The replica may lag behind the version the page would be cached under
+    for _ in range(2):
+        response = await async_client.post(
+            "/graphql",
+            headers=auth_headers,
+            json={"query": "query { bees { edges { node { name } } } beeStats { count } }"},
+        )
+        assert "errors" not in response.json()
+    assert len(calls) == 2
+
+
 async def test_get_specific_bee(app_with_test_db: dict, async_client: AsyncClient, auth_headers: dict):
     # First add a bee
     today = date.today().isoformat()
@@ -180,6 +406,60 @@ async def test_get_specific_bee(app_with_test_db: dict, async_client: AsyncClien
     assert bee_data["capturedDate"] == today
 
 
+async def test_get_aliased_bees(app_with_test_db: dict, async_client: AsyncClient, auth_headers: dict, statements):
+    # Add a couple of bees
+    bee_ids = []
+    for name in ["Alpha", "Beta"]:
+        add_response = await async_client.post(
+            "/graphql",
+            headers=auth_headers,
+            json={
+                "query": f"""
+                mutation {{
+                    addBee(
+                        name: "{name}",
+                        origin: "Meadow",
+                        species: "Honey Bee",
+                        capturedDate: "2024-05-01"
+                    ) {{
+                        id
+                    }}
+                }}
+                """
+            },
+        )
+        bee_ids.append(add_response.json()["data"]["addBee"]["id"])
+
+    # Aliased lookups are batched into a single query and keep their order
+    statements.clear()
+    response = await async_client.post(
+        "/graphql",
+        headers=auth_headers,
+        json={
+            "query": f"""
+            query {{
+                first: bee(id: {bee_ids[0]}) {{ name }}
+                second: bee(id: {bee_ids[1]}) {{ name }}
+                again: bee(id: {bee_ids[0]}) {{ name }}
+                missing: bee(id: 999999) {{ name }}
+                me {{ username }}
+            }}
+            """
+        },
+    )
+
+    json_response = response.json()
+    assert "errors" not in json_response
+    data = json_response["data"]
+    assert data["first"]["name"] == "Alpha"
+    assert data["second"]["name"] == "Beta"
+    assert data["again"]["name"] == "Alpha"
+    assert data["missing"] is None
+    assert data["me"]["username"] == "testuser"
+    bee_queries = [statement for statement, _ in statements if re.search(r"\bFROM bee\b", statement)]
+    assert len(bee_queries) == 1
+
+
 async def test_delete_bee(app_with_test_db: dict, async_client: AsyncClient, auth_headers: dict):
     # First add a bee
     today = date.today().isoformat()
@@ -250,4 +530,297 @@ async def test_delete_bee(app_with_test_db: dict, async_client: AsyncClient, aut
     # Check that the bee no longer exists
     assert response.status_code == 200
     json_response = response.json()
-    assert json_response["data"]["bee"] is None
\ No newline at end of file
+    assert json_response["data"]["bee"] is None
+
+async def test_query_limits(app_with_test_db: dict, async_client: AsyncClient, auth_headers: dict, monkeypatch):
+    from app.core.config import settings
+
+    async def errors(query: str, variables: dict = None):
+        response = await async_client.post(
+            "/graphql", headers=auth_headers, json={"query": query, "variables": variables}
+        )
+        return [error["extensions"]["code"] for error in response.json().get("errors", [])]
+
+    # A page of 100 bees with their nodes stays within the budget
+    assert await errors("query { bees(first: 100) { edges { node { name } } } }") == []
+
+    # Costs scale with "first", also when it comes from a variable
+    nested = "query($first: Int) { a: bees(first: $first) { edges { node { name } } } b: bees(first: $first) { edges { node { name } } } c: bees(first: $first) { edges { node { name } } } d: bees(first: $first) { edges { node { name } } } e: bees(first: $first) { edges { node { name } } } f: bees(first: $first) { edges { node { name } } } }"
+    assert await errors(nested, {"first": 10}) == []
+    assert await errors(nested, {"first": 100}) == ["QUERY_TOO_COSTLY"]
+
+    # Leaving "first" out costs the default page the resolvers return
+    from app.cost import estimate_cost
+    from app.schema import schema
+    from graphql import parse
+
+    def cost(query: str) -> int:
+        return estimate_cost(schema._schema, parse(query))
+
+    default_page = "{ bees { edges { node { id thumbnail } } } }"
+    assert cost(default_page) == cost("{ bees(first: %d) { edges { node { id thumbnail } } } }" % settings.DEFAULT_PAGE_SIZE)
+    assert cost(default_page) > 3
+
+    # Too many aliases and too deep queries fail validation
+    response = await async_client.post(
+        "/graphql",
+        headers=auth_headers,
+        json={"query": "query {" + " ".join(f"b{i}: bee(id: {i}) {{ id }}" for i in range(31)) + "}"},
+    )
+    assert [error["message"] for error in response.json()["errors"]] == ["31 aliases found. Allowed: 30"]
+
+    # Depth counts fields reached through fragments too; the schema takes
+    # its limits from the settings when it is built
+    import strawberry
+    from app.extensions import query_limits
+    from app.schema import Mutation, Query
+
+    monkeypatch.setattr(settings, "MAX_QUERY_DEPTH", 2)
+    limited = strawberry.Schema(query=Query, mutation=Mutation, extensions=query_limits())
+    fragments = "query { bees { ...A } } fragment A on BeeConnection { edges { node { ...B } } } fragment B on BeeType { id }"
+    result = await limited.execute(fragments)
+    assert [error.message for error in result.errors] == ["'anonymous' exceeds maximum operation depth of 2"]
+    # Validation passes; only the resolver fails without a request context
+    result = await limited.execute("query { bees { edges { cursor } } }")
+    assert not any("depth" in error.message for error in result.errors)
+
+
+async def test_search_bees(app_with_test_db: dict, async_client: AsyncClient, auth_headers: dict):
+    for name, species, origin in [
+        ("Meadow Queen", "Honey Bee", "Hillside"),
+        ("Honeydew", "Bumblebee", "Forest Garden"),
+        ("Buzzy", "Carpenter Bee", "Meadow"),
+    ]:
+        await async_client.post(
+            "/graphql",
+            headers=auth_headers,
+            json={
+                "query": f"""
+                mutation {{
+                    addBee(name: "{name}", origin: "{origin}", species: "{species}", capturedDate: "2024-05-01") {{
+                        id
+                    }}
+                }}
+                """
+            },
+        )
+
+    async def search(text: str, first: int = 10, after: str = None):
+        response = await async_client.post(
+            "/graphql",
+            headers=auth_headers,
+            json={
+                "query": """
+                query($text: String!, $first: Int, $after: String) {
+                    searchBees(text: $text, first: $first, after: $after) {
+                        edges { node { name } }
+                        pageInfo { hasNextPage endCursor }
+                    }
+                }
+                """,
+                "variables": {"text": text, "first": first, "after": after},
+            },
+        )
+        json_response = response.json()
+        assert "errors" not in json_response
+        return json_response["data"]["searchBees"]
+
+    # Names starting with the text rank above matches elsewhere
+    result = await search("hone")
+    assert [edge["node"]["name"] for edge in result["edges"]] == ["Honeydew", "Meadow Queen"]
+
+    # Every word has to match, in any of the searched columns
+    result = await search("meadow carpenter")
+    assert [edge["node"]["name"] for edge in result["edges"]] == ["Buzzy"]
+    assert (await search("?!"))["edges"] == []
+
+    # Ranked results page by offset
+    first_page = await search("meadow", first=1)
+    assert first_page["pageInfo"]["hasNextPage"] is True
+    second_page = await search("meadow", first=1, after=first_page["pageInfo"]["endCursor"])
+    assert second_page["pageInfo"]["hasNextPage"] is False
+    names = [page["edges"][0]["node"]["name"] for page in (first_page, second_page)]
+    assert names == ["Meadow Queen", "Buzzy"]
+
+
+async def test_bee_stats(app_with_test_db: dict, async_client: AsyncClient, auth_headers: dict, monkeypatch):
+    from app.cache import result_cache
+    from app.core.config import settings
+
+    for name, species, origin, captured in [
+        ("A", "Honey Bee", "Meadow", "2024-05-01"),
+        ("B", "Honey Bee", "Forest", "2024-05-20"),
+        ("C", "Honey Bee", "Meadow", "2024-06-02"),
+        ("D", "Bumblebee", "Meadow", "2024-06-03"),
+    ]:
+        await async_client.post(
+            "/graphql",
+            headers=auth_headers,
+            json={
+                "query": f"""
+                mutation {{
+                    addBee(name: "{name}", origin: "{origin}", species: "{species}", capturedDate: "{captured}") {{
+                        id
+                    }}
+                }}
+                """
+            },
+        )
+    delete_id = (await async_client.post(
+        "/graphql",
+        headers=auth_headers,
+        json={"query": 'mutation { addBee(name: "E", origin: "Forest", species: "Bumblebee", capturedDate: "2024-06-04") { id } }'},
+    )).json()["data"]["addBee"]["id"]
+    await async_client.post(
+        "/graphql", headers=auth_headers, json={"query": f"mutation {{ deleteBee(id: {delete_id}) }}"}
+    )
+
+    async def stats(arguments: str):
+        response = await async_client.post(
+            "/graphql",
+            headers=auth_headers,
+            json={"query": f"query {{ beeStats{arguments} {{ count species origin period }} }}"},
+        )
+        json_response = response.json()
+        assert "errors" not in json_response
+        return json_response["data"]["beeStats"]
+
+    # The summary table and a direct aggregation of the bees agree
+    for use_summary in (True, False):
+        monkeypatch.setattr(settings, "BEE_STATS_USE_SUMMARY", use_summary)
+        result_cache.clear()
+
+        assert await stats("") == [{"count": 4, "species": None, "origin": None, "period": None}]
+        assert await stats("(groupBy: [SPECIES])") == [
+            {"count": 1, "species": "Bumblebee", "origin": None, "period": None},
+            {"count": 3, "species": "Honey Bee", "origin": None, "period": None},
+        ]
+        assert await stats('(bucket: MONTH, origin: "Meadow")') == [
+            {"count": 1, "species": None, "origin": None, "period": "2024-05-01"},
+            {"count": 2, "species": None, "origin": None, "period": "2024-06-01"},
+        ]
+        assert await stats("(groupBy: [SPECIES, ORIGIN], bucket: YEAR)") == [
+            {"count": 1, "species": "Bumblebee", "origin": "Meadow", "period": "2024-01-01"},
+            {"count": 1, "species": "Honey Bee", "origin": "Forest", "period": "2024-01-01"},
+            {"count": 2, "species": "Honey Bee", "origin": "Meadow", "period": "2024-01-01"},
+        ]
+
+
+async def test_record_bee_counts_touches_only_changed_days(db_session, statements):
+    from app.models import BeeDailyCount
+    from app.stats import record_bee_counts
+    from sqlalchemy import select
+
+    meadow, forest = ("Honey Bee", "Meadow", date(2024, 5, 1)), ("Honey Bee", "Forest", date(2024, 5, 1))
+    await record_bee_counts(db_session, [(meadow, 1), (forest, 1), (meadow, 1)])
+    # A day emptied earlier by some other path stays until it is decremented
+    db_session.add(BeeDailyCount(species="Bumblebee", origin="Meadow", captured_date=date(2024, 5, 2), count=0))
+    await db_session.flush()
+
+    # Upserted in key order whatever the order of the changes
+    upsert = next(parameters for statement, parameters in statements if statement.startswith("INSERT"))
+    assert [value for value in upsert if value in ("Meadow", "Forest")] == ["Forest", "Meadow"]
+
+    statements.clear()
+    await record_bee_counts(db_session, [(meadow, -2), (forest, -1), (forest, 1)])
+    [delete] = [statement for statement, _ in statements if statement.startswith("DELETE")]
+    assert "IN" in delete
+    counts = (await db_session.execute(
+        select(BeeDailyCount.species, BeeDailyCount.origin, BeeDailyCount.count)
+    )).all()
+    assert sorted(counts) == [("Bumblebee", "Meadow", 0), ("Honey Bee", "Forest", 1)]
+
+
+async def test_batch_add_and_delete_bees(app_with_test_db: dict, async_client: AsyncClient, auth_headers: dict):
+    response = await async_client.post(
+        "/graphql",
+        headers=auth_headers,
+        json={
+            "query": """
+            mutation ($bees: [BeeInput!]!) {
+                addBees(bees: $bees) {
+                    bee { id name species }
+                    error
+                }
+            }
+            """,
+            "variables": {
+                "bees": [
+                    {"name": "One", "origin": "Meadow", "species": "Honey Bee", "capturedDate": "2024-05-01"},
+                    {"name": " ", "origin": "Meadow", "species": "Honey Bee", "capturedDate": "2024-05-01"},
+                    {"name": "Two", "origin": "Forest", "species": "Bumblebee", "capturedDate": "2024-05-02"},
+                ]
+            },
+        },
+    )
+    json_response = response.json()
+    assert "errors" not in json_response
+    results = json_response["data"]["addBees"]
+
+    # Results line up with the input; the invalid item does not stop the others
+    assert [result["error"] for result in results] == [None, "Missing name", None]
+    assert results[1]["bee"] is None
+    assert [results[0]["bee"]["name"], results[2]["bee"]["name"]] == ["One", "Two"]
+    bee_ids = [results[0]["bee"]["id"], results[2]["bee"]["id"]]
+
+    response = await async_client.post(
+        "/graphql",
+        headers=auth_headers,
+        json={
+            "query": "mutation ($ids: [Int!]!) { deleteBees(ids: $ids) { id deleted } }",
+            "variables": {"ids": [bee_ids[0], 999999, bee_ids[1]]},
+        },
+    )
+    json_response = response.json()
+    assert "errors" not in json_response
+    assert json_response["data"]["deleteBees"] == [
+        {"id": bee_ids[0], "deleted": True},
+        {"id": 999999, "deleted": False},
+        {"id": bee_ids[1], "deleted": True},
+    ]
+
+    response = await async_client.post(
+        "/graphql",
+        headers=auth_headers,
+        json={"query": "query { bees { edges { node { id } } } beeStats { count } }"},
+    )
+    data = response.json()["data"]
+    assert data["bees"]["edges"] == []
+    assert data["beeStats"] == [{"count": 0}]
+
+
+async def test_create_bees_returns_ids_in_input_order(db_session, monkeypatch):
+    from app.crud import create_bees, get_bees_by_ids
+    from app.events import BEE_ADDED, event_bus
+
+    published = []
+
+    async def publish(topic, payload):
+        published.append((topic, payload))
+
+    monkeypatch.setattr(event_bus, "publish", publish)
+    rows = [
+        {"name": f"Bee {index}", "origin": f"Origin {index % 7}", "species": f"Species {index % 5}",
+         "captured_date": date(2024, 1, 1 + index % 28)}
+        for index in range(250)
+    ]
+    bee_ids = await create_bees(db_session, rows)
+
+    bees = {bee.id: bee for bee in await get_bees_by_ids(db_session, bee_ids)}
+    assert [bees[bee_id].name for bee_id in bee_ids] == [row["name"] for row in rows]
+    assert [bees[bee_id].origin for bee_id in bee_ids] == [row["origin"] for row in rows]
+    [(topic, payload)] = published
+    assert topic == BEE_ADDED
+    assert all(bees[values["id"]].name == values["name"] for values in payload)
+
+
+async def test_batch_size_is_limited(app_with_test_db: dict, async_client: AsyncClient, auth_headers: dict, monkeypatch):
+    from app.core.config import settings
+
+    monkeypatch.setattr(settings, "MAX_BATCH_MUTATION_SIZE", 2)
+    response = await async_client.post(
+        "/graphql",
+        headers=auth_headers,
+        json={"query": "mutation { deleteBees(ids: [1, 2, 3]) { id deleted } }"},
+    )
+    assert response.json()["errors"][0]["message"] == "At most 2 items per batch"
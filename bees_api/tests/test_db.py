@@ -0,0 +1,100 @@
+import asyncio
+import time
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from starlette.requests import Request
+
+from app.core.config import settings
+from app.db import (READ_YOUR_WRITES_COOKIE, InstrumentedPool, engine_options,
+                    pool_stats, prefers_primary)
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_engine_options_for_postgres():
+    options = engine_options("postgresql+asyncpg://user:pass@db/bee_api")
+    assert options["echo"] is False
+    assert options["poolclass"] is InstrumentedPool
+    assert options["connect_args"]["statement_cache_size"] == 100
+
+    # SQLite keeps its default pool and gets no asyncpg options
+    assert engine_options("sqlite+aiosqlite:///:memory:") == {"echo": False}
+
+
+async def test_pool_stats_count_waits(tmp_path):
+    engine = create_async_engine(
+        f"sqlite+aiosqlite:///{tmp_path / 'pool.db'}",
+        poolclass=InstrumentedPool,
+        pool_size=1,
+        max_overflow=0,
+    )
+    try:
+        async with engine.connect() as first:
+            await first.execute(text("SELECT 1"))
+            assert pool_stats(engine)["checked_out"] == 1
+
+            async def second_checkout():
+                async with engine.connect() as second:
+                    await second.execute(text("SELECT 1"))
+
+            # The second checkout has to wait for the first connection
+            waiter = asyncio.create_task(second_checkout())
+            await asyncio.sleep(0.1)
+        await waiter
+
+        stats = pool_stats(engine)
+        assert stats["waits"] == 1
+        assert stats["checked_out"] == 0
+        assert stats["timeouts"] == 0
+    finally:
+        await engine.dispose()
+
+
+async def test_pool_health_endpoint(async_client: AsyncClient):
+    response = await async_client.get("/health/db-pool")
+    assert response.status_code == 200
+    assert "primary" in response.json()
+
+
+def make_request(headers: dict) -> Request:
+    raw_headers = [(name.lower().encode(), value.encode()) for name, value in headers.items()]
+    return Request({"type": "http", "headers": raw_headers})
+
+
+async def test_prefers_primary():
+    assert not prefers_primary(make_request({}))
+    assert prefers_primary(make_request({"X-Read-Primary": "1"}))
+    assert prefers_primary(make_request({"Cookie": f"{READ_YOUR_WRITES_COOKIE}={time.time() + 5}"}))
+    assert not prefers_primary(make_request({"Cookie": f"{READ_YOUR_WRITES_COOKIE}={time.time() - 5}"}))
+    assert not prefers_primary(make_request({"Cookie": f"{READ_YOUR_WRITES_COOKIE}=garbage"}))
+
+
+async def test_mutation_pins_reads_to_primary(app_with_test_db: dict, async_client: AsyncClient, auth_headers: dict, monkeypatch):
+    monkeypatch.setattr(settings, "READ_DATABASE_URL", "postgresql+asyncpg://replica/bee_api")
+
+    response = await async_client.post(
+        "/graphql",
+        headers=auth_headers,
+        json={"query": "query { me { username } }"},
+    )
+    assert READ_YOUR_WRITES_COOKIE not in response.cookies
+
+    response = await async_client.post(
+        "/graphql",
+        headers=auth_headers,
+        json={
+            "query": """
+            mutation {
+                addBee(name: "Buzzy", origin: "Meadow", species: "Honey Bee", capturedDate: "2024-05-01") {
+                    id
+                }
+            }
+            """
+        },
+    )
+    assert "errors" not in response.json()
+    assert float(response.cookies[READ_YOUR_WRITES_COOKIE]) > time.time()
@@ -0,0 +1,89 @@
+import csv
+import io
+import json
+from datetime import date
+
+import pytest
+from httpx import AsyncClient
+
+from app import export
+from app.models import Bee
+from tests.conftest import TestingSessionLocal
+
+pytestmark = pytest.mark.asyncio
+
+
+@pytest.fixture
+def bees_to_export(db_session, monkeypatch):
+    monkeypatch.setattr(export, "new_read_session", TestingSessionLocal)
+    monkeypatch.setattr(export.settings, "EXPORT_BATCH_SIZE", 2)
+
+    async def add():
+        db_session.add_all([
+            Bee(name=f"Bee {i}", origin="Meadow" if i % 2 else "Forest", species="Honey Bee", captured_date=date(2024, 5, i))
+            for i in range(1, 6)
+        ])
+        await db_session.commit()
+    return add
+
+
+async def test_export_ndjson_gzip(app_with_test_db: dict, async_client: AsyncClient, auth_headers: dict, bees_to_export):
+    await bees_to_export()
+    response = await async_client.get(
+        "/export/bees",
+        headers={**auth_headers, "Accept-Encoding": "gzip"},
+        params={"origin": "Meadow"},
+    )
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+
+    # httpx transparently decodes the gzip stream
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["name"] for row in rows] == ["Bee 1", "Bee 3", "Bee 5"]
+    assert rows[0]["captured_date"] == "2024-05-01"
+
+
+async def test_export_refuses_gzip_with_zero_quality(app_with_test_db: dict, async_client: AsyncClient, auth_headers: dict, bees_to_export):
+    await bees_to_export()
+    response = await async_client.get(
+        "/export/bees", headers={**auth_headers, "Accept-Encoding": "br, gzip;q=0"}
+    )
+    assert response.status_code == 200
+    assert "content-encoding" not in response.headers
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert len(response.text.splitlines()) == 5
+
+
+async def test_accepts_gzip():
+    assert export.accepts_gzip("gzip, deflate")
+    assert export.accepts_gzip("deflate;q=0.5, GZIP;q=0.1")
+    assert export.accepts_gzip("*")
+    assert not export.accepts_gzip("")
+    assert not export.accepts_gzip("gzip;q=0")
+    assert not export.accepts_gzip("gzip;q=0.000, *")
+    assert not export.accepts_gzip("identity, *;q=0")
+
+
+async def test_export_csv(app_with_test_db: dict, async_client: AsyncClient, auth_headers: dict, bees_to_export):
+    await bees_to_export()
+    response = await async_client.get("/export/bees", headers=auth_headers, params={"format": "csv"})
+    assert response.status_code == 200
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert len(rows) == 5
+    assert rows[4]["name"] == "Bee 5"
+
+
+async def test_export_parquet(app_with_test_db: dict, async_client: AsyncClient, auth_headers: dict, bees_to_export):
+    pq = pytest.importorskip("pyarrow.parquet")
+    await bees_to_export()
+    response = await async_client.get("/export/bees", headers=auth_headers, params={"format": "parquet"})
+    assert response.status_code == 200
+    table = pq.read_table(io.BytesIO(response.content))
+    assert table.num_rows == 5
+    assert table.column("captured_date").to_pylist()[0] == date(2024, 5, 1)
+
+
+async def test_export_requires_authentication(app_with_test_db: dict, async_client: AsyncClient):
+    response = await async_client.get("/export/bees")
+    assert response.status_code == 401
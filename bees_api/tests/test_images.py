@@ -0,0 +1,452 @@
+import hashlib
+import io
+import json
+import os
+
+import pytest
+from httpx import AsyncClient
+from PIL import Image
+from sqlalchemy import update
+
+from app import cli
+from app.cleanup import image_cleanup, sweep_orphaned_images
+from app.core.config import settings
+from app.models import Bee
+from app.similarity import perceptual_hash, similarity_index
+from app.variants import variant_cache
+from tests.conftest import TestingSessionLocal
+from tests.test_similarity import picture
+
+pytestmark = pytest.mark.asyncio
+
+ADD_BEE_WITH_IMAGE = """
+mutation ($image: Upload!) {
+    addBee(
+        name: "Snapshot",
+        origin: "Orchard",
+        species: "Honey Bee",
+        capturedDate: "2024-05-01",
+        image: $image
+    ) {
+        id
+        imagePath
+    }
+}
+"""
+
+
+async def upload_bee_image(async_client: AsyncClient, auth_headers: dict, content: bytes, filename: str = "bee.jpg"):
+    # GraphQL multipart request: operations, map and the file part
+    return await async_client.post(
+        "/graphql",
+        headers=auth_headers,
+        data={
+            "operations": json.dumps({"query": ADD_BEE_WITH_IMAGE, "variables": {"image": None}}),
+            "map": json.dumps({"0": ["variables.image"]}),
+        },
+        files={"0": (filename, content, "image/jpeg")},
+    )
+
+
+async def test_add_bee_with_image(app_with_test_db: dict, async_client: AsyncClient, auth_headers: dict, upload_dir: str):
+    content = os.urandom(3 * 1024 * 1024)
+    response = await upload_bee_image(async_client, auth_headers, content)
+
+    json_response = response.json()
+    assert "errors" not in json_response
+    image_path = json_response["data"]["addBee"]["imagePath"]
+    assert image_path.startswith("images/")
+
+    # The whole upload landed on disk under its content hash and no
+    # temporary files were left behind
+    sha256 = hashlib.sha256(content).hexdigest()
+    assert image_path == f"images/{sha256[:2]}/{sha256[2:4]}/{sha256}.jpg"
+    with open(os.path.join(upload_dir, image_path.removeprefix("images/")), "rb") as stored_file:
+        assert stored_file.read() == content
+    assert not [name for name in os.listdir(upload_dir) if name.endswith(".tmp")]
+
+
+async def test_identical_images_are_deduplicated(app_with_test_db: dict, async_client: AsyncClient, auth_headers: dict, upload_dir: str):
+    content = os.urandom(1024)
+    first = (await upload_bee_image(async_client, auth_headers, content, "one.jpg")).json()["data"]["addBee"]
+    second = (await upload_bee_image(async_client, auth_headers, content, "two.jpg")).json()["data"]["addBee"]
+    assert first["imagePath"] == second["imagePath"]
+    stored = os.path.join(upload_dir, first["imagePath"].removeprefix("images/"))
+
+    async def delete(bee_id: int):
+        response = await async_client.post(
+            "/graphql",
+            headers=auth_headers,
+            json={"query": f"mutation {{ deleteBee(id: {bee_id}) }}"},
+        )
+        assert response.json()["data"]["deleteBee"] is True
+
+    # The blob survives while another bee still references it
+    await delete(first["id"])
+    await image_cleanup.join()
+    assert os.path.exists(stored)
+    await delete(second["id"])
+    await image_cleanup.join()
+    assert not os.path.exists(stored)
+
+
+async def test_batch_delete_removes_unreferenced_images(app_with_test_db: dict, async_client: AsyncClient, auth_headers: dict, upload_dir: str):
+    shared, single = os.urandom(1024), os.urandom(1024)
+    bees = [
+        (await upload_bee_image(async_client, auth_headers, content)).json()["data"]["addBee"]
+        for content in (shared, shared, single)
+    ]
+
+    async def delete(bee_ids):
+        response = await async_client.post(
+            "/graphql",
+            headers=auth_headers,
+            json={
+                "query": "mutation ($ids: [Int!]!) { deleteBees(ids: $ids) { deleted } }",
+                "variables": {"ids": bee_ids},
+            },
+        )
+        assert all(result["deleted"] for result in response.json()["data"]["deleteBees"])
+
+    def stored(bee) -> bool:
+        return os.path.exists(os.path.join(upload_dir, bee["imagePath"].removeprefix("images/")))
+
+    await delete([bees[0]["id"], bees[2]["id"]])
+    await image_cleanup.join()
+    assert stored(bees[1])
+    assert not stored(bees[2])
+    await delete([bees[1]["id"]])
+    await image_cleanup.join()
+    assert not stored(bees[1])
+
+
+async def test_cleanup_rechecks_images_before_removing(app_with_test_db: dict, async_client: AsyncClient, auth_headers: dict, upload_dir: str, monkeypatch):
+    bee = (await upload_bee_image(async_client, auth_headers, os.urandom(1024))).json()["data"]["addBee"]
+    key = bee["imagePath"].removeprefix("images/")
+    stored = os.path.join(upload_dir, key)
+
+    # Queued as orphaned, but an identical upload picked the blob up since
+    image_cleanup.enqueue([key])
+    await image_cleanup.join()
+    assert os.path.exists(stored)
+
+    # Unreferenced, but too recent: its bee may not have committed yet
+    monkeypatch.setattr(image_cleanup, "grace_seconds", 60)
+    response = await async_client.post(
+        "/graphql", headers=auth_headers, json={"query": f"mutation {{ deleteBee(id: {bee['id']}) }}"}
+    )
+    assert response.json()["data"]["deleteBee"] is True
+    await image_cleanup.join()
+    assert os.path.exists(stored)
+
+    monkeypatch.setattr(image_cleanup, "grace_seconds", 0)
+    image_cleanup.enqueue([key])
+    await image_cleanup.join()
+    assert not os.path.exists(stored)
+
+
+async def test_cleanup_keeps_images_stored_again_during_the_check(app_with_test_db: dict, async_client: AsyncClient, auth_headers: dict, upload_dir: str, monkeypatch):
+    bee = (await upload_bee_image(async_client, auth_headers, os.urandom(1024))).json()["data"]["addBee"]
+    key = bee["imagePath"].removeprefix("images/")
+    stored = os.path.join(upload_dir, key)
+    async with TestingSessionLocal() as db:
+        await db.execute(update(Bee).values(image_path=None))
+        await db.commit()
+
+    # An identical upload lands while the references are being checked
+    from app import cleanup
+    referenced = cleanup.referenced_image_paths
+
+    async def upload_during_check(db, paths):
+        result = await referenced(db, paths)
+        os.utime(stored, (os.path.getmtime(stored) + 5,) * 2)
+        return result
+
+    monkeypatch.setattr(cleanup, "referenced_image_paths", upload_during_check)
+    image_cleanup.enqueue([key])
+    await image_cleanup.join()
+    assert os.path.exists(stored)
+
+
+async def test_upload_stores_blob_removed_during_deduplication(tmp_path, monkeypatch):
+    from app import storage
+
+    destination = str(tmp_path / "blob")
+    temp_path = str(tmp_path / "upload.tmp")
+    for path, content in ((destination, b"old"), (temp_path, b"new")):
+        with open(path, "wb") as file:
+            file.write(content)
+
+    def removed_meanwhile(path, *args, **kwargs):
+        os.remove(path)
+        raise FileNotFoundError(path)
+
+    monkeypatch.setattr(storage.os, "utime", removed_meanwhile)
+    assert storage._place(temp_path, destination) is True
+    with open(destination, "rb") as file:
+        assert file.read() == b"new"
+    assert not os.path.exists(temp_path)
+
+
+async def test_failed_image_removal_is_retried(app_with_test_db: dict, async_client: AsyncClient, auth_headers: dict, upload_dir: str, monkeypatch):
+    bee = (await upload_bee_image(async_client, auth_headers, os.urandom(1024))).json()["data"]["addBee"]
+    stored = os.path.join(upload_dir, bee["imagePath"].removeprefix("images/"))
+
+    delete = image_cleanup.storage.delete
+    attempts = []
+
+    async def flaky_delete(key: str):
+        attempts.append(key)
+        if len(attempts) < 3:
+            raise OSError("Storage unavailable")
+        await delete(key)
+
+    monkeypatch.setattr(image_cleanup.storage, "delete", flaky_delete)
+    monkeypatch.setattr(image_cleanup, "retry_seconds", 0.01)
+    response = await async_client.post(
+        "/graphql", headers=auth_headers, json={"query": f"mutation {{ deleteBee(id: {bee['id']}) }}"}
+    )
+    assert response.json()["data"]["deleteBee"] is True
+
+    await image_cleanup.join()
+    assert len(attempts) == 3
+    assert not os.path.exists(stored)
+
+
+async def test_sweep_orphaned_images(app_with_test_db: dict, async_client: AsyncClient, auth_headers: dict, upload_dir: str, db_session):
+    bee = (await upload_bee_image(async_client, auth_headers, os.urandom(1024))).json()["data"]["addBee"]
+    referenced = os.path.join(upload_dir, bee["imagePath"].removeprefix("images/"))
+    orphan = os.path.join(upload_dir, "ab", "cd", "orphan.jpg")
+    os.makedirs(os.path.dirname(orphan))
+    with open(orphan, "wb") as orphan_file:
+        orphan_file.write(b"left behind")
+
+    # Fresh blobs are within the grace period and may belong to a pending bee
+    assert await sweep_orphaned_images(db_session, grace_seconds=60) == 0
+
+    assert await sweep_orphaned_images(db_session, grace_seconds=0, chunk_size=1) == 1
+    await image_cleanup.join()
+    assert not os.path.exists(orphan)
+    assert os.path.exists(referenced)
+
+
+async def test_reconcile_images_cli(app_with_test_db: dict, async_client: AsyncClient, auth_headers: dict, upload_dir: str, db_session, monkeypatch, capsys):
+    kept = (await upload_bee_image(async_client, auth_headers, os.urandom(1024))).json()["data"]["addBee"]
+    lost = (await upload_bee_image(async_client, auth_headers, os.urandom(1024))).json()["data"]["addBee"]
+    os.remove(os.path.join(upload_dir, lost["imagePath"].removeprefix("images/")))
+    orphan = os.path.join(upload_dir, "ab", "cd", "orphan.jpg")
+    os.makedirs(os.path.dirname(orphan))
+    with open(orphan, "wb") as orphan_file:
+        orphan_file.write(b"left behind")
+    monkeypatch.setattr(cli, "async_session", TestingSessionLocal)
+
+    async def reconcile(*options: str) -> int:
+        return await cli.run_reconcile_images(
+            cli.build_parser().parse_args(["reconcile-images", "--grace-seconds", "0", *options])
+        )
+
+    # Reporting leaves everything in place
+    assert await reconcile() == 1
+    output = capsys.readouterr().out.splitlines()
+    assert output == ["orphaned images/ab/cd/orphan.jpg 11", f"missing {lost['imagePath']}"]
+    assert os.path.exists(orphan)
+
+    assert await reconcile("--delete", "--chunk-size", "1") == 1
+    assert capsys.readouterr().out.splitlines()[0] == "removed images/ab/cd/orphan.jpg 11"
+    assert not os.path.exists(orphan)
+    assert os.path.exists(os.path.join(upload_dir, kept["imagePath"].removeprefix("images/")))
+
+
+async def test_add_bee_rejects_oversized_image(app_with_test_db: dict, async_client: AsyncClient, auth_headers: dict, upload_dir: str, monkeypatch):
+    monkeypatch.setattr(settings, "MAX_UPLOAD_SIZE", 1024)
+    response = await upload_bee_image(async_client, auth_headers, b"x" * 4096)
+
+    json_response = response.json()
+    assert "errors" in json_response
+    assert "maximum size" in json_response["errors"][0]["message"]
+    assert os.listdir(upload_dir) == []
+
+
+async def test_bee_thumbnail(app_with_test_db: dict, async_client: AsyncClient, auth_headers: dict, upload_dir: str, tmp_path, monkeypatch):
+    monkeypatch.setattr(variant_cache, "root", str(tmp_path / "variants"))
+    monkeypatch.setattr(variant_cache, "_entries", None)
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (600, 400), "yellow").save(buffer, format="PNG")
+    bee = (await upload_bee_image(async_client, auth_headers, buffer.getvalue(), "bee.png")).json()["data"]["addBee"]
+
+    response = await async_client.post(
+        "/graphql",
+        headers=auth_headers,
+        json={"query": f"query {{ bee(id: {bee['id']}) {{ thumbnail(width: 100) }} }}"},
+    )
+    thumbnail_url = response.json()["data"]["bee"]["thumbnail"]
+    assert thumbnail_url.startswith("/image-variants/128/")
+
+    # The variant is rendered on first request and served from disk afterwards
+    for _ in range(2):
+        response = await async_client.get(thumbnail_url)
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "image/jpeg"
+        with Image.open(io.BytesIO(response.content)) as thumbnail:
+            assert thumbnail.size == (128, 85)
+
+    # Unknown widths and keys outside the store are refused
+    assert (await async_client.get(thumbnail_url.replace("/128/", "/100/"))).status_code == 404
+    assert (await async_client.get("/image-variants/128/../../etc/passwd")).status_code == 404
+
+
+async def test_truncated_image_variant(upload_dir: str, tmp_path, monkeypatch, async_client: AsyncClient):
+    monkeypatch.setattr(variant_cache, "root", str(tmp_path / "variants"))
+    monkeypatch.setattr(variant_cache, "_entries", None)
+
+    buffer = io.BytesIO()
+    Image.effect_noise((400, 300), 64).convert("RGB").save(buffer, format="JPEG")
+    key = "ab/cd/truncated.jpg"
+    os.makedirs(os.path.join(upload_dir, "ab", "cd"))
+    with open(os.path.join(upload_dir, key), "wb") as image_file:
+        image_file.write(buffer.getvalue()[: len(buffer.getvalue()) // 2])
+
+    response = await async_client.get(f"/image-variants/128/{key}")
+    assert response.status_code == 422
+    assert response.json() == {"detail": "Image cannot be decoded"}
+
+
+async def get_bee_image(async_client: AsyncClient, auth_headers: dict, bee_id: int) -> dict:
+    response = await async_client.post(
+        "/graphql",
+        headers=auth_headers,
+        json={"query": f"query {{ bee(id: {bee_id}) {{ imagePath imageStatus }} }}"},
+    )
+    return response.json()["data"]["bee"]
+
+
+async def test_uploaded_image_is_processed_in_background(app_with_test_db: dict, async_client: AsyncClient, auth_headers: dict, upload_dir: str, job_worker):
+    # A portrait photo stored sideways, with its orientation and a camera
+    # model in EXIF
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    exif[0x0110] = "Field Camera"
+    buffer = io.BytesIO()
+    Image.new("RGB", (60, 40), "yellow").save(buffer, format="JPEG", exif=exif)
+
+    # The mutation returns before any processing happens
+    bee = (await upload_bee_image(async_client, auth_headers, buffer.getvalue())).json()["data"]["addBee"]
+    upload = bee["imagePath"]
+    assert (await get_bee_image(async_client, auth_headers, bee["id"]))["imageStatus"] == "PENDING"
+
+    job_worker.start()
+    await job_worker.join()
+    await image_cleanup.join()
+
+    processed = await get_bee_image(async_client, auth_headers, bee["id"])
+    assert processed["imageStatus"] == "READY"
+    assert processed["imagePath"] != upload
+    with Image.open(os.path.join(upload_dir, processed["imagePath"].removeprefix("images/"))) as image:
+        assert image.format == "JPEG"
+        assert image.size == (40, 60)
+        assert not image.getexif()
+    # The original upload is no longer referenced and is removed
+    assert not os.path.exists(os.path.join(upload_dir, upload.removeprefix("images/")))
+
+
+async def test_invalid_image_fails_processing(app_with_test_db: dict, async_client: AsyncClient, auth_headers: dict, upload_dir: str, job_worker):
+    bee = (await upload_bee_image(async_client, auth_headers, os.urandom(1024))).json()["data"]["addBee"]
+
+    job_worker.start()
+    await job_worker.join()
+
+    # Not retried, and the upload is kept as it was
+    failed = await get_bee_image(async_client, auth_headers, bee["id"])
+    assert failed == {"imagePath": bee["imagePath"], "imageStatus": "FAILED"}
+    assert os.path.exists(os.path.join(upload_dir, bee["imagePath"].removeprefix("images/")))
+
+
+async def test_similar_bees(app_with_test_db: dict, async_client: AsyncClient, auth_headers: dict, upload_dir: str, job_worker, monkeypatch):
+    monkeypatch.setattr(similarity_index, "session_factory", TestingSessionLocal)
+    original = picture(1)
+    edited = original.crop((4, 3, 196, 147)).resize((160, 120))
+    uploads = []
+    for image, quality in ((original, 90), (edited, 40), (picture(2), 90)):
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=quality)
+        uploads.append(buffer.getvalue())
+    first, copy, other = [
+        (await upload_bee_image(async_client, auth_headers, content)).json()["data"]["addBee"]["id"]
+        for content in uploads
+    ]
+    job_worker.start()
+    await job_worker.join()
+
+    async def similar(bee_id: int, max_distance: int = 8):
+        response = await async_client.post(
+            "/graphql",
+            headers=auth_headers,
+            json={"query": f"query {{ similarBees(id: {bee_id}, maxDistance: {max_distance}) {{ bee {{ id }} distance }} }}"},
+        )
+        json_response = response.json()
+        assert "errors" not in json_response
+        return [(match["bee"]["id"], match["distance"]) for match in json_response["data"]["similarBees"]]
+
+    # The index is loaded from the database on first use
+    [(match, distance)] = await similar(first)
+    assert match == copy and distance <= 8
+    assert await similar(other) == []
+    response = await async_client.post(
+        "/graphql",
+        headers=auth_headers,
+        json={"query": f"query {{ similarBees(id: {first}, maxDistance: 64) {{ distance }} }}"},
+    )
+    assert response.json()["errors"][0]["message"] == "maxDistance must be between 0 and 16"
+
+    # Deleting a bee removes it from the index
+    response = await async_client.post(
+        "/graphql", headers=auth_headers, json={"query": f"mutation {{ deleteBee(id: {copy}) }}"}
+    )
+    assert response.json()["data"]["deleteBee"] is True
+    assert await similar(first) == []
+
+
+async def test_hash_images_cli(app_with_test_db: dict, async_client: AsyncClient, auth_headers: dict, upload_dir: str, db_session, monkeypatch, capsys):
+    buffer = io.BytesIO()
+    picture(1).save(buffer, format="PNG")
+    bee_id = (await upload_bee_image(async_client, auth_headers, buffer.getvalue(), "bee.png")).json()["data"]["addBee"]["id"]
+    # Stored before hashing existed
+    await db_session.execute(update(Bee).where(Bee.id == bee_id).values(image_status="ready"))
+    await db_session.commit()
+    monkeypatch.setattr(cli, "async_session", TestingSessionLocal)
+
+    assert await cli.run_hash_images(cli.build_parser().parse_args(["hash-images"])) == 0
+    assert "Hashed 1 images" in capsys.readouterr().out
+    db_session.expire_all()
+    bee = await db_session.get(Bee, bee_id)
+    assert bee.image_phash == perceptual_hash(picture(1))
+
+
+async def test_image_http_caching(app_with_test_db: dict, async_client: AsyncClient, auth_headers: dict, upload_dir: str):
+    content = os.urandom(4096)
+    bee = (await upload_bee_image(async_client, auth_headers, content)).json()["data"]["addBee"]
+    url = "/" + bee["imagePath"]
+    sha256 = hashlib.sha256(content).hexdigest()
+
+    response = await async_client.get(url)
+    assert response.status_code == 200
+    assert response.content == content
+    assert response.headers["etag"] == f'"{sha256}"'
+    assert "immutable" in response.headers["cache-control"]
+    last_modified = response.headers["last-modified"]
+
+    # Revalidation with either validator is answered without a body
+    response = await async_client.get(url, headers={"If-None-Match": f'W/"other", "{sha256}"'})
+    assert response.status_code == 304
+    assert response.content == b""
+    response = await async_client.get(url, headers={"If-Modified-Since": last_modified})
+    assert response.status_code == 304
+
+    # Byte ranges
+    response = await async_client.get(url, headers={"Range": "bytes=100-199"})
+    assert response.status_code == 206
+    assert response.content == content[100:200]
+    assert response.headers["content-range"] == "bytes 100-199/4096"
+
+    assert (await async_client.get("/images/ab/cd/missing.jpg")).status_code == 404
@@ -0,0 +1,97 @@
+import json
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import func, select
+
+from app import cli
+from app.models import Bee
+from tests.conftest import TestingSessionLocal
+
+pytestmark = pytest.mark.asyncio
+
+IMPORT_BEES = """
+mutation ($file: Upload!, $batchSize: Int) {
+    importBees(file: $file, batchSize: $batchSize) {
+        inserted
+        failed
+        errors {
+            batch
+            line
+            message
+        }
+    }
+}
+"""
+
+CSV_CONTENT = (
+    "name,origin,species,captured_date\n"
+    "Alpha,Meadow,Honey Bee,2024-05-01\n"
+    "Beta,Forest,Bumble Bee,2024-05-02\n"
+    "Broken,Forest,Bumble Bee,not-a-date\n"
+    "\"Gamma, the third\",Orchard,Mason Bee,2024-05-03\n"
+    ",Orchard,Mason Bee,2024-05-04\n"
+)
+
+
+async def test_import_bees_csv(app_with_test_db: dict, async_client: AsyncClient, auth_headers: dict, db_session):
+    response = await async_client.post(
+        "/graphql",
+        headers=auth_headers,
+        data={
+            "operations": json.dumps({"query": IMPORT_BEES, "variables": {"file": None, "batchSize": 2}}),
+            "map": json.dumps({"0": ["variables.file"]}),
+        },
+        files={"0": ("survey.csv", CSV_CONTENT.encode(), "text/csv")},
+    )
+
+    json_response = response.json()
+    assert "errors" not in json_response
+    result = json_response["data"]["importBees"]
+    assert result["inserted"] == 3
+    assert result["failed"] == 2
+    assert result["errors"] == [
+        {"batch": 2, "line": 4, "message": "Invalid captured_date: not-a-date"},
+        {"batch": 3, "line": 6, "message": "Missing name"},
+    ]
+
+    names = (await db_session.execute(select(Bee.name).order_by(Bee.id))).scalars().all()
+    assert names == ["Alpha", "Beta", "Gamma, the third"]
+
+
+async def test_import_bees_cli_ndjson(db_session, tmp_path, monkeypatch, capsys):
+    path = tmp_path / "survey.ndjson"
+    path.write_text(
+        json.dumps({"name": "Alpha", "origin": "Meadow", "species": "Honey Bee", "captured_date": "2024-05-01"}) + "\n"
+        "\n"
+        "{not json}\n"
+        + json.dumps({"name": "Beta", "origin": "Forest", "species": "Bumble Bee", "captured_date": "2024-05-02"}) + "\n"
+    )
+    monkeypatch.setattr(cli, "async_session", TestingSessionLocal)
+
+    exit_code = await cli.run_import_bees(cli.build_parser().parse_args(["import-bees", str(path)]))
+
+    assert exit_code == 1
+    assert "Imported 2 bees, 1 failed" in capsys.readouterr().out
+    count = (await db_session.execute(select(func.count()).select_from(Bee))).scalar_one()
+    assert count == 2
+
+
+async def test_import_bees_cli_invalidates_shared_cache(db_session, tmp_path, monkeypatch, capsys):
+    from app.cache import BEES_LIST, InMemoryCacheBackend, result_cache
+
+    path = tmp_path / "survey.csv"
+    path.write_text("name,origin,species,captured_date\nAlpha,Meadow,Honey Bee,2024-05-01\n")
+    monkeypatch.setattr(cli, "async_session", TestingSessionLocal)
+    args = cli.build_parser().parse_args(["import-bees", str(path)])
+
+    # Without a shared tier the API processes cannot see the bump
+    assert await cli.run_import_bees(args) == 0
+    assert "RESULT_CACHE_URL is not set" in capsys.readouterr().err
+
+    # With one, the bump reaches the versions every API process reads
+    monkeypatch.setattr(result_cache, "shared", InMemoryCacheBackend())
+    assert await result_cache.versions([BEES_LIST]) == [0]
+    assert await cli.run_import_bees(args) == 0
+    assert await result_cache.versions([BEES_LIST]) == [1]
+    assert capsys.readouterr().err == ""
@@ -0,0 +1,160 @@
+import asyncio
+
+import pytest
+from sqlalchemy import select
+
+from app.jobs import (JOB_TYPES, DatabaseJobQueue, LocalJobQueue,
+                      PermanentJobError, job_type)
+from app.models import Job
+from tests.conftest import TestingSessionLocal
+
+pytestmark = pytest.mark.asyncio
+
+
+@pytest.fixture
+def flaky_job(monkeypatch):
+    # Fails the given number of times per payload before succeeding
+    monkeypatch.setattr("app.jobs.JOB_TYPES", dict(JOB_TYPES))
+    calls = []
+    failed = []
+
+    async def fail(db, payload):
+        failed.append(payload["name"])
+
+    @job_type("flaky", fail=fail)
+    async def run(db, payload):
+        calls.append(payload["name"])
+        if payload.get("permanent"):
+            raise PermanentJobError("Cannot work")
+        if calls.count(payload["name"]) <= payload["failures"]:
+            raise RuntimeError("Try again")
+
+    return calls, failed
+
+
+async def test_local_job_queue_retries(flaky_job):
+    calls, failed = flaky_job
+    queue = LocalJobQueue(concurrency=2, max_attempts=3, retry_seconds=0.01, session_factory=TestingSessionLocal)
+    await queue.enqueue("flaky", {"name": "eventually", "failures": 2})
+    await queue.enqueue("flaky", {"name": "never", "failures": 5})
+    await queue.enqueue("flaky", {"name": "broken", "failures": 0, "permanent": True})
+
+    queue.start()
+    await queue.join()
+    await queue.stop()
+
+    assert calls.count("eventually") == 3
+    assert calls.count("never") == 3
+    assert calls.count("broken") == 1
+    assert sorted(failed) == ["broken", "never"]
+
+
+async def test_local_job_queue_drops_jobs_when_full(flaky_job):
+    calls, _ = flaky_job
+    queue = LocalJobQueue(concurrency=1, max_attempts=1, retry_seconds=0, session_factory=TestingSessionLocal, maxsize=1)
+    # Neither call waits for a worker to make room
+    await asyncio.wait_for(queue.enqueue("flaky", {"name": "kept", "failures": 0}), 1)
+    await asyncio.wait_for(queue.enqueue("flaky", {"name": "dropped", "failures": 0}), 1)
+
+    queue.start()
+    await queue.join()
+    await queue.stop()
+    assert calls == ["kept"]
+
+
+async def test_database_job_queue(db_session, flaky_job):
+    calls, failed = flaky_job
+    queue = DatabaseJobQueue(
+        concurrency=1,
+        max_attempts=2,
+        retry_seconds=0,
+        session_factory=TestingSessionLocal,
+        poll_seconds=0.01,
+        lease_seconds=60,
+    )
+    await queue.enqueue("flaky", {"name": "eventually", "failures": 1})
+    await queue.enqueue("flaky", {"name": "never", "failures": 5})
+
+    while await queue.run_next():
+        pass
+
+    assert calls == ["eventually", "never", "eventually", "never"]
+    assert failed == ["never"]
+    # Done jobs are deleted; jobs that failed for good are kept with their error
+    jobs = (await db_session.execute(select(Job))).scalars().all()
+    assert [(job.failed, job.attempts, job.last_error) for job in jobs] == [
+        (True, 2, "RuntimeError('Try again')")
+    ]
+
+
+async def test_database_job_leases(db_session, flaky_job):
+    queue = DatabaseJobQueue(
+        concurrency=1,
+        max_attempts=2,
+        retry_seconds=0,
+        session_factory=TestingSessionLocal,
+        poll_seconds=0.01,
+        lease_seconds=60,
+    )
+    await queue.enqueue("flaky", {"name": "claimed", "failures": 0})
+
+    # A claimed job is invisible to other workers until its lease expires
+    assert (await queue.claim())[1:] == ("flaky", {"name": "claimed", "failures": 0}, 1)
+    assert await queue.claim() is None
+
+
+async def test_image_job_commits_with_its_bee(db_session, monkeypatch):
+    from datetime import date
+
+    from app import image_processing
+    from app.crud import create_bee
+
+    queue = DatabaseJobQueue(
+        concurrency=1,
+        max_attempts=2,
+        retry_seconds=0,
+        session_factory=TestingSessionLocal,
+        poll_seconds=0.01,
+        lease_seconds=60,
+    )
+    monkeypatch.setattr(image_processing, "job_queue", queue)
+
+    # The job is written by the bee's own transaction, not a later one
+    async def no_enqueue(kind, payload):
+        raise AssertionError("Job queued after the commit")
+
+    monkeypatch.setattr(queue, "enqueue", no_enqueue)
+    bee = await create_bee(db_session, "Snapshot", "Orchard", "Honey Bee", date(2024, 5, 1), "images/ab/cd/abcd.jpg")
+
+    jobs = (await db_session.execute(select(Job))).scalars().all()
+    assert [(job.kind, job.payload) for job in jobs] == [("process_image", f'{{"bee_id": {bee.id}}}')]
+
+
+async def test_database_job_lease_is_renewed_while_running(db_session, monkeypatch):
+    monkeypatch.setattr("app.jobs.JOB_TYPES", dict(JOB_TYPES))
+    queue = DatabaseJobQueue(
+        concurrency=1,
+        max_attempts=2,
+        retry_seconds=0,
+        session_factory=TestingSessionLocal,
+        poll_seconds=0.01,
+        lease_seconds=0.3,
+    )
+    started = asyncio.Event()
+    finish = asyncio.Event()
+
+    @job_type("slow")
+    async def run(db, payload):
+        started.set()
+        await finish.wait()
+
+    await queue.enqueue("slow", {})
+    running = asyncio.create_task(queue.run_next())
+    await started.wait()
+
+    # Well past the first lease, no other worker can claim the job
+    await asyncio.sleep(0.7)
+    assert await queue.claim() is None
+    finish.set()
+    assert await running
+    assert (await db_session.execute(select(Job))).scalars().all() == []
@@ -0,0 +1,82 @@
+import json
+
+import pytest
+from httpx import AsyncClient
+
+from app.core.config import settings
+from app.persisted_queries import persisted_queries, query_hash
+
+pytestmark = pytest.mark.asyncio
+
+QUERY = "query Ping { __typename }"
+
+
+def persisted(sha256: str) -> dict:
+    return {"persistedQuery": {"version": 1, "sha256Hash": sha256}}
+
+
+async def test_register_and_run_persisted_query(async_client: AsyncClient):
+    sha256 = query_hash(QUERY)
+
+    # Unknown hash: the client is asked to send the query text
+    response = await async_client.post("/graphql", json={"extensions": persisted(sha256)})
+    assert response.status_code == 200
+    assert response.json()["errors"][0]["extensions"]["code"] == "PERSISTED_QUERY_NOT_FOUND"
+
+    # Hash and text together run the query and register it
+    response = await async_client.post(
+        "/graphql", json={"query": QUERY, "extensions": persisted(sha256)}
+    )
+    assert response.json() == {"data": {"__typename": "Query"}}
+
+    # From then on the hash alone is enough, also over GET
+    response = await async_client.post("/graphql", json={"extensions": persisted(sha256)})
+    assert response.json() == {"data": {"__typename": "Query"}}
+    response = await async_client.get(
+        "/graphql", params={"extensions": json.dumps(persisted(sha256))}
+    )
+    assert response.json() == {"data": {"__typename": "Query"}}
+
+
+async def test_persisted_query_hash_mismatch(async_client: AsyncClient):
+    response = await async_client.post(
+        "/graphql", json={"query": QUERY, "extensions": persisted("0" * 64)}
+    )
+    assert response.json()["errors"][0]["extensions"]["code"] == "PERSISTED_QUERY_HASH_MISMATCH"
+    assert persisted_queries.get("0" * 64) is None
+
+
+async def test_persisted_queries_allowlist(async_client: AsyncClient, monkeypatch):
+    sha256 = query_hash(QUERY)
+    monkeypatch.setattr(settings, "PERSISTED_QUERIES_ONLY", True)
+    monkeypatch.setattr(persisted_queries, "pinned", {sha256: QUERY})
+
+    response = await async_client.post("/graphql", json={"extensions": persisted(sha256)})
+    assert response.json() == {"data": {"__typename": "Query"}}
+
+    # Listed queries may also be sent in full
+    response = await async_client.post("/graphql", json={"query": QUERY})
+    assert response.json() == {"data": {"__typename": "Query"}}
+
+    # Anything else is rejected, and cannot be registered
+    other = "query Other { __typename }"
+    for payload in (
+        {"query": other},
+        {"query": other, "extensions": persisted(query_hash(other))},
+    ):
+        response = await async_client.post("/graphql", json=payload)
+        assert response.json()["errors"][0]["extensions"]["code"] == "PERSISTED_QUERY_NOT_IN_LIST"
+    assert persisted_queries.get(query_hash(other)) is None
+
+
+async def test_repeated_query_is_parsed_once(async_client: AsyncClient):
+    from app.extensions import _parse_document, _validate_document
+
+    _parse_document.cache_clear()
+    _validate_document.cache_clear()
+    for _ in range(3):
+        response = await async_client.post("/graphql", json={"query": QUERY})
+        assert response.json() == {"data": {"__typename": "Query"}}
+
+    assert _parse_document.cache_info().misses == 1
+    assert _validate_document.cache_info().misses == 1
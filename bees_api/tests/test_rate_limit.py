@@ -0,0 +1,107 @@
+import pytest
+from httpx import AsyncClient
+
+from app.core.config import settings
+from app.rate_limit import InMemoryRateLimitStore, Limit, RedisRateLimitStore
+
+pytestmark = pytest.mark.asyncio
+
+LOGIN = 'mutation { login(username: "nobody", password: "wrong") { accessToken } }'
+
+
+async def test_login_is_limited_per_client(app_with_test_db: dict, async_client: AsyncClient, monkeypatch):
+    monkeypatch.setitem(settings.RATE_LIMIT_OPERATIONS, "login", 2)
+
+    for _ in range(2):
+        response = await async_client.post("/graphql", json={"query": LOGIN})
+        assert response.status_code == 200
+        assert response.json()["errors"][0]["message"] == "Incorrect username or password"
+
+    response = await async_client.post("/graphql", json={"query": LOGIN})
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+    assert response.json()["errors"][0]["extensions"]["code"] == "RATE_LIMITED"
+
+    # Other operations from the same client are unaffected
+    response = await async_client.post("/graphql", json={"query": "{ __typename }"})
+    assert response.status_code == 200
+
+
+async def test_aliased_fields_are_each_charged(app_with_test_db: dict, async_client: AsyncClient, monkeypatch):
+    monkeypatch.setitem(settings.RATE_LIMIT_OPERATIONS, "register", 1)
+    aliases = " ".join(
+        f'u{i}: register(username: "user{i}", email: "user{i}@example.com", password: "password123") {{ id }}'
+        for i in range(5)
+    )
+
+    response = await async_client.post("/graphql", json={"query": f"mutation {{ {aliases} }}"})
+    assert response.status_code == 429
+    assert response.json()["errors"][0]["extensions"]["code"] == "RATE_LIMITED"
+    assert response.json()["data"] is None
+
+
+async def test_requests_are_limited_per_ip_and_user(app_with_test_db: dict, async_client: AsyncClient, auth_headers: dict, monkeypatch):
+    monkeypatch.setattr(settings, "RATE_LIMIT_USER_BURST", 1)
+
+    query = {"query": "{ me { username } }"}
+    response = await async_client.post("/graphql", headers=auth_headers, json=query)
+    assert response.status_code == 200
+    response = await async_client.post("/graphql", headers=auth_headers, json=query)
+    assert response.status_code == 429
+    assert response.json() == {"detail": "Too many requests"}
+    assert "Retry-After" in response.headers
+
+    # Anonymous requests from the same address draw on the IP bucket only
+    assert (await async_client.get("/")).status_code == 200
+
+    monkeypatch.setattr(settings, "RATE_LIMIT_IP_BURST", 1)
+    assert (await async_client.get("/")).status_code == 200
+    assert (await async_client.get("/")).status_code == 429
+
+
+async def test_token_bucket_refills(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("app.rate_limit.time.monotonic", lambda: now[0])
+    store = InMemoryRateLimitStore(max_keys=10)
+    limit = Limit(per_minute=60, burst=2)
+
+    assert await store.take("client", limit) == 0
+    assert await store.take("client", limit) == 0
+    assert await store.take("client", limit) == pytest.approx(1)
+
+    now[0] += 1
+    assert await store.take("client", limit) == 0
+
+
+@pytest.fixture(params=["memory", "redis"])
+def store(request, monkeypatch):
+    if request.param == "memory":
+        return InMemoryRateLimitStore(max_keys=10)
+    # Runs the real Lua script, on an in-process server
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    monkeypatch.setattr("redis.asyncio.from_url", fakeredis.FakeAsyncRedis.from_url)
+    return RedisRateLimitStore("redis://localhost:6379/0")
+
+
+async def test_buckets_are_charged_all_or_nothing(store):
+    ip, user = Limit(per_minute=60, burst=3), Limit(per_minute=6, burst=1)
+
+    assert await store.take_all([("ip", ip, 1), ("user", user, 1)]) == 0
+    # The empty user bucket rejects the request and the IP bucket keeps its tokens
+    assert await store.take_all([("ip", ip, 1), ("user", user, 1)]) == pytest.approx(10, abs=0.1)
+    assert await store.take("ip", ip) == 0
+    assert await store.take("ip", ip) == 0
+    assert await store.take("ip", ip) > 0
+
+    # The longest wait among the empty buckets is reported
+    assert await store.take_all([("ip", ip, 1), ("user", user, 1)]) == pytest.approx(10, abs=0.1)
+
+
+async def test_hits_on_one_key_are_added_up(store):
+    limit = Limit(per_minute=60, burst=3)
+
+    assert await store.take_all([("field", limit, 1)] * 4) == pytest.approx(1, abs=0.1)
+    assert await store.take_all([("field", limit, 1)] * 2) == 0
+    assert await store.take("field", limit) == 0
+    assert await store.take("field", limit) > 0
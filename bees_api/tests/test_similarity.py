@@ -0,0 +1,54 @@
+import io
+import random
+
+from PIL import Image, ImageDraw
+
+from app.similarity import BKTree, hamming_distance, perceptual_hash
+
+
+def picture(seed: int) -> Image.Image:
+    generator = random.Random(seed)
+    image = Image.new("RGB", (200, 150), "white")
+    draw = ImageDraw.Draw(image)
+    for _ in range(12):
+        x, y = generator.randint(0, 180), generator.randint(0, 130)
+        size = (generator.randint(10, 60), generator.randint(10, 60))
+        color = tuple(generator.randint(0, 255) for _ in range(3))
+        draw.ellipse((x, y, x + size[0], y + size[1]), fill=color)
+    return image
+
+
+def test_perceptual_hash_survives_light_edits():
+    original = picture(1)
+    buffer = io.BytesIO()
+    original.crop((4, 3, 196, 147)).resize((160, 120)).save(buffer, format="JPEG", quality=40)
+    edited = Image.open(buffer)
+
+    distance = lambda a, b: hamming_distance(int(perceptual_hash(a), 16), int(perceptual_hash(b), 16))
+    assert len(perceptual_hash(original)) == 16
+    assert distance(original, edited) <= 8
+    assert distance(original, picture(2)) > 16
+
+
+def test_bk_tree_matches_linear_scan():
+    generator = random.Random(7)
+    # Clusters of nearby hashes, as near-duplicate photos produce
+    centers = [generator.getrandbits(64) for _ in range(50)]
+    hashes = {
+        item: centers[item % 50] ^ sum(1 << generator.randrange(64) for _ in range(generator.randrange(6)))
+        for item in range(2000)
+    }
+    tree = BKTree()
+    for item, value in hashes.items():
+        tree.add(value, item)
+    for item in range(0, 2000, 3):
+        tree.discard(hashes.pop(item), item)
+
+    for query in centers[:10] + [generator.getrandbits(64)]:
+        for max_distance in (0, 4, 10):
+            expected = {
+                (item, hamming_distance(query, value))
+                for item, value in hashes.items()
+                if hamming_distance(query, value) <= max_distance
+            }
+            assert set(tree.search(query, max_distance)) == expected
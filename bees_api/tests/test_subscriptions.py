@@ -0,0 +1,72 @@
+import asyncio
+from datetime import date
+
+import pytest
+from fastapi.requests import HTTPConnection
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.security import RequestAuth, create_access_token
+from app.crud import create_bee, delete_bee, get_user_by_username
+from app.events import BEE_ADDED, BEE_DELETED, event_bus
+from app.models import User
+from app.schema import schema
+
+pytestmark = pytest.mark.asyncio
+
+
+def websocket_context(db: AsyncSession, user: User) -> dict:
+    # What the router builds for a WebSocket whose connection_init payload
+    # carried the token
+    connection = HTTPConnection(
+        {"type": "websocket", "headers": [], "client": ("127.0.0.1", 1234), "path": "/graphql"}
+    )
+    return {
+        "request": connection,
+        "db": db,
+        "read_db": db,
+        "auth": RequestAuth(connection, db, get_user_by_username),
+        "connection_params": {"Authorization": f"Bearer {create_access_token({'sub': user.username})}"},
+    }
+
+
+async def subscribe(query: str, context: dict, topic: str) -> asyncio.Future:
+    # schema.subscribe only returns once the first event arrives, so start it
+    # in the background and wait until it is listening
+    subscription = asyncio.ensure_future(schema.subscribe(query, context_value=context))
+    while not event_bus.subscriber_count(topic) and not subscription.done():
+        await asyncio.sleep(0.01)
+    return subscription
+
+
+async def test_bee_added_and_deleted(db_session: AsyncSession, test_user: User):
+    added = await subscribe(
+        'subscription { beeAdded(species: "Honey Bee") { name species } }',
+        websocket_context(db_session, test_user),
+        BEE_ADDED,
+    )
+    deleted = await subscribe(
+        "subscription { beeDeleted }", websocket_context(db_session, test_user), BEE_DELETED
+    )
+
+    # Only bees matching the subscription's filter are pushed
+    await create_bee(db_session, "Bumble", "Meadow", "Bumblebee", date(2024, 5, 1))
+    bee = await create_bee(db_session, "Buzzy", "Meadow", "Honey Bee", date(2024, 5, 1))
+    added = await asyncio.wait_for(added, 5)
+    result = await added.__anext__()
+    assert result.errors is None
+    assert result.data == {"beeAdded": {"name": "Buzzy", "species": "Honey Bee"}}
+
+    await delete_bee(db_session, bee.id)
+    deleted = await asyncio.wait_for(deleted, 5)
+    result = await deleted.__anext__()
+    assert result.data == {"beeDeleted": bee.id}
+
+    await added.aclose()
+    await deleted.aclose()
+
+
+async def test_subscriptions_require_a_token(db_session: AsyncSession, test_user: User):
+    context = websocket_context(db_session, test_user)
+    del context["connection_params"]
+    result = await schema.subscribe("subscription { beeDeleted }", context_value=context)
+    assert "Could not validate credentials" in result.errors[0].message